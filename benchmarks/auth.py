@@ -0,0 +1,76 @@
+"""
+Benchmark per-request authentication overhead for each scheme.
+
+For every scheme a GET /api/tasks/{id}/ request is built and passed through
+the authentication class alone, so the numbers show what authentication
+adds to each request.
+
+Usage:
+    python -m benchmarks.auth [--requests 2000]
+"""
+import argparse
+import base64
+import statistics
+import time
+
+from .common import setup_django, temporary_database
+
+
+def measure(authenticator, make_request, count):
+    """
+    Return per-call latencies in microseconds.
+    """
+    samples = []
+    for _ in range(count):
+        request = make_request()
+        start = time.perf_counter()
+        result = authenticator.authenticate(request)
+        samples.append((time.perf_counter() - start) * 1e6)
+        assert result is not None
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument(
+        '--basic-requests', type=int, default=20,
+        help='BasicAuthentication hashes the password each time, so fewer runs are enough',
+    )
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+    from rest_framework.authtoken.models import Token
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+
+    from tasks.authentication import CachedTokenAuthentication, token_cache
+
+    factory = APIRequestFactory()
+
+    with temporary_database():
+        user = User.objects.create_user(username='bench', password='bench-password-123')
+        key = Token.objects.create(user=user).key
+        basic = 'Basic ' + base64.b64encode(b'bench:bench-password-123').decode()
+
+        def request_with(header):
+            return lambda: Request(factory.get('/api/tasks/1/', HTTP_AUTHORIZATION=header))
+
+        token_cache.clear()
+        schemes = [
+            ('BasicAuthentication', BasicAuthentication(), request_with(basic), args.basic_requests),
+            ('TokenAuthentication', TokenAuthentication(), request_with(f'Token {key}'), args.requests),
+            ('CachedTokenAuthentication', CachedTokenAuthentication(), request_with(f'Token {key}'), args.requests),
+        ]
+
+        print(f'{"scheme":<28} {"median us":>10} {"p99 us":>10} {"requests":>9}')
+        for name, authenticator, make_request, count in schemes:
+            samples = sorted(measure(authenticator, make_request, count))
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+            print(f'{name:<28} {statistics.median(samples):>10.1f} {p99:>10.1f} {count:>9}')
+
+
+if __name__ == '__main__':
+    main()
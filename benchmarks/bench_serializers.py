@@ -0,0 +1,139 @@
+"""
+Benchmark the task and person serializers: turning 1, 100 and 10,000
+objects into data, with and without their related objects, and validating
+as many payloads.
+
+Usage (see benchmarks/conftest.py):
+    python -m pytest benchmarks/bench_serializers.py -q
+
+Objects are loaded before timing (assignees with select_related, tasks with
+prefetch_related), so the serialization numbers are serializer time only.
+Validation runs the queries it makes in the API: the assignee lookup of
+TaskSerializer, the UniqueValidator `exists()` query of PersonSerializer and
+the person cache lookup of ProfileUpdateSerializer.
+"""
+import pytest
+from django.db.models import Prefetch
+
+from tasks.cache import person_cache
+from tasks.models import Person, Task
+from tasks.serializers import (
+    PersonSerializer, PersonWithTasksSerializer, ProfileUpdateSerializer, TaskListSerializer, TaskSerializer,
+)
+
+SIZES = (1, 100, 10000)
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(scope='module')
+def data(django_db_setup, django_db_blocker):
+    """
+    `SIZES[-1]` persons, each assigned one task, and as many unassigned tasks.
+    """
+    count = SIZES[-1]
+    with django_db_blocker.unblock():
+        persons = Person.objects.bulk_create([
+            Person(name=f'Person {i}', email=f'person{i}@example.com', phone='555-0100', department=f'Dept {i % 10}')
+            for i in range(count)
+        ])
+        Task.objects.bulk_create([
+            Task(
+                title=f'Task {i}',
+                description='Generated for the serializer benchmark',
+                status=('pending', 'in_progress', 'completed')[i % 3],
+                completed=i % 3 == 2,
+                priority=i % 5,
+                assigned_to=persons[i] if i < count else None,
+            )
+            for i in range(2 * count)
+        ])
+        yield
+        Task.all_objects.all().delete()
+        Person.all_objects.all().delete()
+
+
+def tasks(size, related):
+    if related:
+        return list(Task.objects.filter(assigned_to__isnull=False).select_related('assigned_to').order_by('id')[:size])
+    return list(Task.objects.filter(assigned_to__isnull=True).order_by('id')[:size])
+
+
+def persons(size, related):
+    # Without related data every person's task list is empty, without a query
+    assigned_tasks = Task.objects.order_by('id') if related else Task.objects.none()
+    return list(Person.objects.prefetch_related(Prefetch('assigned_tasks', queryset=assigned_tasks)).order_by('id')[:size])
+
+
+def task_payloads(size, related):
+    assignees = list(Person.objects.order_by('id').values_list('id', flat=True)[:size]) if related else []
+    return [
+        dict(
+            {'title': f'New task {i}', 'description': 'Validated', 'status': 'pending', 'priority': i % 5},
+            **({'assigned_to': assignees[i]} if related else {}),
+        )
+        for i in range(size)
+    ]
+
+
+@pytest.mark.parametrize('related', [False, True], ids=['plain', 'related'])
+@pytest.mark.parametrize('size', SIZES)
+def test_task_serializer(data, bench, size, related):
+    objects = tasks(size, related)
+    bench(lambda: TaskSerializer(objects, many=True).data)
+
+
+@pytest.mark.parametrize('related', [False, True], ids=['plain', 'related'])
+@pytest.mark.parametrize('size', SIZES)
+def test_task_list_serializer(data, bench, size, related):
+    objects = tasks(size, related)
+    bench(lambda: TaskListSerializer(objects, many=True).data)
+
+
+@pytest.mark.parametrize('related', [False, True], ids=['plain', 'related'])
+@pytest.mark.parametrize('size', SIZES)
+def test_person_with_tasks_serializer(data, bench, size, related):
+    objects = persons(size, related)
+    bench(lambda: PersonWithTasksSerializer(objects, many=True).data)
+
+
+@pytest.mark.parametrize('related', [False, True], ids=['plain', 'related'])
+@pytest.mark.parametrize('size', SIZES)
+def test_task_serializer_validation(data, bench, size, related):
+    payloads = task_payloads(size, related)
+
+    def validate():
+        serializer = TaskSerializer(data=payloads, many=True)
+        assert serializer.is_valid(), serializer.errors
+
+    bench(validate)
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_person_serializer_validation(data, bench, size):
+    payloads = [{'name': f'New Person {i}', 'email': f'new{i}@example.com'} for i in range(size)]
+
+    def validate():
+        for payload in payloads:
+            serializer = PersonSerializer(data=payload)
+            assert serializer.is_valid(), serializer.errors
+
+    bench(validate)
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_profile_update_validation(data, bench, size):
+    objects = list(Person.objects.order_by('id')[:size])
+    payloads = [
+        {'name': f'Renamed {i}', 'email': f'renamed{i}@example.com', 'confirm_email': f'renamed{i}@example.com'}
+        for i in range(size)
+    ]
+    # The email lookups are cached; time them warm, as in a running server
+    person_cache.clear()
+
+    def validate():
+        for person, payload in zip(objects, payloads):
+            serializer = ProfileUpdateSerializer(person, data=payload, partial=True)
+            assert serializer.is_valid(), serializer.errors
+
+    bench(validate)
@@ -0,0 +1,62 @@
+"""
+Benchmark the import_data/export_data pipeline with different worker counts.
+
+Usage:
+    python -m benchmarks.bulk_io [--rows 200000] [--workers 1 2 4 8]
+
+Speedup is reported relative to the single-process run; expect it to level
+off at the number of CPU cores.
+"""
+import argparse
+import json
+import os
+
+from .common import setup_django, temporary_database, timer
+
+
+def write_sample_file(path, rows):
+    with open(path, 'w') as f:
+        for i in range(rows):
+            f.write(json.dumps({
+                'title': f'Task {i}',
+                'description': 'Generated for the bulk import benchmark ' * 3,
+                'status': ('pending', 'in_progress', 'completed', 'cancelled')[i % 4],
+                'priority': i % 5,
+                'due_date': '2030-01-%02d' % (i % 28 + 1),
+                'completed': i % 4 == 2,
+            }) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    setup_django()
+    from tasks.bulk_io import export_file, import_file
+    from tasks.models import Task
+
+    print(f'{args.rows} rows, {os.cpu_count()} CPU(s)')
+    print(f'{"workers":>8} {"import s":>10} {"speedup":>8} {"export s":>10} {"speedup":>8}')
+    with temporary_database() as tmp_dir:
+        source = os.path.join(tmp_dir, 'source.jsonl')
+        write_sample_file(source, args.rows)
+
+        baseline = {}
+        for workers in sorted(set(args.workers)):
+            results = {}
+            Task.objects.all().delete()
+            with timer(results, 'import'):
+                import_file(source, 'task', workers=workers, batch_size=2000)
+            with timer(results, 'export'):
+                export_file(os.path.join(tmp_dir, 'export.jsonl'), 'task', workers=workers)
+            baseline = baseline or results
+            print(
+                f'{workers:>8} {results["import"]:>10.2f} {baseline["import"] / results["import"]:>8.2f}'
+                f' {results["export"]:>10.2f} {baseline["export"] / results["export"]:>8.2f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
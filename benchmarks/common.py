@@ -0,0 +1,50 @@
+"""
+Shared helpers for the benchmark scripts in this folder.
+
+Run the benchmarks from the project root as modules, for example:
+    python -m benchmarks.bulk_io
+"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup_django(settings_module='taskmanager.settings'):
+    """
+    Configure Django so that models can be imported.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+@contextmanager
+def temporary_database():
+    """
+    Create a migrated, file-backed SQLite database for the duration of the block.
+
+    A file (rather than the in-memory test database) is used so that worker
+    processes can see the same data.
+    """
+    from django.db import connection
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        connection.settings_dict.setdefault('TEST', {})
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tmp_dir, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            yield tmp_dir
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def timer(results, key):
+    """
+    Store the wall-clock time of the block, in seconds, in `results[key]`.
+    """
+    start = time.perf_counter()
+    yield
+    results[key] = time.perf_counter() - start
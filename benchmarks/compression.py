@@ -0,0 +1,93 @@
+"""
+Benchmark response sizes and compression CPU time per endpoint.
+
+Usage:
+    python -m benchmarks.compression [--tasks 200] [--repeat 50]
+
+Each endpoint's body is fetched once with the default JSON output and once
+in compact mode (?compact=1), then compressed with every encoding available
+here (gzip always; br and zstd when brotli and zstandard are installed) at
+the levels from the COMPRESSION setting. The table shows the bytes sent and
+the median milliseconds spent compressing one response.
+"""
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+from .common import setup_django, temporary_database
+
+
+def median_ms(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tasks', type=int, default=200)
+    parser.add_argument('--persons', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import Client
+
+    from tasks.compression import available_encoders, get_options
+    from tasks.models import Person, Task
+
+    levels = get_options()['LEVELS']
+    encoders = [encoder_class(levels[encoder_class.name]) for encoder_class in available_encoders()]
+
+    with temporary_database():
+        persons = Person.objects.bulk_create([
+            Person(name=f'Person {i}', email=f'person{i}@example.com', department=f'Dept {i % 3}')
+            for i in range(args.persons)
+        ])
+        today = date.today()
+        Task.objects.bulk_create([
+            Task(
+                title=f'Task {i}',
+                description='Generated for the compression benchmark',
+                priority=i % 5,
+                due_date=today + timedelta(days=i % 30) if i % 4 else None,
+                completed=i % 3 == 0,
+                # Every other task unassigned, so compact mode has nulls to drop
+                assigned_to=persons[i % len(persons)] if i % 2 else None,
+            )
+            for i in range(args.tasks)
+        ])
+
+        endpoints = [
+            ('/api/tasks/', 'task list'),
+            (f'/api/persons/{persons[1].pk}/', 'person detail'),
+            ('/api/persons/workload/', 'workload'),
+            ('/swagger.json', 'schema'),
+        ]
+        client = Client(HTTP_HOST='localhost')
+
+        print(f'{args.tasks} tasks; '
+              f'encodings: {", ".join(encoder.name for encoder in encoders)}')
+        header = f'{"endpoint":<16} {"mode":<8} {"identity":>10}'
+        for encoder in encoders:
+            header += f' {encoder.name:>10} {encoder.name + " ms":>10}'
+        print(header)
+        for url, name in endpoints:
+            for mode, params in (('default', {}), ('compact', {'compact': '1'})):
+                if url.startswith('/swagger') and params:
+                    continue  # the schema has no compact mode
+                body = client.get(url, params, HTTP_ACCEPT_ENCODING='identity').content
+                row = f'{name:<16} {mode:<8} {len(body):>10}'
+                for encoder in encoders:
+                    size = len(encoder.compress(body))
+                    ms = median_ms(lambda: encoder.compress(body), args.repeat)
+                    row += f' {size:>10} {ms:>10.3f}'
+                print(row)
+
+
+if __name__ == '__main__':
+    main()
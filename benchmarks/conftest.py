@@ -0,0 +1,241 @@
+"""
+pytest support for the benchmark suites in this folder (`bench_*.py`).
+
+Run them with the project's pytest and pytest-django:
+
+    python -m pytest benchmarks -q
+    python -m pytest benchmarks -q -k "not 10000"       # skip the big sizes
+    python -m pytest benchmarks -q --bench-fail         # exit 1 on a regression
+    python -m pytest benchmarks -q --bench-save-baseline
+
+A benchmark takes the `bench` fixture and calls `bench(func)`: `func` runs
+once to warm up, then in `--bench-runs` (10) runs, each of as many rounds
+as spread the runs over about five seconds (at least 3 runs and 1 round
+per run for slow benchmarks). Each run also times a fixed workload, to
+tell how fast the machine is. Timings are CPU time of the process, so
+other processes sharing the CPU do not stretch them.
+
+The benchmark's `score` is its fastest round divided by the fastest timing
+of the fixed workload. Shared VMs switch between faster and slower periods
+lasting seconds; spread over several seconds, both minimums mostly come
+from a fast period, while a median or a per-run minimum depends on which
+periods a run happened to fall in.
+
+The median, minimum, mean and standard deviation of the rounds and the
+score are written to `--bench-json` (benchmarks/results.json) and compared
+with the committed baseline (benchmarks/baseline.json). A score more than
+`--bench-tolerance` (25%) above its baseline is reported as a regression.
+Whole sessions still come out faster or slower than others, so
+`--bench-save-baseline` keeps each benchmark's scores from its last three
+saves and records their median: on an idle machine, save three times
+(after deleting baseline.json when moving to another machine).
+
+On the VM the baseline was recorded on, re-runs of unchanged code stayed
+within +/-22% of it with `-k "not 10000"`, and within +/-30% with another
+process busy on the same CPU. The 10000 sizes moved by up to +/-35%, as
+their rounds walk objects laid out differently in every process; compare
+them with `--bench-tolerance 0.35`. CPU time leaves out time spent
+waiting, which these in-process (SQLite) benchmarks do not.
+"""
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from .common import setup_django
+
+# The suites import models at module level; pytest-django only sets Django
+# up later, for the first test that needs the database
+setup_django()
+
+HERE = Path(__file__).resolve().parent
+BASELINE = HERE / 'baseline.json'
+RESULTS = HERE / 'results.json'
+
+# CPU seconds each benchmark's runs are spread over
+ROUNDS_BUDGET = 5.0
+MIN_RUNS = 3
+MAX_ROUNDS = 10000
+
+# Saves of the baseline whose median score is kept
+BASELINE_SESSIONS = 3
+
+# CPU time of this process: unlike wall time, not stretched by other
+# processes sharing the CPU
+clock = time.process_time
+
+# Benchmark name -> timings, and the regressions found, for this run
+results_key = pytest.StashKey[dict]()
+regressions_key = pytest.StashKey[list]()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('bench', 'benchmarks (see benchmarks/conftest.py)')
+    group.addoption('--bench-json', default=str(RESULTS), help='Where to write the results')
+    group.addoption('--bench-baseline', default=str(BASELINE), help='Baseline to compare with')
+    group.addoption('--bench-runs', type=int, default=10, help='Runs per benchmark (fewer for slow ones)')
+    group.addoption('--bench-tolerance', type=float, default=0.25, help='Slowdown of the score reported as a regression')
+    group.addoption('--bench-fail', action='store_true', help='Fail the run when there is a regression')
+    group.addoption('--bench-save-baseline', action='store_true', help='Write the results to the baseline instead')
+
+
+def pytest_collect_file(file_path, parent):
+    # Files named on the command line are collected by pytest already
+    if file_path.suffix == '.py' and file_path.name.startswith('bench_') and not parent.session.isinitpath(file_path):
+        return pytest.Module.from_parent(parent, path=file_path)
+    return None
+
+
+def calibrate():
+    """
+    Return the best of 5 timings of a fixed pure-Python workload: how fast
+    the machine is right now.
+    """
+    samples = []
+    for _ in range(5):
+        start = clock()
+        total = 0
+        for number in range(100000):
+            total += number % 7
+        samples.append(clock() - start)
+    return min(samples)
+
+
+def timed_rounds(func, rounds):
+    samples = []
+    # As timeit does, so collections triggered by earlier rounds add no noise
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            start = clock()
+            func()
+            samples.append(clock() - start)
+    finally:
+        gc.enable()
+    return samples
+
+
+def measure(func, runs):
+    """
+    Return the timings of `func`, in seconds, over up to `runs` runs and
+    its score: the fastest round divided by the fastest `calibrate()`.
+    """
+    start = clock()
+    func()
+    first = max(clock() - start, 1e-9)
+    runs = min(runs, max(MIN_RUNS, int(ROUNDS_BUDGET / first)))
+    rounds = max(1, min(MAX_ROUNDS, int(ROUNDS_BUDGET / runs / first)))
+    samples = []
+    calibrations = []
+    for _ in range(runs):
+        calibrations.append(calibrate())
+        samples.extend(timed_rounds(func, rounds))
+    calibrations.append(calibrate())
+    return {
+        'median': statistics.median(samples),
+        'min': min(samples),
+        'mean': statistics.mean(samples),
+        'stddev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'rounds': rounds,
+        'runs': runs,
+        'score': min(samples) / min(calibrations),
+    }
+
+
+@pytest.fixture
+def bench(request):
+    """
+    Time a function; see the module docstring.
+    """
+    def run(func):
+        stats = measure(func, max(1, request.config.getoption('bench_runs')))
+        request.config.stash.setdefault(results_key, {})[request.node.nodeid.split('::', 1)[1]] = stats
+        return stats
+    return run
+
+
+def load(path):
+    try:
+        return json.loads(Path(path).read_text())['benchmarks']
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return `(name, slowdown)` for each result slower than its baseline by
+    more than `tolerance`.
+    """
+    slowdowns = [
+        (name, stats['score'] / baseline[name]['score'] - 1)
+        for name, stats in sorted(results.items()) if 'score' in baseline.get(name, {})
+    ]
+    return [(name, slowdown) for name, slowdown in slowdowns if slowdown > tolerance]
+
+
+def merge_baseline(baseline, results):
+    """
+    Return `baseline` with `results` added: each benchmark keeps the scores
+    of its last `BASELINE_SESSIONS` saves, and its `score` is their median.
+    Benchmarks left out of this run (-k) keep their baseline.
+    """
+    merged = dict(baseline)
+    for name, stats in results.items():
+        scores = (baseline.get(name, {}).get('scores', []) + [stats['score']])[-BASELINE_SESSIONS:]
+        merged[name] = dict(stats, scores=scores, score=statistics.median(scores))
+    return dict(sorted(merged.items()))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    results = config.stash.get(results_key, {})
+    if not results:
+        return
+    document = {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'machine': f'{platform.system()} {platform.machine()} {platform.processor()}'.strip(),
+        'benchmarks': dict(sorted(results.items())),
+    }
+    if config.getoption('bench_save_baseline'):
+        document['benchmarks'] = merge_baseline(load(config.getoption('bench_baseline')), results)
+        Path(config.getoption('bench_baseline')).write_text(json.dumps(document, indent=2) + '\n')
+        return
+    Path(config.getoption('bench_json')).write_text(json.dumps(document, indent=2) + '\n')
+    regressions = compare(results, load(config.getoption('bench_baseline')), config.getoption('bench_tolerance'))
+    config.stash[regressions_key] = regressions
+    if regressions and config.getoption('bench_fail') and session.exitstatus == 0:
+        session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    results = config.stash.get(results_key, {})
+    if not results:
+        return
+    # Just overwritten with these results when saving
+    baseline = {} if config.getoption('bench_save_baseline') else load(config.getoption('bench_baseline'))
+    terminalreporter.section('benchmarks')
+    terminalreporter.write_line(f'{"benchmark":<60} {"median ms":>10} {"min ms":>10} {"rounds":>9} {"vs base":>8}')
+    for name, stats in sorted(results.items()):
+        has_baseline = 'score' in baseline.get(name, {})
+        change = f'{stats["score"] / baseline[name]["score"] - 1:+.0%}' if has_baseline else 'new'
+        rounds = f'{stats["runs"]}x{stats["rounds"]}'
+        terminalreporter.write_line(
+            f'{name:<60} {stats["median"] * 1000:>10.3f} {stats["min"] * 1000:>10.3f} {rounds:>9} {change:>8}'
+        )
+    if config.getoption('bench_save_baseline'):
+        terminalreporter.write_line(f'Baseline written to {config.getoption("bench_baseline")}')
+        return
+    regressions = config.stash.get(regressions_key, [])
+    tolerance = config.getoption('bench_tolerance')
+    for name, slowdown in regressions:
+        terminalreporter.write_line(f'REGRESSION {name}: {slowdown:.0%} slower than the baseline', red=True)
+    if not regressions:
+        terminalreporter.write_line(f'No regressions over {tolerance:.0%} against {config.getoption("bench_baseline")}')
@@ -0,0 +1,467 @@
+"""
+Load test the API with a mix of reads and writes and find where it saturates.
+
+Usage:
+    python -m benchmarks.loadtest --serve
+    python -m benchmarks.loadtest --url http://localhost:8000 --username admin --password secret
+    python -m benchmarks.loadtest --url http://localhost:8000 --token KEY --concurrency 4,8,16 --stage-seconds 30
+
+Each worker thread keeps one HTTP connection open and runs operations picked
+at random by weight (`--mix`):
+
+    browse   task list pages with filters and orderings
+    search   task and person search
+    detail   a person's detail, then their tasks
+    assign   assign a task to a person, then unassign it through the person
+             (POST /api/tasks/{id}/assign/, /api/persons/{id}/unassign_task/)
+    profile  a burst of PATCH /api/persons/{id}/profile_update/ calls
+
+The run goes through stages of increasing concurrency (`--concurrency`,
+default 1, 2, 4, ... 64 workers), `--stage-seconds` each, and prints one row
+per stage: throughput, latency percentiles and error rate. It stops at the
+saturation point, the first stage that adds less than `--min-gain` to the
+best throughput so far, or whose error rate or p99 latency is over the
+limits. 429 (rate limited) and 503 (load shed) answers count as errors, and
+are shown on their own as well: raise RATE_LIMITS on the server under test,
+or they are what saturates first.
+
+`--url` needs a server with data (see `--seed`) and a user whose token can
+write. `--serve` starts one in this process instead, on a temporary
+database with `--seed` persons and tasks, and rate limits out of the way;
+it serves with wsgiref's threaded server, so its numbers are mostly useful
+to compare one build with another.
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlencode, urlsplit
+
+from .common import setup_django, temporary_database
+
+OPERATIONS = ('browse', 'search', 'detail', 'assign', 'profile')
+
+DEFAULT_MIX = 'browse=40,search=20,detail=15,assign=15,profile=10'
+
+SEARCH_TERMS = ('task', 'load', 'report', 'person', 'dept', 'review')
+
+TASK_FILTERS = (
+    {},
+    {'status': 'pending'},
+    {'status': 'in_progress', 'ordering': '-priority'},
+    {'completed': 'false', 'ordering': 'due_date'},
+    {'priority': '3'},
+)
+
+# Statuses counted as errors: any 5xx, rate limited, and no response at all
+THROTTLED = 429
+NO_RESPONSE = 0
+
+
+class Client:
+    """
+    One persistent HTTP connection to the server under test.
+    """
+    def __init__(self, url, token, timeout=30):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port
+        self.https = parts.scheme == 'https'
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.headers = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+        if token:
+            self.headers['Authorization'] = f'Token {token}'
+        self.connection = None
+
+    def connect(self):
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        self.connection = connection_class(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, params=None, data=None):
+        """
+        Return `(status, parsed body or None, seconds)`; status 0 when the
+        request failed without a response.
+        """
+        if params:
+            path = f'{path}?{urlencode(params)}'
+        body = json.dumps(data) if data is not None else None
+        start = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connect()
+            self.connection.request(method, self.prefix + path, body=body, headers=self.headers)
+            response = self.connection.getresponse()
+            content = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            # Reconnect on the next request
+            self.close()
+            return NO_RESPONSE, None, time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+        try:
+            payload = json.loads(content) if content else None
+        except ValueError:
+            payload = None
+        return status, payload, elapsed
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Recorder:
+    """
+    Samples of one stage: (operation, status, seconds) per request.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def add(self, operation, status, seconds):
+        with self._lock:
+            self.samples.append((operation, status, seconds))
+
+
+def results(payload):
+    if isinstance(payload, dict):
+        return payload.get('results') or []
+    return payload or []
+
+
+class Scenario:
+    """
+    The operations a worker runs, over the ids found on the server.
+    """
+    def __init__(self, person_ids, task_ids, mix, burst):
+        self.person_ids = person_ids
+        self.task_ids = task_ids
+        self.operations = list(mix)
+        self.weights = [mix[name] for name in self.operations]
+        self.burst = burst
+
+    def run_one(self, client, recorder, rng):
+        operation = rng.choices(self.operations, self.weights)[0]
+        getattr(self, operation)(client, recorder, rng)
+
+    def call(self, client, recorder, operation, method, path, **kwargs):
+        status, payload, seconds = client.request(method, path, **kwargs)
+        recorder.add(operation, status, seconds)
+        return status, payload
+
+    def browse(self, client, recorder, rng):
+        params = dict(rng.choice(TASK_FILTERS))
+        params['page'] = rng.choice((1, 1, 1, 2, 3))
+        status, _ = self.call(client, recorder, 'browse', 'GET', '/api/tasks/', params=params)
+        if status == 404:
+            # Past the last page for this filter
+            self.call(client, recorder, 'browse', 'GET', '/api/tasks/', params=dict(params, page=1))
+
+    def search(self, client, recorder, rng):
+        path = rng.choice(('/api/tasks/', '/api/persons/'))
+        self.call(client, recorder, 'search', 'GET', path, params={'search': rng.choice(SEARCH_TERMS)})
+
+    def detail(self, client, recorder, rng):
+        person_id = rng.choice(self.person_ids)
+        self.call(client, recorder, 'detail', 'GET', f'/api/persons/{person_id}/')
+        self.call(client, recorder, 'detail', 'GET', f'/api/persons/{person_id}/tasks/')
+
+    def assign(self, client, recorder, rng):
+        task_id = rng.choice(self.task_ids)
+        person_id = rng.choice(self.person_ids)
+        status, _ = self.call(client, recorder, 'assign', 'POST', f'/api/tasks/{task_id}/assign/', data={'person_id': person_id})
+        if status == 200:
+            self.call(
+                client, recorder, 'assign', 'POST', f'/api/persons/{person_id}/unassign_task/',
+                data={'task_id': task_id},
+            )
+
+    def profile(self, client, recorder, rng):
+        person_id = rng.choice(self.person_ids)
+        for _ in range(self.burst):
+            department = f'Dept {rng.randrange(10)}'
+            self.call(
+                client, recorder, 'profile', 'PATCH', f'/api/persons/{person_id}/profile_update/',
+                data={'department': department},
+            )
+
+
+def is_error(status):
+    return status == NO_RESPONSE or status == THROTTLED or status >= 500
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(samples, seconds):
+    """
+    Return throughput, latency percentiles (ms) and error counts of `samples`.
+    """
+    latencies = sorted(sample[2] * 1000 for sample in samples)
+    statuses = Counter(sample[1] for sample in samples)
+    errors = sum(count for status, count in statuses.items() if is_error(status))
+    return {
+        'requests': len(samples),
+        'rps': len(samples) / seconds if seconds else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else 0.0,
+        'error_rate': errors / len(samples) if samples else 0.0,
+        'throttled': statuses[THROTTLED],
+        'shed': statuses[503],
+        'failed': statuses[NO_RESPONSE],
+    }
+
+
+def run_stage(url, token, scenario, workers, seconds, seed):
+    """
+    Run `workers` threads for `seconds` and return their samples.
+    """
+    recorder = Recorder()
+    deadline = time.monotonic() + seconds
+
+    def work(number):
+        rng = random.Random(seed * 1000 + number)
+        client = Client(url, token)
+        try:
+            while time.monotonic() < deadline:
+                scenario.run_one(client, recorder, rng)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=work, args=(number,), daemon=True) for number in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.samples
+
+
+def saturated(stats, best_rps, args):
+    """
+    Return why a stage marks the saturation point, or None.
+    """
+    if stats['error_rate'] > args.max_error_rate:
+        return f'error rate {stats["error_rate"]:.1%}'
+    if args.max_p99_ms and stats['p99'] > args.max_p99_ms:
+        return f'p99 {stats["p99"]:.0f} ms'
+    if best_rps and stats['rps'] < best_rps * (1 + args.min_gain):
+        return f'throughput gain under {args.min_gain:.0%}'
+    return None
+
+
+def fetch_ids(client, path, limit):
+    """
+    Return up to `limit` ids from the list endpoint `path`.
+    """
+    ids = []
+    page = 1
+    while len(ids) < limit:
+        status, payload = client.request('GET', path, params={'page': page})[:2]
+        if status != 200:
+            break
+        ids.extend(item['id'] for item in results(payload))
+        if not isinstance(payload, dict) or not payload.get('next'):
+            break
+        page += 1
+    return ids[:limit]
+
+
+def seed_data(client, persons, tasks):
+    """
+    Create `persons` persons and `tasks` tasks through the API.
+    """
+    stamp = int(time.time())
+    for number in range(persons):
+        client.request('POST', '/api/persons/', data={
+            'name': f'Load Person {number}',
+            'email': f'load{stamp}-{number}@example.com',
+            'department': f'Dept {number % 10}',
+        })
+    for number in range(tasks):
+        client.request('POST', '/api/tasks/', data={
+            'title': f'Load task {number}',
+            'description': 'Created by the load test',
+            'priority': number % 5,
+        })
+
+
+def obtain_token(url, username, password):
+    status, payload, _ = Client(url, None).request(
+        'POST', '/api/auth/token/', data={'username': username, 'password': password},
+    )
+    if status != 200:
+        raise SystemExit(f'Could not get a token for {username}: HTTP {status} {payload}')
+    return payload['token']
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'Unknown operation {name!r}, expected one of {", ".join(OPERATIONS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_concurrency(value):
+    return [int(part) for part in value.split(',')]
+
+
+@contextmanager
+def local_server(seed_persons, seed_tasks):
+    """
+    Serve the API from this process on a temporary database and yield
+    `(url, token)`.
+    """
+    setup_django()
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+    from django.core.wsgi import get_wsgi_application
+    from django.test.utils import override_settings
+    from rest_framework.authtoken.models import Token
+
+    from django.contrib.auth.models import User
+    from tasks.models import Person, Task
+
+    class ThreadingServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    class QuietHandler(WSGIRequestHandler):
+        # HTTP/1.1, so the clients' connections are kept open
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+    unlimited = {name: {'RATE': 10 ** 6, 'BURST': 10 ** 6} for name in ('high', 'normal', 'low')}
+    with temporary_database(), override_settings(
+        ALLOWED_HOSTS=['*'], RATE_LIMITS={'BACKEND': 'local', 'BUCKETS': unlimited},
+    ):
+        persons = Person.objects.bulk_create([
+            Person(name=f'Person {i}', email=f'person{i}@example.com', department=f'Dept {i % 10}')
+            for i in range(seed_persons)
+        ])
+        Task.objects.bulk_create([
+            Task(
+                title=f'Task {i}',
+                description='Generated for the load test',
+                status=('pending', 'in_progress', 'completed')[i % 3],
+                completed=i % 3 == 2,
+                priority=i % 5,
+                assigned_to=persons[i % len(persons)] if persons and i % 2 else None,
+            )
+            for i in range(seed_tasks)
+        ])
+        user = User.objects.create_user(username='loadtest', password='loadtest-password', is_staff=True)
+        token = Token.objects.create(user=user).key
+
+        server = make_server(
+            '127.0.0.1', 0, get_wsgi_application(), server_class=ThreadingServer, handler_class=QuietHandler,
+        )
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield f'http://127.0.0.1:{server.server_port}', token
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='Base URL of the server under test')
+    target.add_argument('--serve', action='store_true', help='Serve the API from this process on a temporary database')
+    parser.add_argument('--token', help='API token (see /api/auth/token/)')
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f'Operation weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--concurrency', type=parse_concurrency, default=[1, 2, 4, 8, 16, 32, 64], help='Workers per stage, e.g. 1,2,4,8')
+    parser.add_argument('--stage-seconds', type=float, default=10)
+    parser.add_argument('--burst', type=int, default=5, help='profile_update calls per profile operation')
+    parser.add_argument('--min-gain', type=float, default=0.05, help='Throughput gain a stage needs over the best so far')
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--max-p99-ms', type=float, default=0, help='p99 latency that counts as saturated (default: no limit)')
+    parser.add_argument('--no-stop', action='store_true', help='Run every stage, even past the saturation point')
+    parser.add_argument('--seed', type=int, default=0, metavar='N', help='Create N persons and 10*N tasks first')
+    parser.add_argument('--random-seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.serve:
+        server = local_server(args.seed or 50, (args.seed or 50) * 10)
+    else:
+        server = nullcontext((args.url, args.token))
+    with server as (url, token):
+        if not token and args.username:
+            token = obtain_token(url, args.username, args.password)
+
+        setup_client = Client(url, token)
+        if args.seed and args.url:
+            seed_data(setup_client, args.seed, args.seed * 10)
+        person_ids = fetch_ids(setup_client, '/api/persons/', 200)
+        task_ids = fetch_ids(setup_client, '/api/tasks/', 500)
+        setup_client.close()
+        if not person_ids or not task_ids:
+            raise SystemExit('The server has no persons or tasks; pass --seed N to create some')
+
+        scenario = Scenario(person_ids, task_ids, args.mix, args.burst)
+        print(f'{url}: {len(person_ids)} persons, {len(task_ids)} tasks; '
+              f'mix {", ".join(f"{name}={weight:g}" for name, weight in args.mix.items())}')
+        print(f'{"time s":>7} {"workers":>7} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+              f'{"max ms":>8} {"errors":>7} {"429":>5} {"503":>5} {"failed":>6}')
+
+        started = time.monotonic()
+        best = None
+        saturation = None
+        by_operation = None
+        for stage, workers in enumerate(args.concurrency):
+            samples = run_stage(url, token, scenario, workers, args.stage_seconds, args.random_seed + stage)
+            stats = summarize(samples, args.stage_seconds)
+            print(f'{time.monotonic() - started:>7.0f} {workers:>7} {stats["rps"]:>8.1f} {stats["p50"]:>8.1f} '
+                  f'{stats["p95"]:>8.1f} {stats["p99"]:>8.1f} {stats["max"]:>8.1f} {stats["error_rate"]:>7.1%} '
+                  f'{stats["throttled"]:>5} {stats["shed"]:>5} {stats["failed"]:>6}', flush=True)
+            reason = saturated(stats, best['rps'] if best else 0.0, args)
+            if reason is None:
+                best = dict(stats, workers=workers)
+                by_operation = samples
+            elif saturation is None:
+                saturation = (workers, reason)
+                if not args.no_stop:
+                    break
+
+        if best is None:
+            print('\nSaturated from the first stage; try fewer workers or higher limits')
+            return
+        if saturation:
+            workers, reason = saturation
+            print(f'\nSaturation point: {best["rps"]:.1f} req/s with {best["workers"]} workers '
+                  f'(at {workers} workers: {reason})')
+        else:
+            print(f'\nNot saturated: {best["rps"]:.1f} req/s with {best["workers"]} workers; add more stages')
+
+        print(f'\nBy operation at {best["workers"]} workers:')
+        print(f'{"operation":<10} {"requests":>8} {"p50 ms":>8} {"p99 ms":>8} {"errors":>7}')
+        grouped = defaultdict(list)
+        for sample in by_operation:
+            grouped[sample[0]].append(sample)
+        for operation in OPERATIONS:
+            if operation in grouped:
+                stats = summarize(grouped[operation], args.stage_seconds)
+                print(f'{operation:<10} {stats["requests"]:>8} {stats["p50"]:>8.1f} {stats["p99"]:>8.1f} '
+                      f'{stats["error_rate"]:>7.1%}')
+
+
+if __name__ == '__main__':
+    main()
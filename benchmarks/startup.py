@@ -0,0 +1,125 @@
+"""
+Measure worker start-up: import time and time to first request.
+
+Each run starts a fresh interpreter with `python -X importtime`, imports the
+WSGI or ASGI entry point under the given settings module and serves one
+request to `/api/` in-process. The wall-clock time of the whole subprocess
+is the time to first request; the `-X importtime` output gives the modules
+that dominate it.
+
+Usage:
+    python -m benchmarks.startup [--runs 5] [--top 15]
+        [--settings taskmanager.settings taskmanager.settings_api]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Code run in the child process for each entry point. Both import the
+# entry point module and then serve a single GET /api/.
+FIRST_REQUEST = {
+    'wsgi': '''
+import io
+from taskmanager.wsgi import application
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': '/api/', 'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'wsgi.input': io.BytesIO(),
+    'wsgi.url_scheme': 'http', 'wsgi.errors': io.StringIO(),
+}
+status = []
+body = b''.join(application(environ, lambda s, h: status.append(s)))
+assert status[0].startswith('200'), status
+''',
+    'asgi': '''
+import asyncio
+from taskmanager.asgi import application
+scope = {
+    'type': 'http', 'method': 'GET', 'path': '/api/', 'raw_path': b'/api/',
+    'query_string': b'', 'headers': [(b'host', b'localhost')],
+    'server': ('localhost', 80), 'scheme': 'http', 'asgi': {'version': '3.0'},
+}
+messages = []
+async def receive():
+    return {'type': 'http.request', 'body': b''}
+async def send(message):
+    messages.append(message)
+asyncio.run(application(scope, receive, send))
+assert messages[0]['status'] == 200, messages[0]
+''',
+}
+
+
+def run_once(entry_point, settings_module):
+    """
+    Return (wall_seconds, importtime_lines) for one cold start.
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', FIRST_REQUEST[entry_point]],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f'{entry_point} with {settings_module} failed:\n{result.stderr[-2000:]}')
+    return elapsed, result.stderr.splitlines()
+
+
+def parse_importtime(lines):
+    """
+    Return {module: (cumulative_microseconds, depth)} for every module in
+    the `-X importtime` output, where depth 0 is an import made directly by
+    the program and each level of nesting adds one.
+    """
+    cumulative = {}
+    for line in lines:
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, _, cumulative_us, name = [part.strip() for part in line.replace('import time:', '|', 1).split('|')]
+        # Nesting is shown with two spaces of indent per level
+        raw_name = line.rsplit('|', 1)[1]
+        depth = (len(raw_name) - len(raw_name.lstrip())) // 2
+        cumulative[name] = (int(cumulative_us), depth)
+    return cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument(
+        '--settings', nargs='+',
+        default=['taskmanager.settings', 'taskmanager.settings_api'],
+    )
+    args = parser.parse_args()
+
+    for settings_module in args.settings:
+        for entry_point in ('wsgi', 'asgi'):
+            times = []
+            imports = {}
+            for _ in range(args.runs):
+                elapsed, lines = run_once(entry_point, settings_module)
+                times.append(elapsed)
+                imports = parse_importtime(lines)
+            print(
+                f'{settings_module} {entry_point}: time to first request '
+                f'median {statistics.median(times) * 1000:.0f} ms, '
+                f'min {min(times) * 1000:.0f} ms over {args.runs} runs'
+            )
+            # The biggest third-party/project packages, by cumulative import time
+            packages = sorted(
+                ((us, name) for name, (us, depth) in imports.items() if depth <= 1),
+                reverse=True,
+            )
+            for us, name in packages[:args.top]:
+                print(f'    {us / 1000:8.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark the materialized workload summary against the on-the-fly aggregate.
+
+Usage:
+    python -m benchmarks.workload [--tasks 200000] [--persons 500] [--repeat 20]
+
+"aggregate" groups the whole Task table by department, person and priority
+on every call. "materialized" is GET /api/persons/workload/ with nothing
+stale (one read of the PersonWorkload table), and "after 1 change" includes
+recomputing the two rows touched by reassigning one task.
+"""
+import argparse
+import statistics
+from datetime import date, timedelta
+
+from .common import setup_django, temporary_database, timer
+
+
+def median_seconds(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        results = {}
+        with timer(results, 'run'):
+            func()
+        samples.append(results['run'])
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tasks', type=int, default=200000)
+    parser.add_argument('--persons', type=int, default=500)
+    parser.add_argument('--departments', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db.models import Count, Q
+
+    from tasks.models import Person, Task
+    from tasks.workload import refresh_workload, workload_summary
+
+    with temporary_database():
+        persons = Person.objects.bulk_create([
+            Person(name=f'Person {i}', email=f'person{i}@example.com', department=f'Dept {i % args.departments}')
+            for i in range(args.persons)
+        ])
+        today = date.today()
+        Task.objects.bulk_create([
+            Task(
+                title=f'Task {i}',
+                priority=i % 5,
+                due_date=today + timedelta(days=i % 60 - 30),
+                completed=i % 3 == 0,
+                assigned_to=persons[i % len(persons)],
+            )
+            for i in range(args.tasks)
+        ], batch_size=5000)
+
+        def aggregate():
+            return list(
+                Task.objects.filter(completed=False, assigned_to__isnull=False)
+                .values('assigned_to__department', 'assigned_to', 'priority')
+                .annotate(count=Count('id'), overdue=Count('id', filter=Q(due_date__lt=today)))
+                .order_by()
+            )
+
+        results = {}
+        with timer(results, 'full refresh'):
+            refresh_workload()
+        results['aggregate'] = median_seconds(aggregate, args.repeat)
+        results['materialized'] = median_seconds(workload_summary, args.repeat)
+
+        task = Task.objects.filter(completed=False).first()
+
+        def after_one_change():
+            task.assigned_to = persons[(persons.index(task.assigned_to) + 1) % len(persons)]
+            task.save()
+            workload_summary()
+
+        results['after 1 change'] = median_seconds(after_one_change, args.repeat)
+
+        print(f'{args.tasks} tasks, {args.persons} persons, {args.departments} departments')
+        print(f'{"":<16} {"ms":>10}')
+        for key in ('aggregate', 'materialized', 'after 1 change', 'full refresh'):
+            print(f'{key:<16} {results[key] * 1000:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
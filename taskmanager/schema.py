@@ -0,0 +1,274 @@
+"""
+OpenAPI schema views with an in-process cache.
+
+drf_yasg normally introspects every viewset and serializer each time the
+schema is requested. The schema only changes when the code does, so here it
+is generated once per process (or loaded from the artifact written by
+`manage.py build_openapi_schema`) and served with a strong ETag, letting
+clients that already hold the current copy get a 304.
+
+The cache is keyed on a fingerprint of what shapes the schema: the source
+of every module of the project's own apps and of the root URLconf's package
+(pagination, filters and renderers included, not just views and
+serializers), and the `REST_FRAMEWORK` and `SWAGGER_SETTINGS` settings. A
+prebuilt artifact is only used when its fingerprint matches the running
+code.
+
+Settings (all optional):
+
+    OPENAPI_SCHEMA = {
+        'ARTIFACT_DIR': BASE_DIR / 'openapi',  # where build_openapi_schema writes
+        'MAX_AGE': 0,                          # Cache-Control max-age, in seconds
+    }
+"""
+import hashlib
+import importlib.util
+import json
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+import drf_yasg
+import rest_framework
+from django.apps import apps
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from drf_yasg import openapi
+from drf_yasg.app_settings import swagger_settings
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+
+# Settings whose values are part of the fingerprint
+FINGERPRINT_SETTINGS = ('REST_FRAMEWORK', 'SWAGGER_SETTINGS')
+
+# Settings that, when changed (e.g. by override_settings), invalidate the cache
+SCHEMA_SETTINGS = ('ROOT_URLCONF', 'REST_FRAMEWORK', 'SWAGGER_SETTINGS', 'OPENAPI_SCHEMA')
+
+MANIFEST_NAME = 'manifest.json'
+
+RenderedSchema = namedtuple('RenderedSchema', ['content', 'media_type', 'etag'])
+
+API_INFO = openapi.Info(
+    title="Task Manager API",
+    default_version='v1',
+    description="API for managing tasks",
+    terms_of_service="https://www.example.com/terms/",
+    contact=openapi.Contact(email="contact@example.com"),
+    license=openapi.License(name="BSD License"),
+)
+
+
+def get_options():
+    options = {
+        'ARTIFACT_DIR': Path(settings.BASE_DIR) / 'openapi',
+        'MAX_AGE': 0,
+    }
+    options.update(getattr(settings, 'OPENAPI_SCHEMA', {}))
+    return options
+
+
+def artifact_file_name(renderer_class):
+    """
+    Name of the artifact file for a spec renderer, e.g. `schema.yaml`.
+    """
+    return 'schema.' + renderer_class.format.lstrip('.')
+
+
+def source_dirs():
+    """
+    Return the directories of the project's own apps and of the root
+    URLconf's package.
+    """
+    base_dir = Path(settings.BASE_DIR).resolve()
+    dirs = [
+        Path(app_config.path).resolve() for app_config in apps.get_app_configs()
+        if base_dir in Path(app_config.path).resolve().parents
+    ]
+    spec = importlib.util.find_spec(settings.ROOT_URLCONF.split('.')[0])
+    if spec is not None and spec.submodule_search_locations:
+        dirs += [Path(location).resolve() for location in spec.submodule_search_locations]
+    return sorted(set(dirs))
+
+
+def compute_fingerprint():
+    """
+    Hash the source of every module that can shape the schema, the settings
+    that configure its generation, and the versions of the libraries that
+    generate it.
+    """
+    digest = hashlib.sha256()
+    digest.update(f'drf_yasg={drf_yasg.__version__};drf={rest_framework.__version__}'.encode())
+    for name in FINGERPRINT_SETTINGS:
+        value = getattr(settings, name, None)
+        digest.update(f'{name}={json.dumps(value, sort_keys=True, default=str)}'.encode())
+    base_dir = Path(settings.BASE_DIR).resolve()
+    for directory in source_dirs():
+        for path in sorted(directory.rglob('*.py')):
+            digest.update(str(path.relative_to(base_dir) if base_dir in path.parents else path).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def generate_schema(version=''):
+    """
+    Introspect the API and return the `Swagger` object.
+
+    No request is passed to the generator, so the schema is the same for
+    every caller and carries no host; Swagger UI then uses the host it was
+    loaded from.
+    """
+    generator = swagger_settings.DEFAULT_GENERATOR_CLASS(API_INFO, version)
+    return generator.get_schema(request=None, public=True)
+
+
+def render_schema(schema, renderer_class):
+    """
+    Encode a `Swagger` object with one of drf_yasg's spec renderers.
+    """
+    content = renderer_class().render(schema)
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return content
+
+
+def make_etag(content):
+    return '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+
+
+class SchemaCache:
+    """
+    Thread-safe cache of rendered schema documents, one per renderer and
+    API version.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._documents = {}
+        self._schemas = {}
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = compute_fingerprint()
+        return self._fingerprint
+
+    def get(self, renderer_class, version=''):
+        """
+        Return the `RenderedSchema` for `renderer_class` and `version`,
+        generating it on first use.
+        """
+        key = (renderer_class.format, version)
+        document = self._documents.get(key)
+        if document is not None:
+            return document
+
+        with self._lock:
+            document = self._documents.get(key)
+            if document is None:
+                content = None
+                if not version:
+                    content = self.load_artifact(renderer_class)
+                if content is None:
+                    if version not in self._schemas:
+                        self._schemas[version] = generate_schema(version)
+                    content = render_schema(self._schemas[version], renderer_class)
+                media_type = f'{renderer_class.media_type}; charset={renderer_class.charset}'
+                document = RenderedSchema(content, media_type, make_etag(content))
+                self._documents[key] = document
+        return document
+
+    def load_artifact(self, renderer_class):
+        """
+        Return the prebuilt document for `renderer_class`, or None when there
+        is none or it was built from different code.
+        """
+        artifact_dir = Path(get_options()['ARTIFACT_DIR'])
+        try:
+            with open(artifact_dir / MANIFEST_NAME) as f:
+                manifest = json.load(f)
+            if manifest.get('fingerprint') != self.fingerprint:
+                return None
+            with open(artifact_dir / artifact_file_name(renderer_class), 'rb') as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def invalidate(self):
+        with self._lock:
+            self._documents.clear()
+            self._schemas.clear()
+            self._fingerprint = None
+
+
+# The cache shared by everything in this process
+schema_cache = SchemaCache()
+
+
+@receiver(setting_changed)
+def invalidate_schema_cache(setting, **kwargs):
+    if setting in SCHEMA_SETTINGS:
+        schema_cache.invalidate()
+
+
+def write_artifacts(artifact_dir=None):
+    """
+    Render the schema in every spec format into `artifact_dir`, with a
+    manifest recording the fingerprint of the code it was built from.
+
+    Returns the list of files written.
+    """
+    artifact_dir = Path(artifact_dir or get_options()['ARTIFACT_DIR'])
+    artifact_dir.mkdir(parents=True, exist_ok=True)
+    schema = generate_schema()
+    written = []
+    for renderer_class in swagger_settings.DEFAULT_SPEC_RENDERERS:
+        path = artifact_dir / artifact_file_name(renderer_class)
+        path.write_bytes(render_schema(schema, renderer_class))
+        written.append(path)
+    manifest_path = artifact_dir / MANIFEST_NAME
+    with open(manifest_path, 'w') as f:
+        json.dump({'fingerprint': compute_fingerprint()}, f)
+    written.append(manifest_path)
+    schema_cache.invalidate()
+    return written
+
+
+BaseSchemaView = get_schema_view(
+    API_INFO,
+    public=True,
+    permission_classes=(permissions.AllowAny,),
+)
+
+
+class CachedSchemaView(BaseSchemaView):
+    """
+    Schema view that serves the JSON/YAML documents from `schema_cache`.
+
+    The Swagger UI and ReDoc pages themselves are cheap (drf_yasg renders
+    them without introspecting the API) and are left to the base view; the
+    pages then fetch the document through `?format=openapi`, which is cached.
+    """
+    def get(self, request, version='', format=None):
+        renderer = request.accepted_renderer
+        # The view has subclasses of the spec renderers (with validators)
+        if not isinstance(renderer, tuple(swagger_settings.DEFAULT_SPEC_RENDERERS)):
+            return super().get(request, version, format)
+
+        document = schema_cache.get(type(renderer), request.version or version or '')
+        # Weak comparison: CompressionMiddleware sends compressed copies
+        # with the ETag marked weak
+        etags = [etag.removeprefix('W/') for etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))]
+        if document.etag in etags:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(document.content, content_type=document.media_type)
+        response['ETag'] = document.etag
+        patch_cache_control(response, public=True, max_age=get_options()['MAX_AGE'])
+        return response
+
+
+schema_view = CachedSchemaView
@@ -41,16 +41,25 @@ INSTALLED_APPS = [
     'tasks',
     # Third-party apps
     'rest_framework',
+    'rest_framework.authtoken',
     'django_filters',
     'drf_yasg',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Request counts and timings for /metrics (see tasks/metrics.py)
+    'tasks.middleware.MetricsMiddleware',
+    # gzip/br/zstd response bodies (see tasks/compression.py)
+    'tasks.middleware.CompressionMiddleware',
+    # Returns 503 for lists/searches while the database is slow
+    'tasks.middleware.LoadSheddingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # cProfile of requests sent with X-Profile: 1 by staff (see tasks/profiling.py)
+    'tasks.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -130,14 +139,144 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # Page numbers, without exact COUNT(*)s of large results (see tasks/pagination.py)
+    'DEFAULT_PAGINATION_CLASS': 'tasks.pagination.ApproximateCountPagination',
     'PAGE_SIZE': 10,
+    # JSON with an opt-in compact mode, ?compact=1 (see tasks/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'tasks.renderers.CompactJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
+        # Preferred for service accounts: no password hashing per request
+        'tasks.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    # Per-client, per-endpoint token buckets (see tasks/throttling.py)
+    'DEFAULT_THROTTLE_CLASSES': [
+        'tasks.throttling.TokenBucketThrottle',
+    ],
+}
+
+# Per-process cache of Person id/name/email used by the assignment endpoints
+# and profile validation (see tasks/cache.py)
+PERSON_CACHE = {
+    'MAX_SIZE': 1024,
+    'TTL': 60,
+}
+
+# Cached OpenAPI schema (see taskmanager/schema.py). Run
+# `python manage.py build_openapi_schema` on deploy to precompute it.
+OPENAPI_SCHEMA = {
+    'ARTIFACT_DIR': BASE_DIR / 'openapi',
+    'MAX_AGE': 0,
+}
+
+# In-process cache of verified API tokens (see tasks/authentication.py)
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+}
+
+# Token bucket sizes per priority class (see tasks/throttling.py).
+# Use 'BACKEND': 'cache' with a shared cache (e.g. Redis) to limit across
+# all worker processes.
+RATE_LIMITS = {
+    'BACKEND': 'local',
+    'CACHE_ALIAS': 'default',
+    'BUCKETS': {
+        'high': {'RATE': 10, 'BURST': 50},     # writes
+        'normal': {'RATE': 20, 'BURST': 100},  # single-object reads
+        'low': {'RATE': 5, 'BURST': 50},       # lists and searches
+    },
+}
+
+# Shed list/search traffic while queries are slow (see tasks/middleware.py)
+LOAD_SHEDDING = {
+    'DB_LATENCY_THRESHOLD_MS': 200,
+    'RETRY_AFTER': 5,
+}
+
+# Background jobs run by `manage.py run_worker` (see tasks/jobs.py)
+JOBS = {
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 10,
+    'LEASE_SECONDS': 600,
+    'CONCURRENCY': {
+        'export': 2,
+        'sample_data': 1,
+    },
+    'EXPORT_DIR': BASE_DIR / 'exports',
+}
+
+# Materialized per-person workload (see tasks/workload.py)
+WORKLOAD = {
+    'REFRESH_ON_READ': True,
+}
+
+# Counts in paginated API responses (see tasks/pagination.py)
+PAGINATION_COUNTS = {
+    'EXACT_COUNT_LIMIT': 10000,
+    'CACHE_TTL': 60,
+    'CACHE_ALIAS': 'default',
+}
+
+# Response compression (see tasks/compression.py). br and zstd are offered
+# when the brotli and zstandard packages are installed.
+COMPRESSION = {
+    'MIN_SIZE': 1024,
+    'LEVELS': {'gzip': 6, 'br': 4, 'zstd': 3},
+    'CACHE_SIZE': 64,
+}
+
+# Several API calls in one request, POST /api/batch/ (see tasks/batch.py)
+BATCH = {
+    'MAX_REQUESTS': 20,
+    'MAX_WORKERS': 4,
+}
+
+# Limits of the nested selection endpoint, POST /api/query/ (see tasks/query.py)
+QUERY = {
+    'MAX_DEPTH': 3,
+    'MAX_COST': 10000,
+    'DEFAULT_LIMIT': 20,
+    'MAX_LIMIT': 100,
+}
+
+# Moving old closed tasks out of the task table, `manage.py archive_tasks`
+# (see tasks/archive.py)
+ARCHIVE = {
+    'AFTER_DAYS': 90,
+    'BATCH_SIZE': 1000,
+}
+
+# Deleting soft-deleted rows for good, `manage.py purge_deleted`
+# (see tasks/purge.py)
+PURGE = {
+    'AFTER_HOURS': 24,
+    'BATCH_SIZE': 1000,
+}
+
+# Prometheus metrics at /metrics (see tasks/metrics.py). Set DIR to a
+# directory shared by the worker processes of a pre-fork server.
+METRICS = {
+    'ENABLED': True,
+    'DIR': None,
+    'FLUSH_INTERVAL': 1.0,
+}
+
+# Request profiles for staff users (see tasks/profiling.py). Send
+# `X-Profile: 1` or `?profile=1`, or set SAMPLE_RATE to profile a fraction of
+# requests; list them with `manage.py profiles`.
+PROFILING = {
+    'ENABLED': True,
+    'DIR': 'profiles',
+    'SAMPLE_RATE': 0.0,
+    'MIN_DURATION_MS': 200,
+    'MAX_FILES': 200,
 }
@@ -0,0 +1,51 @@
+"""
+API-only settings for the taskmanager project.
+
+Used by the pods that only serve `/api/`: the admin, sessions, messages,
+static files and the Swagger/ReDoc docs are left out so that workers start
+faster and import less. Everything else comes from `settings.py`.
+
+Use it with:
+    DJANGO_SETTINGS_MODULE=taskmanager.settings_api gunicorn taskmanager.wsgi
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK
+
+# Apps only needed for the admin, the browsable API and the docs
+API_EXCLUDED_APPS = (
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'django_filters',  # only provides templates; DjangoFilterBackend works without it
+    'drf_yasg',
+)
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in API_EXCLUDED_APPS]
+
+# Without sessions there is no session or CSRF handling to do, and
+# REST framework authenticates requests itself
+API_EXCLUDED_MIDDLEWARE = (
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+)
+
+MIDDLEWARE = [m for m in MIDDLEWARE if m not in API_EXCLUDED_MIDDLEWARE]
+
+ROOT_URLCONF = 'taskmanager.urls_api'
+
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    # Session authentication needs the sessions app
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        cls for cls in REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES']
+        if cls != 'rest_framework.authentication.SessionAuthentication'
+    ],
+    # The browsable API needs templates and static files
+    'DEFAULT_RENDERER_CLASSES': ['tasks.renderers.CompactJSONRenderer'],
+}
@@ -0,0 +1,28 @@
+"""
+Settings with a local PostgreSQL database instead of SQLite, mainly to run
+the query plan tests (tasks/query_plans.py) against PostgreSQL's planner.
+
+The connection comes from the usual libpq variables, with local defaults:
+
+    PGDATABASE=taskmanager PGUSER=postgres PGPASSWORD=... PGHOST=localhost PGPORT=5432
+
+Record the PostgreSQL snapshots once, review and commit them, then check
+against them like the SQLite ones:
+
+    QUERY_PLANS_UPDATE=1 DJANGO_SETTINGS_MODULE=taskmanager.settings_postgres python manage.py test tasks.tests.QueryPlanTests
+    DJANGO_SETTINGS_MODULE=taskmanager.settings_postgres python manage.py test tasks.tests.QueryPlanTests
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('PGDATABASE', 'taskmanager'),
+        'USER': os.environ.get('PGUSER', 'postgres'),
+        'PASSWORD': os.environ.get('PGPASSWORD', ''),
+        'HOST': os.environ.get('PGHOST', 'localhost'),
+        'PORT': os.environ.get('PGPORT', '5432'),
+    },
+}
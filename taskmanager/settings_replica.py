@@ -0,0 +1,54 @@
+"""
+Settings with a read replica, for trying out `tasks.routers.ReplicaRouter`
+locally with two SQLite files.
+
+SQLite has no replication, so make the replica a copy of the primary:
+
+    DJANGO_SETTINGS_MODULE=taskmanager.settings_replica python manage.py migrate
+    cp db.sqlite3 db_replica.sqlite3
+    DJANGO_SETTINGS_MODULE=taskmanager.settings_replica python manage.py runserver
+
+Writes only reach db.sqlite3, so reads served from the replica lag behind
+until the file is copied again; that is a handy way to see the
+read-your-writes pinning at work. The same layout works with two local
+PostgreSQL databases by changing the ENGINE/NAME entries below.
+
+The write pins live in a cache every server process can see (a directory
+here; Redis or memcached in production). With the default per-process
+LocMemCache, a client's next read could reach a worker that never saw the
+pin and be served stale rows from the replica.
+
+The rest of the test suite assumes a single database; the replica tests
+are run with:
+
+    DJANGO_SETTINGS_MODULE=taskmanager.settings_replica python manage.py test tasks.tests.ReplicaDatabaseTests
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+DATABASES = {
+    **DATABASES,
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'replica_pins': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'replica_pins',
+    },
+}
+
+DATABASE_ROUTERS = ['tasks.routers.ReplicaRouter']
+
+READ_REPLICAS = {
+    'ALIASES': ['replica'],
+    'STICKY_SECONDS': 5,
+    'HEALTH_CHECK_INTERVAL': 30,
+    'CACHE_ALIAS': 'replica_pins',
+}
@@ -0,0 +1,41 @@
+"""
+Settings with the Task table split over two shards, for trying out
+`tasks.sharding` locally with SQLite files.
+
+Every database gets the full schema; Person rows live on `default` and are
+copied to the shards, Task rows only live on the shards:
+
+    DJANGO_SETTINGS_MODULE=taskmanager.settings_sharded python manage.py migrate
+    DJANGO_SETTINGS_MODULE=taskmanager.settings_sharded python manage.py migrate --database shard0
+    DJANGO_SETTINGS_MODULE=taskmanager.settings_sharded python manage.py migrate --database shard1
+    DJANGO_SETTINGS_MODULE=taskmanager.settings_sharded python manage.py runserver
+
+Persons created before sharding was enabled are not on the shards yet;
+saving each one once copies it over.
+
+The rest of the test suite assumes a single database; the sharding tests
+are run with:
+
+    DJANGO_SETTINGS_MODULE=taskmanager.settings_sharded python manage.py test tasks.tests.ShardingTests
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+DATABASES = {
+    **DATABASES,
+    'shard0': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_shard0.sqlite3',
+    },
+    'shard1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_shard1.sqlite3',
+    },
+}
+
+DATABASE_ROUTERS = ['tasks.sharding.TaskShardRouter']
+
+TASK_SHARDS = {
+    'ALIASES': ['shard0', 'shard1'],
+    'KEY': 'assigned_to',
+}
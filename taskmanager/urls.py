@@ -15,24 +15,31 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-# Schema view for Swagger documentation
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Task Manager API",
-        default_version='v1',
-        description="API for managing tasks",
-        terms_of_service="https://www.example.com/terms/",
-        contact=openapi.Contact(email="contact@example.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+from django.urls import path, re_path, include
+from django.views.decorators.csrf import csrf_exempt
+
+from tasks.views import metrics_view
+
+
+def lazy_schema_view(factory, *args, **kwargs):
+    """
+    Return a view that builds `schema_view.<factory>(*args, **kwargs)` on
+    its first request.
+
+    drf_yasg is slow to import, so the docs views (and the schema cache in
+    taskmanager/schema.py) are only loaded once somebody asks for them.
+    """
+    view = None
+
+    @csrf_exempt
+    def wrapper(request, *view_args, **view_kwargs):
+        nonlocal view
+        if view is None:
+            from .schema import schema_view
+            view = getattr(schema_view, factory)(*args, **kwargs)
+        return view(request, *view_args, **view_kwargs)
+
+    return wrapper
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -40,10 +47,14 @@ urlpatterns = [
     # API endpoints
     path('api/', include('tasks.urls')),
     
+    # Prometheus metrics (see tasks/metrics.py)
+    path('metrics', metrics_view, name='metrics'),
+    
     # API authentication
     path('api-auth/', include('rest_framework.urls')),
     
-    # API documentation
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    # API documentation (Swagger/ReDoc, loaded on first use)
+    re_path(r'^swagger(?P<format>\.json|\.yaml)$', lazy_schema_view('without_ui'), name='schema-json'),
+    path('swagger/', lazy_schema_view('with_ui', 'swagger', cache_timeout=0), name='schema-swagger-ui'),
+    path('redoc/', lazy_schema_view('with_ui', 'redoc', cache_timeout=0), name='schema-redoc'),
 ]
@@ -0,0 +1,17 @@
+"""
+URL configuration for the API-only profile (`taskmanager.settings_api`).
+
+Only the API itself is routed; the admin, the login views of the browsable
+API and the Swagger/ReDoc docs are served by the full URLconf in `urls.py`.
+"""
+from django.urls import path, include
+
+from tasks.views import metrics_view
+
+urlpatterns = [
+    # API endpoints
+    path('api/', include('tasks.urls')),
+
+    # Prometheus metrics (see tasks/metrics.py)
+    path('metrics', metrics_view, name='metrics'),
+]
@@ -0,0 +1,112 @@
+"""
+Archiving of closed tasks.
+
+Completed and cancelled tasks are rarely looked at again, but left in the
+Task table every list, search and count over it has to skip them.
+`archive_tasks()` moves the ones not updated for `AFTER_DAYS` days to the
+ArchivedTask table, `BATCH_SIZE` tasks per transaction: each batch is read
+(oldest first), inserted into the archive and deleted from Task together,
+so a task is always in exactly one of the two tables. Run it with
+`manage.py archive_tasks`, from cron, or as the `archive_tasks` job (see
+tasks/jobs.py), which can queue its own next run.
+
+With sharding enabled a task is archived on its own shard, as every shard
+has the whole schema; the move never spans two databases.
+
+Archived tasks are read-only. List endpoints include them with
+`?include_archived=1` (see `with_archived()`).
+
+Settings (all optional):
+
+    ARCHIVE = {
+        'AFTER_DAYS': 90,     # archive closed tasks not updated for this long
+        'BATCH_SIZE': 1000,   # tasks moved per transaction
+    }
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import sharding, workload
+from .models import ArchivedTask, Task
+from .operations import delete_tasks, task_databases
+
+# Statuses of the tasks that are archived
+STATUSES = ('completed', 'cancelled')
+
+# Fields copied from Task to ArchivedTask
+FIELDS = (
+    'id', 'title', 'description', 'status', 'priority', 'due_date', 'completed',
+    'created_at', 'updated_at', 'assigned_to_id',
+)
+
+
+def get_options():
+    options = {'AFTER_DAYS': 90, 'BATCH_SIZE': 1000}
+    options.update(getattr(settings, 'ARCHIVE', {}))
+    return options
+
+
+def archivable(using, older_than_days=None):
+    """
+    Return the tasks on `using` due for archiving, oldest first.
+    """
+    if older_than_days is None:
+        older_than_days = get_options()['AFTER_DAYS']
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    return Task.objects.using(using).filter(status__in=STATUSES, updated_at__lt=cutoff).order_by('updated_at', 'id')
+
+
+def archive_batch(using, older_than_days, batch_size):
+    """
+    Move up to `batch_size` tasks due for archiving on `using` to the
+    archive, in one transaction. Returns the number moved.
+    """
+    now = timezone.now()
+    with transaction.atomic(using=using):
+        # Locked, so a task reopened meanwhile is not archived as closed
+        rows = list(archivable(using, older_than_days).select_for_update().values(*FIELDS)[:batch_size])
+        if not rows:
+            return 0
+        task_ids = [row['id'] for row in rows]
+        ArchivedTask.objects.using(using).bulk_create([ArchivedTask(archived_at=now, **row) for row in rows])
+        # Cancelled tasks count as open in the workload
+        workload.mark_changed(*{row['assigned_to_id'] for row in rows})
+        # Without signals (one DELETE, not one query per task); the
+        # assignees were flagged above
+        delete_tasks(task_ids, using)
+    return len(rows)
+
+
+def archive_tasks(older_than_days=None, batch_size=None):
+    """
+    Archive every task due for it, a batch per transaction, on every
+    database holding tasks. Returns the number of tasks archived.
+    """
+    batch_size = batch_size or get_options()['BATCH_SIZE']
+    archived = 0
+    for using in task_databases():
+        while True:
+            moved = archive_batch(using, older_than_days, batch_size)
+            archived += moved
+            if moved < batch_size:
+                break
+    return archived
+
+
+def count_archivable(older_than_days=None):
+    return sum(archivable(using, older_than_days).count() for using in task_databases())
+
+
+def with_archived(tasks, archived_tasks):
+    """
+    Return `tasks` and `archived_tasks` (each a queryset or a
+    `ShardedTaskList`, with the same filters and ordering) merged into one
+    `ShardedTaskList`, which paginates like a queryset.
+    """
+    querysets = []
+    for part in (tasks, archived_tasks):
+        querysets.extend(part.querysets if isinstance(part, sharding.ShardedTaskList) else [part])
+    return sharding.ShardedTaskList(querysets)
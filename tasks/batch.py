@@ -0,0 +1,152 @@
+"""
+Batch requests: several API calls in one HTTP round trip.
+
+`POST /api/batch/` takes a list of sub-requests and dispatches each one
+in-process through the URLconf, straight to its view. The middleware stack,
+authentication and the database connection are those of the batch request
+itself, so a screen that needs ten calls pays for them once. Each view still
+checks its own permissions and throttles, and each sub-request is load-shed
+(`LoadSheddingMiddleware`) as if it had been sent alone.
+
+- A batch of reads (GET/HEAD) runs in order, or concurrently in a thread
+  pool with `"concurrent": true`; each thread then uses its own database
+  connection.
+- A batch with any write runs in order inside one transaction on the
+  default database. The first sub-request answering 4xx/5xx rolls the whole
+  batch back; the ones after it are not run and get status 424.
+
+Settings (all optional):
+
+    BATCH = {
+        'MAX_REQUESTS': 20,  # sub-requests per batch
+        'MAX_WORKERS': 4,    # threads for concurrent reads
+    }
+"""
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections, transaction
+from django.urls import Resolver404, get_urlconf, resolve
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+
+from .middleware import shed_response
+
+# Response headers worth passing back to the client
+FORWARDED_HEADERS = ('Location', 'ETag', 'Retry-After', 'Allow')
+
+# Request headers that describe the batch body, not the sub-request's
+STRIPPED_META = ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MATCH')
+
+LOAD_SHEDDING_MIDDLEWARE = 'tasks.middleware.LoadSheddingMiddleware'
+
+
+def get_options():
+    options = {'MAX_REQUESTS': 20, 'MAX_WORKERS': 4}
+    options.update(getattr(settings, 'BATCH', {}))
+    return options
+
+
+def is_read(sub_request):
+    return sub_request['method'] in SAFE_METHODS
+
+
+def build_request(request, sub_request):
+    """
+    Return a Django request for `sub_request` that carries the headers and
+    the authenticated user of the batch `request`.
+    """
+    path, _, query = sub_request['url'].partition('?')
+    body = b''
+    environ = {key: value for key, value in request.META.items() if key not in STRIPPED_META}
+    if sub_request.get('body') is not None:
+        body = json.dumps(sub_request['body']).encode()
+        environ['CONTENT_TYPE'] = 'application/json'
+    environ.update({
+        'REQUEST_METHOD': sub_request['method'],
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    })
+    django_request = WSGIRequest(environ)
+    # Picked up by REST framework's Request in place of the authenticators:
+    # the batch request was authenticated already
+    django_request._force_auth_user = request.user
+    django_request._force_auth_token = request.auth
+    return django_request
+
+
+def dispatch(request, sub_request, urlconf):
+    """
+    Run one sub-request and return `{"status", "headers", "body"}`.
+    """
+    path = sub_request['url'].partition('?')[0]
+    try:
+        match = resolve(path, urlconf=urlconf)
+    except Resolver404:
+        return {'status': status.HTTP_404_NOT_FOUND, 'headers': {}, 'body': {'detail': 'Not found.'}}
+
+    django_request = build_request(request, sub_request)
+    response = None
+    # The middleware only saw the batch itself, a write
+    if LOAD_SHEDDING_MIDDLEWARE in settings.MIDDLEWARE:
+        response = shed_response(django_request, match.func, match.kwargs)
+    if response is None:
+        response = match.func(django_request, *match.args, **match.kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    body = None
+    if response.content:
+        if response.get('Content-Type', '').startswith('application/json'):
+            body = json.loads(response.content)
+        else:
+            body = response.content.decode(response.charset or 'utf-8', errors='replace')
+    headers = {name: response[name] for name in FORWARDED_HEADERS if response.has_header(name)}
+    return {'status': response.status_code, 'headers': headers, 'body': body}
+
+
+def dispatch_in_thread(request, sub_request, urlconf):
+    try:
+        return dispatch(request, sub_request, urlconf)
+    finally:
+        # Connections are per thread; do not leave this one open
+        connections.close_all()
+
+
+def run_batch(request, sub_requests, concurrent=False):
+    """
+    Run `sub_requests` (validated by `BatchRequestSerializer`) and return
+    `(responses, committed)`. `committed` is False when a failing write
+    rolled the batch back.
+    """
+    urlconf = get_urlconf() or settings.ROOT_URLCONF
+    if all(is_read(sub_request) for sub_request in sub_requests):
+        if concurrent and len(sub_requests) > 1:
+            workers = min(get_options()['MAX_WORKERS'], len(sub_requests))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(
+                    lambda sub_request: dispatch_in_thread(request, sub_request, urlconf), sub_requests,
+                )), True
+        return [dispatch(request, sub_request, urlconf) for sub_request in sub_requests], True
+
+    responses = []
+    committed = True
+    with transaction.atomic():
+        for sub_request in sub_requests:
+            if not committed:
+                responses.append({
+                    'status': status.HTTP_424_FAILED_DEPENDENCY,
+                    'headers': {},
+                    'body': {'detail': 'Not run: an earlier request in the batch failed.'},
+                })
+                continue
+            response = dispatch(request, sub_request, urlconf)
+            responses.append(response)
+            if response['status'] >= 400:
+                committed = False
+                transaction.set_rollback(True)
+    return responses, committed
@@ -0,0 +1,311 @@
+"""
+Helpers for importing and exporting Task and Person data in bulk.
+
+Data is exchanged as JSON Lines (one JSON object per line). Because every
+record sits on its own line, an input file can be cut into byte ranges and
+each range parsed and validated by a separate process. Exports are sharded
+by primary-key range in the same way.
+
+These functions are used by the `import_data` and `export_data` management
+commands.
+"""
+import itertools
+import json
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+import django
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router, transaction
+from django.db.models import Max, Min
+
+from .models import Task, Person
+
+# The models that can be imported/exported, by their command-line name
+MODELS = {
+    'task': Task,
+    'person': Person,
+}
+
+# Largest byte range parsed as one piece, which bounds the records held in
+# memory at once however big the file is
+RANGE_BYTES = 4 * 1024 * 1024
+
+# The fields written to (and accepted from) the JSON Lines files.
+# `id` is included so that task assignments survive a round trip.
+FIELDS = {
+    'task': ('id', 'title', 'description', 'status', 'priority', 'due_date', 'completed', 'assigned_to'),
+    'person': ('id', 'name', 'email', 'phone', 'department'),
+}
+
+
+def init_worker():
+    """
+    Initializer for pool processes.
+
+    Forked workers inherit a configured Django, spawned ones do not, so make
+    sure the app registry is ready before any model code runs.
+    """
+    django.setup()
+
+
+def make_pool(workers):
+    """
+    Create a process pool with `workers` processes.
+
+    Database connections are closed first so that no child process inherits
+    (and later tears down) a socket that belongs to the parent.
+    """
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+
+
+def split_byte_ranges(path, parts):
+    """
+    Split the file at `path` into `parts` contiguous (start, end) byte ranges.
+
+    The ranges ignore line boundaries; `parse_range` takes care of assigning
+    every line to exactly one range.
+    """
+    size = os.path.getsize(path)
+    parts = max(1, min(parts, size or 1))
+    bounds = [size * i // parts for i in range(parts + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(parts)]
+
+
+def validate_record(model_name, record):
+    """
+    Validate one decoded record and return the keyword arguments for the model.
+
+    Only field-level validation is done here (types, choices, lengths), since
+    it must run without a database connection. Uniqueness and foreign keys are
+    enforced by the database when the rows are written.
+    """
+    model = MODELS[model_name]
+    unknown = set(record) - set(FIELDS[model_name])
+    if unknown:
+        raise ValidationError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+
+    values = {}
+    for name in FIELDS[model_name]:
+        field = model._meta.get_field(name)
+        if name == 'id':
+            if record.get('id') is not None:
+                values['id'] = field.to_python(record['id'])
+            continue
+        if field.is_relation:
+            # ForeignKey.clean() would look the target up in the database
+            value = record.get(name)
+            values[field.attname] = None if value is None else field.target_field.to_python(value)
+            continue
+        if name not in record:
+            if not field.has_default() and not field.blank:
+                raise ValidationError({name: 'This field is required.'})
+            continue
+        try:
+            values[name] = field.clean(record[name], None)
+        except ValidationError as exc:
+            raise ValidationError({name: exc.messages})
+    return values
+
+
+def parse_range(path, start, end, model_name):
+    """
+    Parse and validate the lines of `path` that start inside [start, end).
+
+    Returns a tuple of (records, errors) where records is a list of validated
+    keyword-argument dicts and errors is a list of (byte_offset, message).
+    """
+    records = []
+    errors = []
+    with open(path, 'rb') as f:
+        if start > 0:
+            # Skip the line that straddles `start`; it belongs to the
+            # previous range. Seeking one byte back keeps a line that begins
+            # exactly at `start`.
+            f.seek(start - 1)
+            f.readline()
+        while True:
+            offset = f.tell()
+            if offset >= end:
+                break
+            line = f.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                records.append(validate_record(model_name, json.loads(line)))
+            except ValueError as exc:
+                errors.append((offset, f'Invalid JSON: {exc}'))
+            except ValidationError as exc:
+                errors.append((offset, '; '.join(exc.messages)))
+    return records, errors
+
+
+def _parse_range_args(args):
+    return parse_range(*args)
+
+
+def ordered_map(pool, func, jobs, ahead):
+    """
+    Yield `func(job)` for each of `jobs`, in order, with at most `ahead` of
+    them submitted to `pool` at a time. Unlike `pool.map()`, which submits
+    everything up front, results are not piled up faster than they are used.
+    """
+    jobs = iter(jobs)
+    pending = deque(pool.submit(func, job) for job in itertools.islice(jobs, ahead))
+    while pending:
+        result = pending.popleft().result()
+        pending.extend(pool.submit(func, job) for job in itertools.islice(jobs, 1))
+        yield result
+
+
+def reset_sequences(model, using):
+    """
+    Move the primary key sequence of `model`'s table past the ids inserted
+    explicitly, so later inserts do not collide with them. Only needed on
+    databases with sequences, such as PostgreSQL; SQLite has no statements.
+    """
+    connection = connections[using]
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def import_file(path, model_name, workers=1, batch_size=1000):
+    """
+    Import the JSON Lines file at `path` into the table for `model_name`.
+
+    The file is cut into byte ranges of at most `RANGE_BYTES`. With more
+    than one worker they are parsed and validated in a process pool, a few
+    ranges ahead of this process, which meanwhile writes the results, in
+    file order, with `bulk_create` in batches of `batch_size`. Only a few
+    ranges are in memory at a time, whatever the size of the file.
+
+    Everything is written in one transaction, rolled back if any line fails
+    validation; the rest of the file is still parsed, to report every error.
+
+    Returns a tuple of (created_count, errors).
+    """
+    model = MODELS[model_name]
+    # A few more ranges than workers keeps the pool busy when line
+    # lengths are uneven.
+    parts = max(workers * 4 if workers > 1 else 1, -(-os.path.getsize(path) // RANGE_BYTES))
+    jobs = [(path, start, end, model_name) for start, end in split_byte_ranges(path, parts)]
+    using = router.db_for_write(model)
+
+    created = 0
+    errors = []
+    explicit_ids = False
+    with ExitStack() as stack:
+        if workers > 1:
+            pool = stack.enter_context(make_pool(workers))
+            results = ordered_map(pool, _parse_range_args, jobs, ahead=workers * 2)
+        else:
+            results = (parse_range(*job) for job in jobs)
+
+        with transaction.atomic(using=using):
+            batch = []
+            for records, range_errors in results:
+                errors.extend(range_errors)
+                if errors:
+                    batch = []
+                    continue
+                for values in records:
+                    explicit_ids = explicit_ids or 'id' in values
+                    batch.append(model(**values))
+                    if len(batch) >= batch_size:
+                        model.objects.bulk_create(batch)
+                        created += len(batch)
+                        batch = []
+            if errors:
+                transaction.set_rollback(True, using=using)
+                return 0, errors
+            if batch:
+                model.objects.bulk_create(batch)
+                created += len(batch)
+            if explicit_ids:
+                reset_sequences(model, using)
+    return created, []
+
+
+def pk_ranges(model_name, parts):
+    """
+    Split the primary keys of the table for `model_name` into `parts`
+    inclusive (low, high) ranges of roughly equal width.
+    """
+    bounds = MODELS[model_name].objects.aggregate(low=Min('pk'), high=Max('pk'))
+    low, high = bounds['low'], bounds['high']
+    if low is None:
+        return []
+    parts = max(1, min(parts, high - low + 1))
+    step = (high - low + 1) / parts
+    edges = [low + int(step * i) for i in range(parts)] + [high + 1]
+    return [(edges[i], edges[i + 1] - 1) for i in range(parts)]
+
+
+def export_range(model_name, low, high, out_path):
+    """
+    Write the rows with `low <= pk <= high` to `out_path` as JSON Lines,
+    in primary-key order. Returns the number of rows written.
+    """
+    model = MODELS[model_name]
+    names = FIELDS[model_name]
+    columns = [model._meta.get_field(name).attname for name in names]
+    rows = (
+        model.objects.filter(pk__gte=low, pk__lte=high)
+        .order_by('pk')
+        .values_list(*columns)
+        .iterator(chunk_size=2000)
+    )
+    count = 0
+    with open(out_path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder))
+            f.write('\n')
+            count += 1
+    return count
+
+
+def _export_range_args(args):
+    try:
+        return export_range(*args)
+    finally:
+        connections.close_all()
+
+
+def export_file(path, model_name, workers=1):
+    """
+    Export the table for `model_name` to the JSON Lines file at `path`.
+
+    With more than one worker, each process exports one primary-key range to
+    a part file, and the parts are concatenated in order afterwards.
+
+    Returns the number of rows written.
+    """
+    ranges = pk_ranges(model_name, workers)
+    if workers <= 1 or len(ranges) <= 1:
+        low, high = ranges[0] if ranges else (0, -1)
+        return export_range(model_name, low, high, path)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jobs = [
+            (model_name, low, high, os.path.join(tmp_dir, f'part-{i:05d}.jsonl'))
+            for i, (low, high) in enumerate(ranges)
+        ]
+        with make_pool(workers) as pool:
+            count = sum(pool.map(_export_range_args, jobs))
+        with open(path, 'wb') as out:
+            for job in jobs:
+                with open(job[3], 'rb') as part:
+                    shutil.copyfileobj(part, out)
+    return count
@@ -0,0 +1,179 @@
+"""
+Small per-process caches.
+
+`TTLCache` is a generic size-bounded LRU cache with a time-to-live. The rest
+of this module is a cache of Person identity data built on it.
+
+Assignment endpoints and profile validation only need a person's id, name and
+email, and they need them on every request. This module keeps those three
+values in a size-bounded LRU cache with a time-to-live, so the hot paths can
+skip a database round trip.
+
+Entries are evicted when a Person is saved or deleted (see `tasks/signals.py`).
+Changes made in other processes, or through `QuerySet.update()`, are only
+picked up when an entry expires, so the cache is never the final word on
+uniqueness: the database constraint on `Person.email` still is.
+
+Settings (all optional):
+
+    PERSON_CACHE = {
+        'MAX_SIZE': 1024,  # maximum number of persons kept
+        'TTL': 60,         # seconds before an entry must be re-read
+    }
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+from .metrics import register_cache
+from .models import Person
+
+PersonIdentity = namedtuple('PersonIdentity', ['id', 'name', 'email'])
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    `get()` returns `default` for missing and expired keys and counts hits
+    and misses so callers can expose them for tuning.
+    """
+    def __init__(self, max_size=1024, ttl=60, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        # key -> (expires_at, value), least recently used first
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self.clock() + self.ttl, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        """
+        Drop every entry whose value satisfies `predicate`.
+        """
+        with self._lock:
+            for key in [key for key, (_, value) in self._entries.items() if predicate(value)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class PersonCache:
+    """
+    Thread-safe LRU cache of `PersonIdentity` tuples, looked up by id or email.
+
+    Identities are kept by id in one `TTLCache`, whose counters are the
+    cache's stats. A second one maps emails to ids; an email entry left
+    behind by an evicted or changed identity is caught by checking the
+    identity's email.
+    """
+    def __init__(self, max_size=1024, ttl=60, clock=time.monotonic):
+        self._identities = TTLCache(max_size=max_size, ttl=ttl, clock=clock)
+        self._ids_by_email = TTLCache(max_size=max_size, ttl=ttl, clock=clock)
+
+    def get(self, person_id):
+        """
+        Return the identity of the person with `person_id`, or None if there
+        is no such person.
+        """
+        identity = self._identities.get(person_id)
+        if identity is not None:
+            return identity
+        row = Person.objects.filter(pk=person_id).values_list('id', 'name', 'email').first()
+        return self._store(row)
+
+    def get_by_email(self, email):
+        """
+        Return the identity of the person using `email`, or None if the email
+        is not in use.
+        """
+        # An unknown email (id None) is counted as a miss like any other
+        identity = self._identities.get(self._ids_by_email.get(email))
+        if identity is not None and identity.email == email:
+            return identity
+        row = Person.objects.filter(email=email).values_list('id', 'name', 'email').first()
+        return self._store(row)
+
+    def evict(self, person_id):
+        """
+        Drop the entry for `person_id`, if any.
+        """
+        self._identities.delete(person_id)
+
+    def clear(self):
+        """
+        Drop every entry and reset the counters.
+        """
+        self._identities.clear()
+        self._ids_by_email.clear()
+
+    def stats(self):
+        """
+        Return the hit/miss counters and current size, for tuning.
+        """
+        return self._identities.stats()
+
+    def _store(self, row):
+        if row is None:
+            return None
+        identity = PersonIdentity(*row)
+        self._identities.set(identity.id, identity)
+        self._ids_by_email.set(identity.email, identity.id)
+        return identity
+
+
+def _build_person_cache():
+    options = getattr(settings, 'PERSON_CACHE', {})
+    return PersonCache(
+        max_size=options.get('MAX_SIZE', 1024),
+        ttl=options.get('TTL', 60),
+    )
+
+
+# The cache shared by everything in this process
+person_cache = _build_person_cache()
+register_cache('person', person_cache)
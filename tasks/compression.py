@@ -0,0 +1,162 @@
+"""
+Response compression with content negotiation.
+
+`CompressionMiddleware` (tasks/middleware.py) picks the encoding the client
+prefers from its Accept-Encoding header among the ones available here:
+
+- `gzip`, always;
+- `br`, when the `brotli` package is installed;
+- `zstd`, when the `zstandard` package is installed.
+
+When the client's preferences tie, the server order below (zstd, br, gzip)
+decides: both compress JSON better than gzip for the same CPU time.
+
+Settings (all optional):
+
+    COMPRESSION = {
+        'MIN_SIZE': 1024,  # smaller bodies are sent as they are
+        'LEVELS': {'gzip': 6, 'br': 4, 'zstd': 3},
+        'CONTENT_TYPES': ['application/json', 'application/yaml', 'application/openapi', 'text/'],
+        'CACHE_SIZE': 64,  # compressed bodies of ETagged responses kept
+    }
+"""
+import gzip
+import zlib
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def get_options():
+    options = {
+        'MIN_SIZE': 1024,
+        'CONTENT_TYPES': ['application/json', 'application/yaml', 'application/openapi', 'text/'],
+        'CACHE_SIZE': 64,
+    }
+    options.update(getattr(settings, 'COMPRESSION', {}))
+    options['LEVELS'] = {'gzip': 6, 'br': 4, 'zstd': 3, **options.get('LEVELS', {})}
+    return options
+
+
+class GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        # mtime=0 keeps the output (and so cached copies) stable
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def stream(self, chunks):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            # Flush per chunk so each one reaches the client without waiting
+            # for the next (streamed responses are often slow to produce)
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class BrotliEncoder:
+    name = 'br'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def stream(self, chunks):
+        compressor = brotli.Compressor(quality=self.level)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class ZstdEncoder:
+    name = 'zstd'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def stream(self, chunks):
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def available_encoders():
+    """
+    Return the encoder classes usable here, in server preference order.
+    """
+    encoders = []
+    if zstandard is not None:
+        encoders.append(ZstdEncoder)
+    if brotli is not None:
+        encoders.append(BrotliEncoder)
+    encoders.append(GzipEncoder)
+    return encoders
+
+
+def parse_accept_encoding(header):
+    """
+    Return {coding: q} from an Accept-Encoding header value.
+    """
+    preferences = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        preferences[coding] = q
+    return preferences
+
+
+def choose_encoder(accept_encoding):
+    """
+    Return an encoder instance for the best coding the client accepts, or
+    None to send the body uncompressed.
+    """
+    preferences = parse_accept_encoding(accept_encoding)
+    wildcard = preferences.get('*', 0.0)
+    best, best_q = None, 0.0
+    for encoder_class in available_encoders():
+        q = preferences.get(encoder_class.name, wildcard)
+        if q > best_q:
+            best, best_q = encoder_class, q
+    if best is None:
+        return None
+    return best(get_options()['LEVELS'][best.name])
+
+
+def is_compressible(content_type):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    return any(content_type.startswith(prefix) for prefix in get_options()['CONTENT_TYPES'])
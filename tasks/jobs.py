@@ -0,0 +1,373 @@
+"""
+A small database-backed job queue.
+
+Slow operations (bulk reassignment, exports, statistics, archiving, sample
+data) are submitted through `POST /api/jobs/` and answered with 202 Accepted
+right away. The work is done by `manage.py run_worker`, in processes
+separate from the ones serving the API, and clients poll `GET
+/api/jobs/{id}/` for the status and result.
+
+A job is a row in the `Job` table. Workers claim a queued job with a
+conditional UPDATE (status `queued` -> `running`), which only one worker can
+win, so no locking beyond what every database supports is needed. A failed
+job is retried with exponential backoff until it has run `max_attempts`
+times. A job whose worker died is put back in the queue once its lease
+(`LEASE_SECONDS`) has expired.
+
+Each kind of job is a function registered with `@register`, taking the
+validated payload and returning a JSON-serializable result.
+
+Settings (all optional):
+
+    JOBS = {
+        'MAX_ATTEMPTS': 3,        # runs before a job is marked failed
+        'RETRY_DELAY': 10,        # seconds before the first retry; doubles after
+        'LEASE_SECONDS': 600,     # a running job older than this is requeued
+        'POLL_INTERVAL': 1,       # seconds a worker sleeps when the queue is empty
+        'CONCURRENCY': {          # maximum jobs of a kind running at once
+            'export': 2,
+        },
+        'EXPORT_DIR': BASE_DIR / 'exports',
+    }
+
+The concurrency limits are checked when a job is claimed, so two workers
+claiming at the very same moment can briefly exceed them by one.
+"""
+import os
+import socket
+import time
+import traceback
+from collections import namedtuple
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import sharding
+from .archive import archive_tasks
+from .bulk_io import MODELS, export_file
+from .models import Job, Person, Task
+from .workload import refresh_workload
+
+JobKind = namedtuple('JobKind', ['handler', 'payload_serializer'])
+
+# Job kind name -> JobKind, filled by @register
+JOB_KINDS = {}
+
+
+def get_options():
+    options = {
+        'MAX_ATTEMPTS': 3,
+        'RETRY_DELAY': 10,
+        'LEASE_SECONDS': 600,
+        'POLL_INTERVAL': 1,
+        'CONCURRENCY': {},
+        'EXPORT_DIR': Path(settings.BASE_DIR) / 'exports',
+    }
+    options.update(getattr(settings, 'JOBS', {}))
+    return options
+
+
+def register(kind, payload_serializer=None):
+    """
+    Register the decorated function as the handler of jobs of `kind`.
+
+    `payload_serializer` is a REST framework serializer class used to
+    validate the payload when the job is submitted.
+    """
+    def decorator(handler):
+        JOB_KINDS[kind] = JobKind(handler, payload_serializer)
+        return handler
+    return decorator
+
+
+def enqueue(kind, payload=None, user=None, max_attempts=None):
+    """
+    Add a job to the queue and return it. The payload is not validated.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        created_by=user,
+        max_attempts=max_attempts or get_options()['MAX_ATTEMPTS'],
+    )
+
+
+def requeue_expired(now=None):
+    """
+    Put running jobs whose lease has expired back in the queue (or fail
+    them if they are out of attempts). Returns the number of jobs changed.
+    """
+    now = now or timezone.now()
+    expired = Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=now - timedelta(seconds=get_options()['LEASE_SECONDS']),
+    )
+    failed = expired.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, error='Worker lost', locked_by='', finished_at=now,
+    )
+    requeued = expired.update(status=Job.QUEUED, locked_by='', locked_at=None, run_after=now)
+    return failed + requeued
+
+
+def claim_job(worker_id, now=None):
+    """
+    Claim the next runnable job for `worker_id` and return it, or None when
+    there is nothing to do (or every runnable kind is at its limit).
+    """
+    now = now or timezone.now()
+    limits = get_options()['CONCURRENCY']
+    full = []
+    if limits:
+        running = dict(
+            Job.objects.filter(status=Job.RUNNING, kind__in=list(limits))
+            .values_list('kind').annotate(count=Count('id'))
+        )
+        full = [kind for kind, limit in limits.items() if running.get(kind, 0) >= limit]
+
+    candidates = (
+        Job.objects.filter(status=Job.QUEUED, run_after__lte=now)
+        .exclude(kind__in=full)
+        .order_by('run_after', 'id')
+        .values_list('id', flat=True)
+    )
+    for job_id in candidates[:10]:
+        # Only one worker can move the job out of `queued`
+        claimed = Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def run_job(job):
+    """
+    Run a claimed job and record its result, or schedule a retry.
+    """
+    options = get_options()
+    try:
+        kind = JOB_KINDS[job.kind]
+        result = kind.handler(job.payload)
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            delay = options['RETRY_DELAY'] * 2 ** (job.attempts - 1)
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.SUCCEEDED
+        job.result = result
+        job.error = ''
+        job.finished_at = timezone.now()
+    job.locked_by = ''
+    job.locked_at = None
+    # Only touch the row if this worker still holds it (its lease may have
+    # expired and the job been handed to another worker)
+    Job.objects.filter(pk=job.pk, status=Job.RUNNING, attempts=job.attempts).update(
+        status=job.status,
+        result=job.result,
+        error=job.error,
+        run_after=job.run_after,
+        locked_by='',
+        locked_at=None,
+        finished_at=job.finished_at,
+        updated_at=timezone.now(),
+    )
+    return job
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class Worker:
+    """
+    Claim and run jobs one at a time until stopped.
+
+    With `burst=True` the worker returns as soon as the queue is empty,
+    which is handy in tests and cron jobs.
+    """
+    def __init__(self, worker_id=None, poll_interval=None, sleep=time.sleep):
+        self.worker_id = worker_id or default_worker_id()
+        self.poll_interval = poll_interval if poll_interval is not None else get_options()['POLL_INTERVAL']
+        self.sleep = sleep
+        self.stopped = False
+
+    def run(self, burst=False, max_jobs=None):
+        """
+        Process jobs; returns the number of jobs run.
+        """
+        processed = 0
+        while not self.stopped and (max_jobs is None or processed < max_jobs):
+            requeue_expired()
+            job = claim_job(self.worker_id)
+            if job is None:
+                if burst:
+                    break
+                self.sleep(self.poll_interval)
+                continue
+            run_job(job)
+            processed += 1
+        return processed
+
+    def stop(self):
+        self.stopped = True
+
+
+def run_worker_process(index, burst=False):
+    """
+    Entry point of the processes started by `run_worker --processes`.
+    """
+    worker = Worker(worker_id=f'{default_worker_id()}-{index}')
+    try:
+        return worker.run(burst=burst)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        connections.close_all()
+
+
+# Job kinds
+
+class BulkReassignPayloadSerializer(serializers.Serializer):
+    task_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=10000)
+    # null unassigns the tasks
+    person_id = serializers.IntegerField(allow_null=True)
+
+    def validate_person_id(self, value):
+        if value is not None and not Person.objects.filter(pk=value).exists():
+            raise serializers.ValidationError(f'Person with id {value} does not exist')
+        return value
+
+
+@register('bulk_reassign', BulkReassignPayloadSerializer)
+def bulk_reassign(payload):
+    """
+    Assign (or unassign, with `person_id` null) many tasks at once.
+    """
+    task_ids = set(payload['task_ids'])
+    updated = 0
+    for task in sharding.sharded(Task.objects.filter(pk__in=task_ids)):
+        task_ids.discard(task.pk)
+        if task.assigned_to_id == payload['person_id']:
+            continue
+        task.assigned_to_id = payload['person_id']
+        # save() rather than update() so signals run and tasks change shard
+        with transaction.atomic(using=router.db_for_write(Task, instance=task)):
+            task.save()
+        updated += 1
+    return {'updated': updated, 'missing': sorted(task_ids)}
+
+
+class ExportPayloadSerializer(serializers.Serializer):
+    model = serializers.ChoiceField(choices=sorted(MODELS))
+
+
+@register('export', ExportPayloadSerializer)
+def export(payload):
+    """
+    Export a table to a JSON Lines file in EXPORT_DIR.
+    """
+    export_dir = Path(get_options()['EXPORT_DIR'])
+    export_dir.mkdir(parents=True, exist_ok=True)
+    path = export_dir / f'{payload["model"]}-{timezone.now():%Y%m%d-%H%M%S-%f}.jsonl'
+    count = export_file(str(path), payload['model'])
+    return {'path': str(path), 'count': count}
+
+
+@register('rebuild_stats')
+def rebuild_stats(payload):
+    """
+    Count tasks by status and by assignee.
+    """
+    by_status = {}
+    by_assignee = {}
+    for queryset in sharding.per_shard(Task.objects.order_by()):
+        for row in queryset.values('status').annotate(count=Count('id')):
+            by_status[row['status']] = by_status.get(row['status'], 0) + row['count']
+        for row in queryset.values('assigned_to').annotate(
+            count=Count('id'), open=Count('id', filter=Q(completed=False)),
+        ):
+            totals = by_assignee.setdefault(row['assigned_to'], {'count': 0, 'open': 0})
+            totals['count'] += row['count']
+            totals['open'] += row['open']
+    return {
+        'by_status': by_status,
+        # JSON object keys are strings; "null" holds the unassigned tasks
+        'by_assignee': {str(key) if key is not None else 'null': value for key, value in by_assignee.items()},
+        'total': sum(by_status.values()),
+    }
+
+
+@register('refresh_workload')
+def refresh_all_workload(payload):
+    """
+    Recompute every row of the materialized workload.
+    """
+    return {'refreshed': refresh_workload()}
+
+
+class ArchivePayloadSerializer(serializers.Serializer):
+    # Defaults from the ARCHIVE setting (see tasks/archive.py)
+    older_than_days = serializers.IntegerField(min_value=0, required=False)
+    batch_size = serializers.IntegerField(min_value=1, max_value=10000, required=False)
+    # Queue the next run this many hours after this one succeeds
+    repeat_hours = serializers.IntegerField(min_value=1, required=False)
+
+
+@register('archive_tasks', ArchivePayloadSerializer)
+def archive_closed_tasks(payload):
+    """
+    Move old completed and cancelled tasks to the archive table, and queue
+    the next run when `repeat_hours` is given.
+    """
+    result = {'archived': archive_tasks(payload.get('older_than_days'), payload.get('batch_size'))}
+    if payload.get('repeat_hours'):
+        next_job = Job.objects.create(
+            kind='archive_tasks',
+            payload=payload,
+            max_attempts=get_options()['MAX_ATTEMPTS'],
+            run_after=timezone.now() + timedelta(hours=payload['repeat_hours']),
+        )
+        result['next_job'] = next_job.pk
+    return result
+
+
+class SampleDataPayloadSerializer(serializers.Serializer):
+    count = serializers.IntegerField(min_value=1, max_value=10000, default=100)
+
+
+@register('sample_data', SampleDataPayloadSerializer)
+def sample_data(payload):
+    """
+    Create `count` sample tasks (without deleting anything, unlike
+    create_sample_data.py).
+    """
+    statuses = [choice for choice, _ in Task.STATUS_CHOICES]
+    today = timezone.now().date()
+    created = 0
+    for i in range(payload['count']):
+        status = statuses[i % len(statuses)]
+        Task.objects.create(
+            title=f'Sample task {i + 1}',
+            description='Generated sample data',
+            status=status,
+            priority=i % 5 + 1,
+            due_date=today + timedelta(days=i % 30),
+            completed=status == 'completed',
+        )
+        created += 1
+    return {'created': created}
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from tasks.archive import archive_tasks, count_archivable, get_options
+
+
+class Command(BaseCommand):
+    """
+    Move completed and cancelled tasks not updated for a while to the
+    archive table, in batches (see tasks/archive.py).
+
+    Run it periodically, e.g. nightly from cron, or queue the
+    `archive_tasks` job with `repeat_hours` to have the worker do it.
+
+    Example:
+        python manage.py archive_tasks --dry-run
+        python manage.py archive_tasks --older-than-days 30 --batch-size 500
+    """
+    help = 'Archive old completed and cancelled tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int,
+            help=f'Archive tasks not updated for this many days (default: {get_options()["AFTER_DAYS"]})',
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            help=f'Tasks moved per transaction (default: {get_options()["BATCH_SIZE"]})',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the tasks that would be archived',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = count_archivable(options['older_than_days'])
+            self.stdout.write(f'{count} task(s) would be archived')
+            return
+
+        count = archive_tasks(options['older_than_days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {count} task(s)'))
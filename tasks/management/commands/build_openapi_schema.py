@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from taskmanager.schema import get_options, write_artifacts
+
+
+class Command(BaseCommand):
+    """
+    Precompute the OpenAPI schema into static files.
+
+    Run this once per deploy; the schema views serve these files instead of
+    introspecting the API, as long as the code has not changed since.
+
+    Example:
+        python manage.py build_openapi_schema
+    """
+    help = 'Write the OpenAPI schema (JSON and YAML) to OPENAPI_SCHEMA["ARTIFACT_DIR"]'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output-dir',
+            help='Directory to write to (defaults to OPENAPI_SCHEMA["ARTIFACT_DIR"])',
+        )
+
+    def handle(self, *args, **options):
+        output_dir = options['output_dir'] or get_options()['ARTIFACT_DIR']
+        for path in write_artifacts(output_dir):
+            self.stdout.write(f'Wrote {path}')
+        self.stdout.write(self.style.SUCCESS('OpenAPI schema built'))
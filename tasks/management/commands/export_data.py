@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.bulk_io import MODELS, export_file
+
+
+class Command(BaseCommand):
+    """
+    Export Task or Person records to a JSON Lines file.
+
+    Example:
+        python manage.py export_data tasks.jsonl --model task --workers 4
+    """
+    help = 'Export tasks or persons to a JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSON Lines file to write')
+        parser.add_argument('--model', choices=sorted(MODELS), default='task')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of processes, each exporting one primary-key range',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        count = export_file(options['path'], options['model'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f'Exported {count} {options["model"]} record(s)'))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.bulk_io import MODELS, import_file
+
+
+class Command(BaseCommand):
+    """
+    Import Task or Person records from a JSON Lines file.
+
+    Example:
+        python manage.py import_data tasks.jsonl --model task --workers 4
+    """
+    help = 'Import tasks or persons from a JSON Lines file'
+
+    # How many validation errors to print before giving up on the rest
+    max_errors_shown = 20
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSON Lines file to read')
+        parser.add_argument('--model', choices=sorted(MODELS), default='task')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of processes used to parse and validate the file',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows written per bulk_create call',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        created, errors = import_file(
+            options['path'],
+            options['model'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+        )
+
+        if errors:
+            for offset, message in errors[:self.max_errors_shown]:
+                self.stderr.write(f'byte {offset}: {message}')
+            raise CommandError(f'{len(errors)} invalid record(s); nothing was imported')
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {created} {options["model"]} record(s)'))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.profiling import list_profiles, profile_dir, summarize
+
+
+class Command(BaseCommand):
+    """
+    List the stored request profiles, slowest first, or summarize one
+    (see tasks/profiling.py).
+
+    The summary shows the functions under tasks/ (views, serializers,
+    renderers, ...) by default; `--all` shows Django's and the standard
+    library's too.
+
+    Example:
+        python manage.py profiles --limit 10 --path /api/persons/
+        python manage.py profiles 20240101T120000000000-4242-0 --sort tottime
+    """
+    help = 'List the slowest request profiles, or summarize one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile_id', nargs='?', help='Profile to summarize')
+        parser.add_argument('--limit', type=int, default=20, help='Profiles, or functions, to show (default: 20)')
+        parser.add_argument('--path', help='Only list profiles of request paths containing this')
+        parser.add_argument(
+            '--sort', default='cumulative',
+            help='pstats sort key for the summary: cumulative, tottime, ncalls... (default: cumulative)',
+        )
+        parser.add_argument('--all', action='store_true', help='Summarize every function, not only those under tasks/')
+
+    def handle(self, *args, **options):
+        if options['profile_id']:
+            try:
+                report = summarize(
+                    options['profile_id'],
+                    sort=options['sort'],
+                    limit=options['limit'],
+                    restrict=None if options['all'] else r'[/\\]tasks[/\\]',
+                )
+            except FileNotFoundError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(report)
+            return
+
+        profiles = list_profiles()
+        if options['path']:
+            profiles = [profile for profile in profiles if options['path'] in profile['path']]
+        if not profiles:
+            self.stdout.write(f'No profiles in {profile_dir()}')
+            return
+        for profile in profiles[:options['limit']]:
+            queries = '-' if profile['db_queries'] is None else profile['db_queries']
+            self.stdout.write(
+                f"{profile['duration_ms']:>10.1f} ms  {queries:>4} queries  {profile['status']}  "
+                f"{profile['method']} {profile['path']}  {profile['view']}  {profile['user']}  {profile['id']}"
+            )
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from tasks.purge import count_deleted, get_options, purge_deleted
+
+
+class Command(BaseCommand):
+    """
+    Delete soft-deleted tasks and persons for good, unassigning the tasks of
+    deleted persons first, in bounded batches (see tasks/purge.py).
+
+    Run it periodically, e.g. nightly from cron.
+
+    Example:
+        python manage.py purge_deleted --dry-run
+        python manage.py purge_deleted --after-hours 0 --batch-size 500
+    """
+    help = 'Purge soft-deleted tasks and persons'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--after-hours', type=int,
+            help=f'Only purge rows deleted at least this many hours ago (default: {get_options()["AFTER_HOURS"]})',
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            help=f'Rows deleted or unassigned per statement (default: {get_options()["BATCH_SIZE"]})',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the rows that would be purged',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            counts = count_deleted(options['after_hours'])
+            self.stdout.write(f'{counts["tasks"]} task(s) and {counts["persons"]} person(s) would be purged')
+            return
+
+        counts = purge_deleted(options['after_hours'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {counts["tasks"]} task(s) and {counts["persons"]} person(s); '
+            f'unassigned {counts["unassigned"]} task(s)'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from tasks.workload import refresh_stale, refresh_workload
+
+
+class Command(BaseCommand):
+    """
+    Recompute the materialized per-person workload (see tasks/workload.py).
+
+    Run it periodically, e.g. nightly, so overdue counts follow the date and
+    changes made without signals (QuerySet.update, bulk imports) show up.
+
+    Example:
+        python manage.py refresh_workload
+    """
+    help = 'Recompute the per-person workload summary'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale-only', action='store_true',
+            help='Only recompute rows that changed since they were computed',
+        )
+
+    def handle(self, *args, **options):
+        count = refresh_stale() if options['stale_only'] else refresh_workload()
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {count} workload row(s)'))
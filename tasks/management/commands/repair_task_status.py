@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from tasks.models import Task
+from tasks.operations import repair_completed, task_databases
+from tasks.workload import refresh_workload
+
+
+class Command(BaseCommand):
+    """
+    Make the `completed` flag and the `status` of every task agree again
+    (see tasks/operations.py), with set-based UPDATEs rather than saving
+    each task.
+
+    Example:
+        python manage.py repair_task_status --dry-run
+        python manage.py repair_task_status --source completed
+    """
+    help = 'Repair tasks whose completed flag and status disagree'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', choices=['status', 'completed'], default='status',
+            help='Field that wins when the two disagree (default: status)',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the tasks that would change',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = sum(
+                Task.objects.using(alias).filter(status='completed', completed=False).count()
+                + Task.objects.using(alias).exclude(status='completed').filter(completed=True).count()
+                for alias in task_databases()
+            )
+            self.stdout.write(f'{count} task(s) have a completed flag that disagrees with their status')
+            return
+
+        count = repair_completed(options['source'])
+        if count:
+            # The open/overdue counts follow the completed flag
+            refresh_workload()
+        self.stdout.write(self.style.SUCCESS(f'Repaired {count} task(s)'))
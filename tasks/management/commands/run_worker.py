@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.bulk_io import make_pool
+from tasks.jobs import Worker, run_worker_process
+
+
+class Command(BaseCommand):
+    """
+    Run background jobs from the job queue (see tasks/jobs.py).
+
+    Example:
+        python manage.py run_worker --processes 4
+    """
+    help = 'Run queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Number of worker processes; each runs one job at a time',
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once the queue is empty instead of waiting for new jobs',
+        )
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        if processes < 1:
+            raise CommandError('--processes must be at least 1')
+
+        if processes == 1:
+            try:
+                processed = Worker().run(burst=options['burst'])
+            except KeyboardInterrupt:
+                return
+        else:
+            with make_pool(processes) as pool:
+                futures = [
+                    pool.submit(run_worker_process, index, options['burst'])
+                    for index in range(processes)
+                ]
+                processed = sum(future.result() for future in futures)
+
+        self.stdout.write(self.style.SUCCESS(f'Ran {processed} job(s)'))
@@ -0,0 +1,387 @@
+"""
+Request metrics in the Prometheus text format, served at `/metrics`.
+
+`MetricsMiddleware` (tasks/middleware.py) measures every request and labels
+it with the view and viewset action that served it (`TaskViewSet.list`,
+`PersonViewSet.assign_task`, ...):
+
+- `api_requests_total` and `api_request_duration_seconds`;
+- the database queries of the request and the time they took;
+- the time spent in serializers (`TimedSerializerMixin`) and renderers
+  (`CompactJSONRenderer`), counted through `stage()`;
+- the page number of paginated lists (`record_page()`).
+
+Caches registered with `register_cache()` are exported as hit and miss
+counters; their hit ratio is hits / (hits + misses).
+
+Each process keeps its metrics in memory. A request only takes the
+process's lock once, at its end, to add its observations. Processes of a
+pre-fork server do not share memory, so with `DIR` set each one writes a
+snapshot of its metrics to `DIR/metrics-<pid>.json` at most every
+`FLUSH_INTERVAL` seconds (replacing the file atomically), and `/metrics` adds
+up the snapshots of every process. Without `DIR` (a single process, e.g.
+runserver) it shows the metrics of the process serving it. Empty `DIR`
+when the server starts, like any other per-run state.
+
+Settings (all optional):
+
+    METRICS = {
+        'ENABLED': True,
+        'DIR': None,            # shared directory, for several processes
+        'FLUSH_INTERVAL': 1.0,  # seconds between snapshots to DIR
+    }
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+
+# `kind` is "counter" or "histogram"; `buckets` are the histogram's upper bounds
+Metric = namedtuple('Metric', ['kind', 'help', 'buckets'])
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'api_requests_total': Metric('counter', 'Requests by view, method and status.', None),
+    'api_request_duration_seconds': Metric('histogram', 'Time to serve a request.', LATENCY_BUCKETS),
+    'api_db_queries': Metric('histogram', 'Database queries per request.', (0, 1, 2, 3, 5, 10, 20, 50, 100)),
+    'api_db_duration_seconds': Metric('histogram', 'Time spent in database queries per request.', LATENCY_BUCKETS),
+    'api_serializer_duration_seconds': Metric('histogram', 'Time spent in serializers per request.', LATENCY_BUCKETS),
+    'api_render_duration_seconds': Metric('histogram', 'Time spent rendering the response body.', LATENCY_BUCKETS),
+    'api_page_number': Metric('histogram', 'Page number requested from paginated lists.', (1, 2, 3, 5, 10, 20, 50, 100, 1000)),
+    'api_cache_hits_total': Metric('counter', 'Cache lookups that found an entry.', None),
+    'api_cache_misses_total': Metric('counter', 'Cache lookups that found nothing.', None),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Name -> cache with a `stats()` dict holding 'hits' and 'misses'
+CACHES = {}
+
+# The `RequestMetrics` of the request being served in this context
+_current = ContextVar('request_metrics', default=None)
+
+
+def get_options():
+    options = {'ENABLED': True, 'DIR': None, 'FLUSH_INTERVAL': 1.0}
+    options.update(getattr(settings, 'METRICS', {}))
+    return options
+
+
+def register_cache(name, cache):
+    """
+    Export the hits and misses of `cache` (anything with TTLCache's
+    `stats()`) under `name`.
+    """
+    CACHES[name] = cache
+
+
+class RequestMetrics:
+    """
+    What one request measured, added to the registry when it ends.
+    """
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.stages = {}
+        self.page = None
+        self._active = set()
+
+    def record_query(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper counting the request's queries.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_seconds += time.perf_counter() - start
+
+
+@contextmanager
+def measure_request():
+    """
+    Make a new `RequestMetrics` current for the duration of the block.
+    """
+    request_metrics = RequestMetrics()
+    token = _current.set(request_metrics)
+    try:
+        yield request_metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """
+    Add the time spent in the block to the current request's `name` stage.
+    Nested blocks of the same stage are only counted once.
+    """
+    request_metrics = _current.get()
+    if request_metrics is None or name in request_metrics._active:
+        yield
+        return
+    request_metrics._active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics._active.discard(name)
+        request_metrics.stages[name] = request_metrics.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def current_request():
+    """
+    Return the `RequestMetrics` of the request being served, or None.
+    """
+    return _current.get()
+
+
+def record_page(number):
+    """
+    Note the page number the current request asked for.
+    """
+    request_metrics = _current.get()
+    if request_metrics is not None:
+        request_metrics.page = number
+
+
+def add(values, name, labels, value):
+    """
+    Count `value` in the series `labels` (a tuple of (name, value) pairs) of
+    metric `name` in `values`.
+    """
+    metric = METRICS[name]
+    series = values.setdefault(name, {})
+    if metric.kind == 'counter':
+        series[labels] = series.get(labels, 0) + value
+        return
+    # Histograms: a count per bucket (not cumulative), then sum and count
+    histogram = series.get(labels)
+    if histogram is None:
+        histogram = series[labels] = [0] * len(metric.buckets) + [0.0, 0]
+    index = bisect.bisect_left(metric.buckets, value)
+    if index < len(metric.buckets):
+        histogram[index] += 1
+    histogram[-2] += value
+    histogram[-1] += 1
+
+
+def merge(values, other):
+    """
+    Add the metrics `other` into `values`.
+    """
+    for name, series in other.items():
+        if name not in METRICS:
+            continue
+        target = values.setdefault(name, {})
+        for labels, value in series.items():
+            if labels not in target:
+                target[labels] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                target[labels] = [mine + theirs for mine, theirs in zip(target[labels], value)]
+            else:
+                target[labels] += value
+
+
+class Registry:
+    """
+    The metrics of this process.
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._values = {}
+        self._flushed_at = None
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._flushed_at = None
+
+    def observe(self, observations):
+        """
+        Add `observations`, a list of (name, labels, value), in one go.
+        """
+        with self._lock:
+            for name, labels, value in observations:
+                add(self._values, name, labels, value)
+
+    def snapshot(self):
+        """
+        Return a copy of this process's metrics, the caches included.
+        """
+        with self._lock:
+            values = {name: dict(series) for name, series in self._values.items()}
+            for name, series in values.items():
+                for labels, value in series.items():
+                    if isinstance(value, list):
+                        series[labels] = list(value)
+        for cache_name, cache in CACHES.items():
+            stats = cache.stats()
+            labels = (('cache', cache_name),)
+            values.setdefault('api_cache_hits_total', {})[labels] = stats['hits']
+            values.setdefault('api_cache_misses_total', {})[labels] = stats['misses']
+        return values
+
+    def maybe_flush(self, directory, interval):
+        """
+        Write the snapshot file of this process if the last one is more
+        than `interval` seconds old.
+        """
+        now = self.clock()
+        if self._flushed_at is not None and now - self._flushed_at < interval:
+            return
+        self._flushed_at = now
+        write_snapshot(directory, self.snapshot())
+
+
+def snapshot_path(directory, pid=None):
+    return Path(directory) / f'metrics-{pid or os.getpid()}.json'
+
+
+def write_snapshot(directory, values, pid=None):
+    """
+    Replace the snapshot file of this process (or `pid`); readers see the
+    old file or the new one, never part of it.
+    """
+    path = snapshot_path(directory, pid)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps({
+        name: [[list(labels), value] for labels, value in series.items()]
+        for name, series in values.items()
+    }))
+    os.replace(temporary, path)
+
+
+def read_snapshots(directory, exclude=None):
+    """
+    Return the metrics of every snapshot file in `directory`, added up,
+    leaving out `exclude`.
+    """
+    values = {}
+    for path in sorted(Path(directory).glob('metrics-*.json')):
+        if path == exclude:
+            continue
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            # Removed meanwhile, or not one of ours
+            continue
+        merge(values, {
+            name: {tuple(tuple(pair) for pair in labels): value for labels, value in series}
+            for name, series in data.items()
+        })
+    return values
+
+
+def collect():
+    """
+    Return the metrics of every process (or of this one, without `DIR`).
+    """
+    values = registry.snapshot()
+    directory = get_options()['DIR']
+    if directory:
+        # This process's own numbers are fresher than its file
+        merge(values, read_snapshots(directory, exclude=snapshot_path(directory)))
+    return values
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def exposition(values):
+    """
+    Return `values` in the Prometheus text exposition format.
+    """
+    lines = []
+    for name, metric in METRICS.items():
+        series = values.get(name)
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {metric.help}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for labels in sorted(series):
+            value = series[labels]
+            if metric.kind == 'counter':
+                lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets, value):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(labels, [("le", "+Inf")])} {value[-1]}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_value(value[-2])}')
+            lines.append(f'{name}_count{format_labels(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def view_label(request):
+    """
+    Return the name of the view that served `request`: "<ViewSet>.<action>"
+    for viewsets, the class or function name otherwise.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        view_class = getattr(match.func, 'view_class', None)
+    if view_class is None:
+        return match.view_name or getattr(match.func, '__name__', 'unknown')
+    actions = getattr(match.func, 'actions', None)
+    if actions:
+        method = request.method.lower()
+        action = actions.get(method) or (actions.get('get') if method == 'head' else None)
+        if action:
+            return f'{view_class.__name__}.{action}'
+    return view_class.__name__
+
+
+def request_observations(request, response, duration, request_metrics):
+    """
+    Return what `MetricsMiddleware` adds to the registry for one request.
+    """
+    view = (('view', view_label(request)),)
+    observations = [
+        ('api_requests_total', view + (('method', request.method), ('status', str(response.status_code))), 1),
+        ('api_request_duration_seconds', view, duration),
+        ('api_db_queries', view, request_metrics.db_queries),
+        ('api_db_duration_seconds', view, request_metrics.db_seconds),
+    ]
+    if 'serialize' in request_metrics.stages:
+        observations.append(('api_serializer_duration_seconds', view, request_metrics.stages['serialize']))
+    if 'render' in request_metrics.stages:
+        observations.append(('api_render_duration_seconds', view, request_metrics.stages['render']))
+    if request_metrics.page is not None:
+        observations.append(('api_page_number', view, request_metrics.page))
+    return observations
+
+
+# The metrics of this process
+registry = Registry()
+
+# A worker forked by a pre-fork server starts with its own, empty metrics
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry.reset)
@@ -0,0 +1,241 @@
+"""
+Middleware for the tasks API.
+"""
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+
+from .cache import TTLCache
+from .compression import choose_encoder, get_options as get_compression_options, is_compressible
+from .metrics import get_options as get_metrics_options, measure_request, register_cache, registry, request_observations
+from .profiling import get_options as get_profiling_options, profiler_for
+from .throttling import PRIORITY_HIGH, PRIORITY_NORMAL, request_priority
+
+
+class DatabaseLatencyMonitor:
+    """
+    Exponentially weighted moving average of database query time in this
+    process.
+
+    Samples older than `max_age` seconds are ignored, so the monitor reports
+    a healthy database again once slow traffic has stopped (for example
+    because it is being shed).
+    """
+    def __init__(self, alpha=0.2, max_age=10.0, clock=time.monotonic):
+        self.alpha = alpha
+        self.max_age = max_age
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._average_ms = None
+        self._updated_at = None
+
+    def record(self, duration_ms):
+        with self._lock:
+            if self._average_ms is None:
+                self._average_ms = duration_ms
+            else:
+                self._average_ms += self.alpha * (duration_ms - self._average_ms)
+            self._updated_at = self.clock()
+
+    def average_ms(self):
+        """
+        Return the current average in milliseconds, or 0 if there is no
+        recent sample.
+        """
+        with self._lock:
+            if self._updated_at is None or self.clock() - self._updated_at > self.max_age:
+                return 0.0
+            return self._average_ms
+
+    def reset(self):
+        with self._lock:
+            self._average_ms = None
+            self._updated_at = None
+
+
+# The monitor shared by everything in this process
+db_latency = DatabaseLatencyMonitor()
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper that feeds `db_latency`.
+    """
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        db_latency.record((time.perf_counter() - start) * 1000)
+
+
+class MetricsMiddleware:
+    """
+    Measure every request for `/metrics` (see tasks/metrics.py): duration,
+    database queries, serializer and render time, by view.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = get_metrics_options()
+        if not options['ENABLED']:
+            return self.get_response(request)
+        start = time.perf_counter()
+        with measure_request() as request_metrics, ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(request_metrics.record_query))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        registry.observe(request_observations(request, response, duration, request_metrics))
+        if options['DIR']:
+            registry.maybe_flush(options['DIR'], options['FLUSH_INTERVAL'])
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Run requests of staff users that ask for it (or are sampled) under
+    cProfile and keep the profiles (see tasks/profiling.py).
+
+    Goes after AuthenticationMiddleware, so session users are known.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = get_profiling_options()
+        profiler = profiler_for(request, options)
+        if profiler is None:
+            return self.get_response(request)
+        with profiler:
+            response = self.get_response(request)
+        profile_id = profiler.keep(response, options)
+        if profile_id and profiler.explicit:
+            response['X-Profile-Id'] = profile_id
+        return response
+
+
+def shed_response(request, view_func, view_kwargs):
+    """
+    Return the 503 response for a request that should be shed now, or None
+    to let it through (see `LoadSheddingMiddleware`).
+    """
+    options = {'DB_LATENCY_THRESHOLD_MS': 200, 'RETRY_AFTER': 5}
+    options.update(getattr(settings, 'LOAD_SHEDDING', {}))
+    threshold = options['DB_LATENCY_THRESHOLD_MS']
+
+    latency = db_latency.average_ms()
+    if latency <= threshold:
+        return None
+    # REST framework views keep their class on the view function
+    priority = request_priority(request, view_kwargs, getattr(view_func, 'cls', None))
+    if priority == PRIORITY_HIGH:
+        return None
+    if priority == PRIORITY_NORMAL and latency <= 2 * threshold:
+        return None
+
+    response = JsonResponse(
+        {'error': 'The service is overloaded, please retry later.', 'priority': priority},
+        status=503,
+    )
+    response['Retry-After'] = str(options['RETRY_AFTER'])
+    return response
+
+
+class LoadSheddingMiddleware:
+    """
+    Turn requests away with 503 + Retry-After while the database is slow.
+
+    Requests are classified like in `TokenBucketThrottle`. Once the average
+    query time passes `DB_LATENCY_THRESHOLD_MS`, `low` priority requests
+    (lists and searches) are shed; past twice the threshold, single-object
+    reads are shed too. Writes are never shed here. The requests of a batch
+    (tasks/batch.py) are checked one by one, as if sent alone.
+
+    Settings:
+
+        LOAD_SHEDDING = {
+            'DB_LATENCY_THRESHOLD_MS': 200,
+            'RETRY_AFTER': 5,  # seconds, sent in the Retry-After header
+        }
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(time_query))
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        return shed_response(request, view_func, view_kwargs)
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with the best encoding the client accepts (see
+    tasks/compression.py).
+
+    Bodies smaller than `MIN_SIZE`, content types outside `CONTENT_TYPES` and
+    responses that already have a Content-Encoding are sent as they are.
+    Streamed responses are compressed chunk by chunk as they are produced.
+
+    A response with a strong ETag (the OpenAPI schema, for example) has the
+    same body every time, so its compressed body is kept in memory and
+    reused instead of compressing it again on every request. Like Django's
+    GZipMiddleware, compressed responses get a weak ETag.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cache = TTLCache(max_size=get_compression_options()['CACHE_SIZE'], ttl=24 * 3600)
+        register_cache('compression', self.cache)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or not is_compressible(response.get('Content-Type')):
+            return response
+        if getattr(response, 'is_async', False):
+            # Async streams are left alone; none of our views produce them
+            return response
+        if not response.streaming and len(response.content) < get_compression_options()['MIN_SIZE']:
+            return response
+
+        # The body now depends on Accept-Encoding, whatever we send
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoder = choose_encoder(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoder is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = encoder.stream(response.streaming_content)
+            # The length is unknown until the stream ends
+            del response['Content-Length']
+        else:
+            response.content = self.compress(response, encoder)
+            response['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoder.name
+        return response
+
+    def compress(self, response, encoder):
+        etag = response.get('ETag')
+        if not etag or etag.startswith('W/'):
+            return encoder.compress(response.content)
+        key = (etag, encoder.name, encoder.level)
+        compressed = self.cache.get(key)
+        if compressed is None:
+            compressed = encoder.compress(response.content)
+            self.cache.set(key, compressed)
+        return compressed
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.10 on 2026-10-19 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0003_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('completed', False)), fields=['priority', 'due_date', 'created_at', 'id'], name='task_open_by_priority'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('completed', False)), fields=['assigned_to', 'priority', 'due_date', 'created_at', 'id'], name='task_open_by_assignee'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('completed', False)), fields=['due_date', 'priority', 'id'], name='task_open_by_due_date'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.10 on 2026-10-19 08:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0004_task_open_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonWorkload',
+            fields=[
+                ('person', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='workload', serialize=False, to='tasks.person')),
+                ('open_tasks', models.PositiveIntegerField(default=0)),
+                ('overdue_tasks', models.PositiveIntegerField(default=0)),
+                ('priority_counts', models.JSONField(default=dict)),
+                ('refreshed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('changed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
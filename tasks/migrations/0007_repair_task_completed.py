@@ -0,0 +1,26 @@
+from django.db import migrations
+from django.db.models import Q
+from django.utils import timezone
+
+
+def repair_completed(apps, schema_editor):
+    """
+    Make `completed` true exactly for tasks whose status is "completed",
+    with two set-based UPDATEs (see tasks.operations.repair_completed).
+    """
+    Task = apps.get_model('tasks', 'Task')
+    tasks = Task.objects.using(schema_editor.connection.alias)
+    now = timezone.now()
+    tasks.filter(status='completed', completed=False).update(completed=True, updated_at=now)
+    tasks.filter(~Q(status='completed'), completed=True).update(completed=False, updated_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0006_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(repair_completed, migrations.RunPython.noop),
+    ]
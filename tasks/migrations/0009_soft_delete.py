@@ -0,0 +1,64 @@
+# Generated by Django 4.2.10 on 2026-10-19 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0008_archivedtask'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='task',
+            name='task_open_by_priority',
+        ),
+        migrations.RemoveIndex(
+            model_name='task',
+            name='task_open_by_assignee',
+        ),
+        migrations.RemoveIndex(
+            model_name='task',
+            name='task_open_by_due_date',
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='email',
+            field=models.EmailField(max_length=254),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='person_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('completed', False), ('deleted_at__isnull', True)), fields=['priority', 'due_date', 'created_at', 'id'], name='task_open_by_priority'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('completed', False), ('deleted_at__isnull', True)), fields=['assigned_to', 'priority', 'due_date', 'created_at', 'id'], name='task_open_by_assignee'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('completed', False), ('deleted_at__isnull', True)), fields=['due_date', 'priority', 'id'], name='task_open_by_due_date'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='task_deleted'),
+        ),
+        migrations.AddConstraint(
+            model_name='person',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('email',), name='person_live_email_unique'),
+        ),
+    ]
@@ -1,23 +1,79 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
+
+class LiveManager(models.Manager):
+    """
+    Manager that leaves out soft-deleted rows (`deleted_at` set). They are
+    removed for good by `manage.py purge_deleted` (see tasks/purge.py).
+    """
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
 class Person(models.Model):
     """
     Person model representing a user who can be assigned tasks.
     """
     name = models.CharField(max_length=100)
-    email = models.EmailField(unique=True)
+    email = models.EmailField()
     phone = models.CharField(max_length=20, blank=True, null=True)
     department = models.CharField(max_length=50, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # The first manager is the default one: soft-deleted persons are hidden
+    # everywhere unless `all_objects` is used
+    objects = LiveManager()
+    all_objects = models.Manager()
 
     class Meta:
         ordering = ['name']
         verbose_name_plural = 'People'
+        indexes = [
+            # Paging through persons in the default order, and the admin's
+            # created_at drilldown
+            models.Index(fields=['name', 'id'], name='person_by_name'),
+            models.Index(fields=['created_at'], name='person_by_created_at'),
+            # Finding the soft-deleted persons to purge
+            models.Index(
+                fields=['deleted_at'],
+                condition=models.Q(deleted_at__isnull=False),
+                name='person_deleted',
+            ),
+        ]
+        constraints = [
+            # A deleted person's email can be used again before the purge
+            models.UniqueConstraint(
+                fields=['email'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='person_live_email_unique',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def soft_delete(self):
+        """
+        Hide the person; the purge unassigns their tasks and deletes the row.
+        """
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at', 'updated_at'])
+
+class TaskQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        """
+        Create a task, letting the database router see the new instance.
+
+        The default `create()` picks the database before the instance exists;
+        with `tasks.sharding` the shard depends on the task's assignee.
+        """
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
 class Task(models.Model):
     """
     Task model representing a task in the task management system.
@@ -37,6 +93,7 @@ class Task(models.Model):
     completed = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
     
     # Relationship with Person model
     assigned_to = models.ForeignKey(
@@ -46,9 +103,161 @@ class Task(models.Model):
         blank=True, 
         related_name='assigned_tasks'
     )
+
+    objects = LiveManager.from_queryset(TaskQuerySet)()
+    all_objects = TaskQuerySet.as_manager()
     
     class Meta:
         ordering = ['priority', 'due_date', 'created_at']
+        indexes = [
+            # Partial indexes over open (not completed, not deleted) tasks,
+            # in the order of the "what next" queries, so those read only the
+            # first K index entries instead of sorting the table.
+            # GET /api/tasks/next_up/
+            models.Index(
+                fields=['priority', 'due_date', 'created_at', 'id'],
+                condition=models.Q(completed=False, deleted_at__isnull=True),
+                name='task_open_by_priority',
+            ),
+            # GET /api/tasks/next_up/?assigned_to=<id>
+            models.Index(
+                fields=['assigned_to', 'priority', 'due_date', 'created_at', 'id'],
+                condition=models.Q(completed=False, deleted_at__isnull=True),
+                name='task_open_by_assignee',
+            ),
+            # GET /api/tasks/overdue/
+            models.Index(
+                fields=['due_date', 'priority', 'id'],
+                condition=models.Q(completed=False, deleted_at__isnull=True),
+                name='task_open_by_due_date',
+            ),
+            # Admin changelist: newest first, and the created_at drilldown
+            models.Index(fields=['created_at', 'id'], name='task_by_created_at'),
+            # Finding the closed tasks due for archiving (see tasks/archive.py)
+            models.Index(
+                fields=['updated_at', 'id'],
+                condition=models.Q(status__in=['completed', 'cancelled']),
+                name='task_closed_by_updated_at',
+            ),
+            # Finding the soft-deleted tasks to purge
+            models.Index(
+                fields=['deleted_at'],
+                condition=models.Q(deleted_at__isnull=False),
+                name='task_deleted',
+            ),
+        ]
     
     def __str__(self):
         return self.title
+
+    def soft_delete(self):
+        """
+        Hide the task until the purge deletes it.
+        """
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at', 'updated_at'])
+
+class ArchivedTask(models.Model):
+    """
+    A completed or cancelled task moved out of the Task table by
+    `manage.py archive_tasks` (see tasks/archive.py). It keeps the task's id
+    and field values, so it serializes like a task.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES)
+    priority = models.IntegerField(default=0)
+    due_date = models.DateField(null=True, blank=True)
+    completed = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    assigned_to = models.ForeignKey(
+        Person,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='archived_tasks'
+    )
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # The same order as Task, so the two merge in ?include_archived=1 lists
+        ordering = ['priority', 'due_date', 'created_at']
+        indexes = [
+            models.Index(fields=['archived_at'], name='archived_task_by_archived_at'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+class Job(models.Model):
+    """
+    A background job, run by `manage.py run_worker` (see tasks/jobs.py).
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Not picked up before this time (used to back off between retries)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Worker that is running the job, and when it took it
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The worker's "next job to run" query
+            models.Index(fields=['status', 'run_after'], name='tasks_job_status_run_after'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
+
+class PersonWorkload(models.Model):
+    """
+    Materialized workload of one person, maintained by tasks/workload.py.
+    """
+    person = models.OneToOneField(
+        Person,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='workload'
+    )
+    open_tasks = models.PositiveIntegerField(default=0)
+    overdue_tasks = models.PositiveIntegerField(default=0)
+    # Open tasks per priority, e.g. {"1": 3, "2": 1}
+    priority_counts = models.JSONField(default=dict)
+    # When the counts were computed (the start of the aggregate query)
+    refreshed_at = models.DateTimeField(default=timezone.now)
+    # When one of the person's tasks last changed; the row is stale if
+    # this is not before refreshed_at
+    changed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Workload of {self.person_id}'
@@ -0,0 +1,253 @@
+"""
+Conditional task updates for concurrent writers.
+
+Assigning or unassigning a task, and moving it to another status, is one
+UPDATE whose WHERE clause holds what the caller believes the task looks
+like:
+
+    UPDATE tasks_task SET assigned_to_id = %s, updated_at = %s
+    WHERE id = %s AND assigned_to_id IS %s
+
+If another request changed the task first, no row matches and `Conflict` is
+raised (409 in the API) instead of one write silently overwriting the other.
+Callers pass the expected assignee (`expected_assigned_to` in the API) to
+skip reading the task at all; without it the current assignee is read first
+and the update is conditional on it, which still catches a concurrent write
+between the read and the update.
+
+Status transitions follow `TRANSITIONS` and always write `status`,
+`completed` (true exactly when the status is "completed") and `updated_at`
+together, so the two fields cannot drift apart. `repair_completed()` fixes
+rows written before that, or by other code paths.
+
+Rows changed by QuerySet.update() send no signals, so the workload rows of
+the assignees are flagged here (see tasks/workload.py).
+
+With sharding enabled, an assignment that moves the task to another shard
+cannot be a single statement; it falls back to save(), after checking the
+expected assignee.
+"""
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import sharding, workload
+from .models import Task
+
+# Marks an expectation the caller did not state
+UNSET = object()
+
+# Status -> the statuses a task in it may move to. Moving to the status it
+# is already in is allowed too, so a retried transition succeeds.
+TRANSITIONS = {
+    'pending': ('in_progress', 'completed', 'cancelled'),
+    'in_progress': ('pending', 'completed', 'cancelled'),
+    'completed': ('in_progress',),  # reopened
+    'cancelled': ('pending',),      # restored
+}
+
+
+class Conflict(Exception):
+    """
+    The task changed since the caller looked at it, or is in a state the
+    change does not apply to. `current` holds its present values of the
+    fields the caller expected.
+    """
+    def __init__(self, task_id, current):
+        super().__init__(f'Task {task_id} was changed by another request')
+        self.task_id = task_id
+        self.current = current
+
+
+class InvalidTransition(ValueError):
+    """
+    `TRANSITIONS` does not allow moving from one status to another.
+    """
+    def __init__(self, source, target):
+        super().__init__(f'A {source} task cannot become {target}')
+        self.source = source
+        self.target = target
+
+
+def read_fields(task_id, fields):
+    """
+    Return `({field: value}, alias)` for task `task_id`, looking on every
+    shard. Raises Task.DoesNotExist.
+    """
+    for queryset in sharding.per_shard(Task.objects.filter(pk=task_id)):
+        row = queryset.values(*fields).first()
+        if row is not None:
+            return row, queryset.db
+    raise Task.DoesNotExist(f'Task {task_id} does not exist')
+
+
+def update_task(task_id, changes, expected, using):
+    """
+    Apply `changes` to task `task_id` on `using` in one UPDATE, provided its
+    current values match `expected` (filter arguments such as
+    {field: value}, where None matches NULL, or {field__in: values}).
+    Raises Conflict or Task.DoesNotExist when no row matched.
+    """
+    with transaction.atomic(using=using):
+        updated = (
+            Task.objects.using(using)
+            .filter(pk=task_id, **expected)
+            .update(updated_at=timezone.now(), **changes)
+        )
+    if updated:
+        return
+    # Only read the row on the failure path, to tell why nothing matched
+    current, _ = read_fields(task_id, list(dict.fromkeys(key.split('__')[0] for key in expected)))
+    raise Conflict(task_id, current)
+
+
+def assign(task_id, person_id, expected_assigned_to=UNSET):
+    """
+    Assign task `task_id` to `person_id` (None unassigns it) if it is still
+    assigned to `expected_assigned_to`. Returns the previous assignee id.
+
+    Raises Conflict, Task.DoesNotExist, or IntegrityError when the person
+    does not exist.
+    """
+    if expected_assigned_to is UNSET or sharding.sharding_enabled():
+        current, using = read_fields(task_id, ['assigned_to'])
+        if expected_assigned_to is not UNSET and current['assigned_to'] != expected_assigned_to:
+            raise Conflict(task_id, current)
+        expected_assigned_to = current['assigned_to']
+    else:
+        using = router.db_for_write(Task)
+
+    if sharding.sharding_enabled() and sharding.shard_for_assignee(person_id) != using:
+        move_task(task_id, person_id, expected_assigned_to, using)
+    else:
+        update_task(task_id, {'assigned_to': person_id}, {'assigned_to': expected_assigned_to}, using)
+        workload.mark_changed(expected_assigned_to, person_id)
+    return expected_assigned_to
+
+
+def move_task(task_id, person_id, expected_assigned_to, using):
+    """
+    Reassign a task whose new assignee puts it on another shard. The save()
+    moves it (see tasks/signals.py); the check and the move are not atomic.
+    """
+    task = Task.objects.using(using).get(pk=task_id)
+    if task.assigned_to_id != expected_assigned_to:
+        raise Conflict(task_id, {'assigned_to': task.assigned_to_id})
+    task.assigned_to_id = person_id
+    with transaction.atomic(using=router.db_for_write(Task, instance=task)):
+        task.save()
+
+
+def transition_sources(status):
+    """
+    Return the statuses from which a task may move to `status`.
+    """
+    return [source for source, targets in TRANSITIONS.items() if status in targets or source == status]
+
+
+def status_changes(status):
+    return {'status': status, 'completed': status == 'completed'}
+
+
+def task_databases():
+    """
+    Return the aliases that may hold a given task: every shard, or the one
+    database tasks are written to.
+    """
+    if sharding.sharding_enabled():
+        return list(sharding.get_options()['ALIASES'])
+    return [router.db_for_write(Task)]
+
+
+def delete_tasks(task_ids, using):
+    """
+    Delete the tasks `task_ids` on `using` with one DELETE statement.
+    Returns the number of rows deleted.
+
+    Signals are deliberately skipped: QuerySet.delete() would load every
+    row to send post_delete, and the callers (archiving and purging) deal
+    with the workload themselves. Keep `task_ids` to a bounded batch.
+    """
+    if not task_ids:
+        return 0
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(task_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(Task._meta.db_table)} WHERE {quote(Task._meta.pk.column)} IN ({placeholders})',
+            list(task_ids),
+        )
+        return cursor.rowcount
+
+
+def transition(task_id, status, expected_status=UNSET):
+    """
+    Move task `task_id` to `status` if `TRANSITIONS` allows it from its
+    current status (and that status is `expected_status`, when given).
+
+    Raises InvalidTransition, Conflict (with the current status) or
+    Task.DoesNotExist.
+    """
+    sources = transition_sources(status)
+    if expected_status is UNSET:
+        expected = {'status__in': sources}
+    elif expected_status in sources:
+        expected = {'status': expected_status}
+    else:
+        raise InvalidTransition(expected_status, status)
+
+    if sharding.sharding_enabled():
+        using = read_fields(task_id, ['status'])[1]
+    else:
+        using = router.db_for_write(Task)
+    update_task(task_id, status_changes(status), expected, using)
+    workload.mark_tasks_changed([task_id])
+
+
+def transition_many(task_ids, status):
+    """
+    Move every task of `task_ids` that may go to `status` there, with one
+    UPDATE (per shard). Returns {'updated': count, 'conflicts': [{'id',
+    'status'}], 'missing': [ids]}; tasks already in `status` count as updated.
+    """
+    task_ids = sorted(set(task_ids))
+    sources = transition_sources(status)
+    updated = 0
+    statuses = {}
+    for using in task_databases():
+        tasks = Task.objects.using(using).filter(pk__in=task_ids)
+        updated += tasks.filter(status__in=sources).update(updated_at=timezone.now(), **status_changes(status))
+        statuses.update(tasks.values_list('id', 'status'))
+    workload.mark_tasks_changed(task_ids)
+    return {
+        'updated': updated,
+        'conflicts': [
+            {'id': task_id, 'status': statuses[task_id]}
+            for task_id in task_ids if statuses.get(task_id, status) != status
+        ],
+        'missing': [task_id for task_id in task_ids if task_id not in statuses],
+    }
+
+
+def repair_completed(source='status', using=None):
+    """
+    Make `completed` and `status` agree again, with set-based UPDATEs.
+
+    With `source='status'` the status wins: `completed` becomes true exactly
+    for "completed" tasks. With `source='completed'` the flag wins: flagged
+    tasks become "completed", and unflagged "completed" ones "pending".
+    Returns the number of rows changed.
+    """
+    now = timezone.now()
+    changed = 0
+    for alias in [using] if using else task_databases():
+        tasks = Task.objects.using(alias)
+        if source == 'status':
+            changed += tasks.filter(status='completed', completed=False).update(completed=True, updated_at=now)
+            changed += tasks.exclude(status='completed').filter(completed=True).update(completed=False, updated_at=now)
+        elif source == 'completed':
+            changed += tasks.exclude(status='completed').filter(completed=True).update(status='completed', updated_at=now)
+            changed += tasks.filter(status='completed', completed=False).update(status='pending', updated_at=now)
+        else:
+            raise ValueError(f'Unknown source: {source}')
+    return changed
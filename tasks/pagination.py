@@ -0,0 +1,278 @@
+"""
+Pagination helpers for large tables.
+
+`Paginator` counts every matching row with COUNT(*) to number the pages.
+On a large table, with no or broad filters, that count can cost more than
+fetching the page itself.
+
+- `EstimatedCountPaginator` (used by the admin) takes the count of an
+  unfiltered queryset from the table statistics once the table is large.
+- `ApproximateCountPagination` (the API's default pagination class) counts
+  exactly up to `EXACT_COUNT_LIMIT` rows, reading at most that many. Above
+  it the count is estimated:
+
+  1. no filters: the table statistics (`table_row_estimate()`);
+  2. filters on PostgreSQL: the planner's row estimate from EXPLAIN;
+  3. otherwise: an exact count, cached for `CACHE_TTL` seconds per query
+     (i.e. per filter set).
+
+  The response says which it got in `count_is_exact`.
+
+An estimated count can be too low (stale statistics, a cached count older
+than recent inserts), so both paginators serve the pages past it instead
+of answering 404; see `InexactCountPaginator`.
+
+Settings (all optional):
+
+    PAGINATION_COUNTS = {
+        'EXACT_COUNT_LIMIT': 10000,  # count exactly up to this many rows
+        'CACHE_TTL': 60,             # seconds a cached count is reused
+        'CACHE_ALIAS': 'default',
+    }
+"""
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.paginator import EmptyPage, Paginator
+from django.db import DatabaseError, connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .metrics import record_page
+
+
+def get_options():
+    options = {
+        'EXACT_COUNT_LIMIT': 10000,
+        'CACHE_TTL': 60,
+        'CACHE_ALIAS': 'default',
+    }
+    options.update(getattr(settings, 'PAGINATION_COUNTS', {}))
+    return options
+
+
+def table_row_estimate(model, using='default'):
+    """
+    Return the planner's estimate of the number of rows in `model`'s table,
+    or None when the database has no statistics for it.
+
+    PostgreSQL keeps `pg_class.reltuples` up to date through autovacuum;
+    SQLite only has `sqlite_stat1` after `ANALYZE` has been run.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+                row = cursor.fetchone()
+                # -1 means the table was never analyzed
+                return row[0] if row and row[0] >= 0 else None
+            if connection.vendor == 'mysql':
+                cursor.execute(
+                    'SELECT table_rows FROM information_schema.tables '
+                    'WHERE table_schema = DATABASE() AND table_name = %s',
+                    [table],
+                )
+                row = cursor.fetchone()
+                return row[0] if row else None
+            if connection.vendor == 'sqlite':
+                # One row per index; the first number of `stat` is the number
+                # of rows in the index (the table itself if idx is NULL).
+                # Partial indexes hold fewer rows, so take the largest.
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+                counts = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+                return max(counts) if counts else None
+    except DatabaseError:
+        # e.g. sqlite_stat1 does not exist before the first ANALYZE
+        return None
+    return None
+
+
+def is_unfiltered(queryset):
+    """
+    Whether `queryset` has no filters beyond its model's default manager
+    (which leaves out soft-deleted rows). The table statistics count those
+    rows too, until they are purged; it is an estimate either way.
+    """
+    where = queryset.query.where
+    return not where or where == queryset.model._default_manager.all().query.where
+
+
+class InexactCountPaginator(Paginator):
+    """
+    Paginator whose `count` may be an estimate, in which case subclasses set
+    `count_is_exact` to False when computing it.
+
+    With an estimate, pages past `num_pages` are valid (and empty if there
+    really are no more rows), and every page holds up to `per_page` rows
+    instead of stopping at the estimated count.
+    """
+    count_is_exact = True
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # Page numbers that are not integers raised PageNotAnInteger
+            if int(number) < 1 or self.count_is_exact:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_is_exact:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
+
+
+class EstimatedCountPaginator(InexactCountPaginator):
+    """
+    Paginator that takes the row count of an unfiltered queryset from the
+    table statistics once the table holds more than `exact_count_limit`
+    rows. The page count may then be slightly off, which is fine for
+    browsing (the admin changelist, for example).
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and is_unfiltered(queryset):
+            estimate = table_row_estimate(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.exact_count_limit:
+                self.count_is_exact = False
+                return estimate
+        return super().count
+
+
+def explain_row_estimate(queryset):
+    """
+    Return the planner's estimate of the number of rows `queryset` matches,
+    or None on databases whose EXPLAIN has no row estimates (SQLite).
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    try:
+        plan = json.loads(queryset.order_by().explain(format='json'))
+    except (DatabaseError, ValueError):
+        return None
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def cached_count(queryset, ttl, alias):
+    """
+    Return the exact count of `queryset`, reusing it for `ttl` seconds for
+    the same SQL and parameters.
+    """
+    sql, params = queryset.order_by().query.sql_with_params()
+    key = 'pagecount:' + hashlib.sha256(f'{queryset.db}:{sql}:{params!r}'.encode()).hexdigest()
+    cache = caches[alias]
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout=ttl)
+    return count
+
+
+def approximate_count(queryset):
+    """
+    Return `(count, exact)` for `queryset`, following the strategy in the
+    module docstring. Anything that is not a QuerySet is counted exactly.
+    """
+    if not isinstance(queryset, QuerySet):
+        count = queryset.count() if hasattr(queryset, 'count') else len(queryset)
+        return count, True
+    options = get_options()
+    limit = options['EXACT_COUNT_LIMIT']
+    # COUNT(*) over a subquery with LIMIT: reads at most limit + 1 rows
+    bounded = queryset.order_by()[:limit + 1].count()
+    if bounded <= limit:
+        return bounded, True
+
+    estimate = None
+    if is_unfiltered(queryset):
+        estimate = table_row_estimate(queryset.model, queryset.db)
+    if estimate is None:
+        estimate = explain_row_estimate(queryset)
+    if estimate is None:
+        return cached_count(queryset, options['CACHE_TTL'], options['CACHE_ALIAS']), False
+    # We know there are more than `limit` rows, whatever the statistics say
+    return max(estimate, limit + 1), False
+
+
+class ApproximateCountPaginator(InexactCountPaginator):
+    """
+    Paginator whose count comes from `approximate_count()`.
+    """
+    @cached_property
+    def count(self):
+        count, self.count_is_exact = approximate_count(self.object_list)
+        return count
+
+
+class ApproximateCountPagination(PageNumberPagination):
+    """
+    Page number pagination that avoids exact counts of large result sets.
+
+    Responses carry `count_is_exact`; when it is false, `count` (and so the
+    number of pages) is an estimate. A short page still tells the exact
+    total, which then replaces the estimate, and a full page always links
+    to the next one, even past the estimated number of pages.
+    """
+    django_paginator_class = ApproximateCountPaginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = super().paginate_queryset(queryset, request, view)
+        if page is not None:
+            # How deep clients page (see tasks/metrics.py)
+            record_page(self.page.number)
+        return page
+
+    def is_short_page(self):
+        # A page with fewer rows than a full one is the last page, whatever
+        # the (estimated) count says
+        return 0 < len(self.page) < self.page.paginator.per_page
+
+    def get_count(self):
+        paginator = self.page.paginator
+        if paginator.count_is_exact:
+            return paginator.count, True
+        seen = self.page.start_index() - 1 + len(self.page)
+        if self.is_short_page():
+            return seen, True
+        return max(paginator.count, seen), False
+
+    def get_next_link(self):
+        if self.is_short_page():
+            return None
+        if not self.page.paginator.count_is_exact and len(self.page):
+            # The estimate may be too low
+            url = self.request.build_absolute_uri()
+            return replace_query_param(url, self.page_query_param, self.page.number + 1)
+        return super().get_next_link()
+
+    def get_paginated_response(self, data):
+        count, exact = self.get_count()
+        return Response(OrderedDict([
+            ('count', count),
+            ('count_is_exact', exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_is_exact'] = {
+            'type': 'boolean',
+            'example': True,
+        }
+        return response_schema
@@ -0,0 +1,223 @@
+"""
+On-demand profiling of API requests.
+
+`ProfilingMiddleware` (tasks/middleware.py) runs a request under cProfile
+when it asks for it, with an `X-Profile: 1` header or `?profile=1`, or when
+it is picked at random, one request in `1 / SAMPLE_RATE`. Only requests
+of staff users are profiled, so nobody else can slow the server down with
+`?profile=1`: the user is checked before the request runs, from the
+session or from an API token (`CachedTokenAuthentication`, which caches
+verified tokens). Requests authenticated any other way, such as HTTP Basic,
+are never profiled. Sampled requests are only kept when they took
+`MIN_DURATION_MS` or more.
+
+Each profile is stored in `DIR` as two files, `<id>.prof` (pstats data, for
+`python -m pstats` or snakeviz) and `<id>.json` (path, view, user, status,
+duration and queries). Explicitly requested profiles return their id in the
+`X-Profile-Id` response header. Only the newest `MAX_FILES` profiles are
+kept.
+
+`manage.py profiles` lists the slowest profiles and summarizes one, limited
+to the functions of this project by default.
+
+Settings (all optional):
+
+    PROFILING = {
+        'ENABLED': True,
+        'DIR': 'profiles',       # relative to BASE_DIR
+        'SAMPLE_RATE': 0.0,      # fraction of requests profiled unasked
+        'MIN_DURATION_MS': 200,  # sampled requests faster than this are dropped
+        'MAX_FILES': 200,        # profiles kept, newest first
+    }
+"""
+import cProfile
+import itertools
+import json
+import os
+import pstats
+import random
+import time
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedTokenAuthentication
+from .metrics import current_request, view_label
+from .renderers import TRUE_VALUES
+
+HEADER = 'HTTP_X_PROFILE'
+QUERY_PARAM = 'profile'
+
+# Distinguishes the profiles of requests finishing in the same microsecond
+_sequence = itertools.count()
+
+
+def get_options():
+    options = {
+        'ENABLED': True,
+        'DIR': 'profiles',
+        'SAMPLE_RATE': 0.0,
+        'MIN_DURATION_MS': 200,
+        'MAX_FILES': 200,
+    }
+    options.update(getattr(settings, 'PROFILING', {}))
+    return options
+
+
+def profile_dir(options=None):
+    options = options or get_options()
+    return Path(settings.BASE_DIR) / options['DIR']
+
+
+def requested(request):
+    """
+    Return True when `request` asks to be profiled.
+    """
+    value = request.META.get(HEADER) or request.GET.get(QUERY_PARAM)
+    return value is not None and value.lower() in TRUE_VALUES
+
+
+def staff_user(request):
+    """
+    Return the staff user `request` is from, or None, before any view has
+    authenticated it: the session's user, else the user of its API token.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            authenticated = CachedTokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        user = authenticated[0] if authenticated else None
+    return user if user is not None and user.is_staff else None
+
+
+def save_profile(profiler, metadata, options=None):
+    """
+    Write `profiler`'s stats and `metadata` to the profile directory and
+    return the profile id.
+    """
+    options = options or get_options()
+    directory = profile_dir(options)
+    directory.mkdir(parents=True, exist_ok=True)
+    profile_id = f'{timezone.now():%Y%m%dT%H%M%S%f}-{os.getpid()}-{next(_sequence)}'
+    profiler.dump_stats(directory / f'{profile_id}.prof')
+    # The metadata file last: a profile is listed once both exist
+    (directory / f'{profile_id}.json').write_text(json.dumps(dict(metadata, id=profile_id)))
+    prune(directory, options['MAX_FILES'])
+    return profile_id
+
+
+def prune(directory, keep):
+    """
+    Delete all but the newest `keep` profiles in `directory`.
+    """
+    # Ids start with the time, so they sort oldest first
+    for path in sorted(directory.glob('*.json'))[:-keep or None]:
+        for stale in (path, path.with_suffix('.prof')):
+            try:
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory=None):
+    """
+    Return the metadata of the stored profiles, slowest first.
+    """
+    profiles = []
+    for path in Path(directory or profile_dir()).glob('*.json'):
+        try:
+            profiles.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            # Pruned meanwhile, or not one of ours
+            continue
+    profiles.sort(key=lambda profile: profile['duration_ms'], reverse=True)
+    return profiles
+
+
+def summarize(profile_id, directory=None, sort='cumulative', limit=30, restrict=None):
+    """
+    Return the pstats report of profile `profile_id`: its `limit` top
+    functions by `sort`, among those whose file path matches `restrict`.
+    Raises FileNotFoundError.
+    """
+    path = Path(directory or profile_dir()) / f'{profile_id}.prof'
+    if not path.exists():
+        raise FileNotFoundError(f'No profile {profile_id}')
+    output = StringIO()
+    stats = pstats.Stats(str(path), stream=output)
+    if restrict is None:
+        stats.strip_dirs()
+    stats.sort_stats(sort)
+    # Restrictions apply in turn: first the file pattern, then the limit
+    stats.print_stats(*([restrict] if restrict else []), limit)
+    return output.getvalue()
+
+
+class RequestProfiler:
+    """
+    Profile one request by `user` and decide afterwards whether to keep it.
+    """
+    def __init__(self, request, user, explicit):
+        self.request = request
+        self.user = user
+        self.explicit = explicit
+        self.profiler = cProfile.Profile()
+        self.started_at = None
+        self.duration_ms = None
+        self.db_queries = None
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self.duration_ms = (time.perf_counter() - self.started_at) * 1000
+        # Counted by MetricsMiddleware, when it is enabled
+        request_metrics = current_request()
+        if request_metrics is not None:
+            self.db_queries = request_metrics.db_queries
+        return False
+
+    def keep(self, response, options):
+        """
+        Store the profile, unless the request was sampled and faster than
+        `MIN_DURATION_MS`. Returns the profile id, or None.
+        """
+        if not self.explicit and self.duration_ms < options['MIN_DURATION_MS']:
+            return None
+        return save_profile(self.profiler, {
+            'path': self.request.get_full_path(),
+            'method': self.request.method,
+            'view': view_label(self.request),
+            'user': self.user.get_username(),
+            'status': response.status_code,
+            'duration_ms': round(self.duration_ms, 3),
+            'db_queries': self.db_queries,
+            'sampled': not self.explicit,
+            'created_at': timezone.now().isoformat(),
+        }, options)
+
+
+def profiler_for(request, options):
+    """
+    Return a `RequestProfiler` if `request` should be profiled, else None.
+    """
+    if not options['ENABLED']:
+        return None
+    if requested(request):
+        explicit = True
+    elif options['SAMPLE_RATE'] and random.random() < options['SAMPLE_RATE']:
+        explicit = False
+    else:
+        return None
+    user = staff_user(request)
+    if user is None:
+        return None
+    return RequestProfiler(request, user, explicit)
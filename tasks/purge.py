@@ -0,0 +1,137 @@
+"""
+Purging of soft-deleted tasks and persons.
+
+`DELETE /api/tasks/{id}/` and `DELETE /api/persons/{id}/` only set
+`deleted_at` on the row, one UPDATE, and the default managers hide the row
+from then on (see `LiveManager` in tasks/models.py). Deleting a person
+outright would unassign every one of their tasks (`on_delete=SET_NULL`)
+inside the request, holding the locks for as long as that takes.
+
+`purge_deleted()`, run by `manage.py purge_deleted`, does the real work in
+the background, rows deleted `AFTER_HOURS` ago or more, in transactions of
+at most `BATCH_SIZE` rows:
+
+- deleted tasks are deleted, a batch per DELETE;
+- the tasks (live, deleted or archived) of a deleted person are unassigned,
+  a batch per UPDATE, and then the person row is deleted, which removes its
+  workload row and, with sharding, its copies on the shards.
+
+Until then a deleted person's tasks still point at them.
+
+Settings (all optional):
+
+    PURGE = {
+        'AFTER_HOURS': 24,    # keep soft-deleted rows this long
+        'BATCH_SIZE': 1000,   # rows deleted or unassigned per statement
+    }
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedTask, Person, Task
+from .operations import delete_tasks, task_databases
+
+
+def get_options():
+    options = {'AFTER_HOURS': 24, 'BATCH_SIZE': 1000}
+    options.update(getattr(settings, 'PURGE', {}))
+    return options
+
+
+def purge_cutoff(after_hours=None):
+    if after_hours is None:
+        after_hours = get_options()['AFTER_HOURS']
+    return timezone.now() - timedelta(hours=after_hours)
+
+
+def in_batches(queryset, batch_size, apply):
+    """
+    Call `apply(ids)` with the ids of `queryset`, `batch_size` at a time, in
+    a transaction each, until it has no rows left; `apply` must take the
+    rows out of `queryset`. Returns the number of rows.
+    """
+    total = 0
+    while True:
+        with transaction.atomic(using=queryset.db):
+            ids = list(queryset.values_list('id', flat=True)[:batch_size])
+            if ids:
+                apply(ids)
+        total += len(ids)
+        if len(ids) < batch_size:
+            return total
+
+
+def purge_tasks(cutoff, batch_size):
+    """
+    Delete the tasks soft-deleted before `cutoff`. Returns how many.
+    """
+    purged = 0
+    for using in task_databases():
+        tasks = Task.all_objects.using(using)
+        purged += in_batches(
+            tasks.filter(deleted_at__lt=cutoff).order_by(),
+            batch_size,
+            # Without signals: nothing refers to tasks and deleted tasks
+            # are out of the workload already
+            lambda ids: delete_tasks(ids, using),
+        )
+    return purged
+
+
+def unassign_tasks(person_id, batch_size):
+    """
+    Unassign every task, live, deleted or archived, of `person_id`.
+    Returns how many.
+    """
+    unassigned = 0
+    for using in task_databases():
+        for manager in (Task.all_objects, ArchivedTask.objects):
+            tasks = manager.using(using)
+            unassigned += in_batches(
+                tasks.filter(assigned_to=person_id).order_by(),
+                batch_size,
+                lambda ids: tasks.filter(pk__in=ids).update(assigned_to=None),
+            )
+    return unassigned
+
+
+def purge_persons(cutoff, batch_size):
+    """
+    Unassign the tasks of the persons soft-deleted before `cutoff`, then
+    delete them. Returns `(persons, tasks unassigned)`.
+    """
+    purged = unassigned = 0
+    for person in Person.all_objects.filter(deleted_at__lt=cutoff).order_by('deleted_at', 'id'):
+        unassigned += unassign_tasks(person.pk, batch_size)
+        # No task refers to the person any more, so the SET_NULL updates of
+        # the delete are cheap index lookups
+        with transaction.atomic():
+            person.delete()
+        purged += 1
+    return purged, unassigned
+
+
+def purge_deleted(after_hours=None, batch_size=None):
+    """
+    Purge the tasks and persons soft-deleted at least `after_hours` ago.
+    Returns {'tasks', 'persons', 'unassigned'} counts.
+    """
+    cutoff = purge_cutoff(after_hours)
+    batch_size = batch_size or get_options()['BATCH_SIZE']
+    tasks = purge_tasks(cutoff, batch_size)
+    persons, unassigned = purge_persons(cutoff, batch_size)
+    return {'tasks': tasks, 'persons': persons, 'unassigned': unassigned}
+
+
+def count_deleted(after_hours=None):
+    """
+    Return {'tasks', 'persons'}: how many rows `purge_deleted()` would delete.
+    """
+    cutoff = purge_cutoff(after_hours)
+    return {
+        'tasks': sum(Task.all_objects.using(using).filter(deleted_at__lt=cutoff).count() for using in task_databases()),
+        'persons': Person.all_objects.filter(deleted_at__lt=cutoff).count(),
+    }
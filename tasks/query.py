@@ -0,0 +1,286 @@
+"""
+Nested selection queries over persons and tasks.
+
+`POST /api/query/` takes a selection naming the fields and relations the
+client wants, for example the open tasks of every engineer:
+
+    {"persons": {
+        "where": {"department": "Engineering"},
+        "fields": ["id", "name"],
+        "include": {
+            "assigned_tasks": {
+                "where": {"completed": false},
+                "fields": ["id", "title", "due_date"],
+                "limit": 5
+            }
+        }
+    }}
+
+Relations are loaded a level at a time: the keys of every row of a level are
+collected and handed to a `DataLoader`, which fetches the next level with
+one query (per shard, for tasks), whatever the number of parents. Only the
+selected columns are read. Rows come in id order; `limit` caps the root rows
+and, on a to-many relation, the rows per parent (through a ROW_NUMBER()
+window, still in the one query).
+
+Selections deeper than `MAX_DEPTH` relations, or whose worst-case number of
+rows (`query_cost()`) is above `MAX_COST`, are refused before any query runs.
+
+Settings (all optional):
+
+    QUERY = {
+        'MAX_DEPTH': 3,      # nested relations
+        'MAX_COST': 10000,   # worst-case rows read per request
+        'DEFAULT_LIMIT': 20,
+        'MAX_LIMIT': 100,
+    }
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework.exceptions import ValidationError
+
+from . import sharding
+from .models import Person, Task
+
+# `fields` can be selected, `filters` used in `where`, `relations` included
+NodeType = namedtuple('NodeType', ['model', 'fields', 'filters', 'relations'])
+
+# Rows of `node` whose `remote_key` equals the parent row's `local_key`
+Relation = namedtuple('Relation', ['node', 'many', 'local_key', 'remote_key'])
+
+NODE_TYPES = {
+    'person': NodeType(
+        model=Person,
+        fields=('id', 'name', 'email', 'phone', 'department', 'created_at', 'updated_at'),
+        filters=('id', 'name', 'department'),
+        relations={'assigned_tasks': Relation('task', True, 'id', 'assigned_to')},
+    ),
+    'task': NodeType(
+        model=Task,
+        fields=(
+            'id', 'title', 'description', 'status', 'priority', 'due_date', 'completed',
+            'created_at', 'updated_at', 'assigned_to',
+        ),
+        filters=('id', 'status', 'priority', 'completed', 'assigned_to'),
+        relations={'assigned_to': Relation('person', False, 'assigned_to', 'id')},
+    ),
+}
+
+# Top-level keys of a query
+ROOTS = {'persons': 'person', 'tasks': 'task'}
+
+
+def get_options():
+    options = {
+        'MAX_DEPTH': 3,
+        'MAX_COST': 10000,
+        'DEFAULT_LIMIT': 20,
+        'MAX_LIMIT': 100,
+    }
+    options.update(getattr(settings, 'QUERY', {}))
+    return options
+
+
+class DataLoader:
+    """
+    Batch and cache loads by key.
+
+    `batch_fn(keys)` returns {key: value} for a list of keys; keys it leaves
+    out load as `default`. Each key is fetched at most once per loader.
+    """
+    def __init__(self, batch_fn, default=None):
+        self.batch_fn = batch_fn
+        self.default = default
+        self.cache = {}
+
+    def load_many(self, keys):
+        missing = [key for key in dict.fromkeys(keys) if key not in self.cache]
+        if missing:
+            loaded = self.batch_fn(missing)
+            for key in missing:
+                self.cache[key] = loaded.get(key, self.default)
+        return {key: self.cache[key] for key in keys}
+
+
+def clean_selection(node_name, selection, path, depth=0):
+    """
+    Validate `selection` for `node_name` and return it with defaults filled
+    in. Raises ValidationError naming the offending `path`.
+    """
+    options = get_options()
+    node = NODE_TYPES[node_name]
+    if not isinstance(selection, dict):
+        raise ValidationError({path: 'Expected an object.'})
+    unknown = set(selection) - {'fields', 'where', 'include', 'limit'}
+    if unknown:
+        raise ValidationError({path: f'Unknown keys: {", ".join(sorted(unknown))}.'})
+
+    fields = selection.get('fields', ['id'])
+    if not isinstance(fields, list) or not fields:
+        raise ValidationError({f'{path}.fields': 'Expected a non-empty list of field names.'})
+    bad = [field for field in fields if field not in node.fields]
+    if bad:
+        raise ValidationError({f'{path}.fields': f'Unknown fields: {", ".join(map(str, bad))}.'})
+
+    where = {}
+    if not isinstance(selection.get('where') or {}, dict):
+        raise ValidationError({f'{path}.where': 'Expected an object of field values.'})
+    for name, value in (selection.get('where') or {}).items():
+        if name not in node.filters:
+            raise ValidationError({f'{path}.where': f'Cannot filter on {name}.'})
+        field = node.model._meta.get_field(name)
+        try:
+            if isinstance(value, list):
+                where[f'{name}__in'] = [field.to_python(item) for item in value]
+            else:
+                where[name] = field.to_python(value)
+        except DjangoValidationError as e:
+            raise ValidationError({f'{path}.where.{name}': e.messages})
+
+    limit = selection.get('limit', options['DEFAULT_LIMIT'])
+    if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= options['MAX_LIMIT']:
+        raise ValidationError({f'{path}.limit': f'Expected an integer from 1 to {options["MAX_LIMIT"]}.'})
+
+    include = {}
+    if not isinstance(selection.get('include') or {}, dict):
+        raise ValidationError({f'{path}.include': 'Expected an object of relation selections.'})
+    for name, child in (selection.get('include') or {}).items():
+        if name not in node.relations:
+            raise ValidationError({f'{path}.include': f'Unknown relation: {name}.'})
+        if depth + 1 > options['MAX_DEPTH']:
+            raise ValidationError({path: f'Queries are limited to {options["MAX_DEPTH"]} nested relations.'})
+        include[name] = clean_selection(node.relations[name].node, child, f'{path}.{name}', depth + 1)
+
+    return {'fields': fields, 'where': where, 'limit': limit, 'include': include}
+
+
+def query_cost(node_name, selection, rows=None):
+    """
+    Return the most rows `selection` can read: `rows` parents (the root
+    limit for the root), times the rows each one can bring in.
+    """
+    node = NODE_TYPES[node_name]
+    if rows is None:
+        rows = selection['limit']
+    cost = rows
+    for name, child in selection['include'].items():
+        relation = node.relations[name]
+        child_rows = rows * child['limit'] if relation.many else rows
+        cost += query_cost(relation.node, child, child_rows)
+    return cost
+
+
+def columns_for(node, selection):
+    """
+    Return the selected columns plus the keys the relations join on.
+    """
+    columns = dict.fromkeys(selection['fields'])
+    columns['id'] = None
+    for name in selection['include']:
+        columns[node.relations[name].local_key] = None
+    return list(columns)
+
+
+def fetch_rows(node_name, selection, key=None, key_values=None):
+    """
+    Read the rows of `node_name` matching `selection`, optionally only those
+    whose `key` is in `key_values`. With `key` the limit applies per key.
+    """
+    node = NODE_TYPES[node_name]
+    columns = columns_for(node, selection)
+    if key is not None and key not in columns:
+        columns.append(key)
+    queryset = node.model.objects.filter(**selection['where']).order_by('id')
+    if key is not None:
+        queryset = queryset.filter(**{f'{key}__in': key_values})
+
+    per_key = key is not None and key != 'id'
+    if per_key:
+        queryset = queryset.annotate(
+            query_rank=Window(RowNumber(), partition_by=F(key), order_by=F('id').asc()),
+        ).filter(query_rank__lte=selection['limit'])
+
+    querysets = sharding.per_shard(queryset) if node.model is Task else [queryset]
+    rows = []
+    for shard_queryset in querysets:
+        shard_queryset = shard_queryset.values(*columns)
+        if key is None:
+            shard_queryset = shard_queryset[:selection['limit']]
+        rows.extend(shard_queryset)
+    if key is None and len(querysets) > 1:
+        rows = sorted(rows, key=lambda row: row['id'])[:selection['limit']]
+    return rows
+
+
+def resolve_level(node_name, rows, selection):
+    """
+    Load the relations of `rows` (one query per relation) and recurse into
+    the rows they bring in. The loaded rows are stored on each row in an
+    `included` dict, by relation name (`assigned_to` is both a column and a
+    relation).
+    """
+    node = NODE_TYPES[node_name]
+    for name, child in selection['include'].items():
+        relation = node.relations[name]
+
+        def batch_fn(keys, relation=relation, child=child):
+            child_rows = fetch_rows(relation.node, child, relation.remote_key, keys)
+            resolve_level(relation.node, child_rows, child)
+            if not relation.many:
+                return {row[relation.remote_key]: row for row in child_rows}
+            grouped = {}
+            for row in child_rows:
+                grouped.setdefault(row[relation.remote_key], []).append(row)
+            return grouped
+
+        default = [] if relation.many else None
+        loader = DataLoader(batch_fn, default=default)
+        loaded = loader.load_many([row[relation.local_key] for row in rows if row[relation.local_key] is not None])
+        for row in rows:
+            row.setdefault('included', {})[name] = loaded.get(row[relation.local_key], default)
+
+
+def shape(rows, selection):
+    """
+    Return `rows` with only the selected fields and relations.
+    """
+    shaped = []
+    for row in rows:
+        output = {field: row[field] for field in selection['fields']}
+        for name, child in selection['include'].items():
+            value = row['included'][name]
+            if isinstance(value, list):
+                output[name] = shape(value, child)
+            else:
+                output[name] = shape([value], child)[0] if value is not None else None
+        shaped.append(output)
+    return shaped
+
+
+def run_query(query):
+    """
+    Validate and run `query`, a {root: selection} dict. Returns
+    {root: [rows]}.
+    """
+    if not isinstance(query, dict) or not query:
+        raise ValidationError({'query': f'Expected an object with any of: {", ".join(ROOTS)}.'})
+    unknown = set(query) - set(ROOTS)
+    if unknown:
+        raise ValidationError({'query': f'Unknown roots: {", ".join(sorted(unknown))}.'})
+
+    selections = {root: clean_selection(ROOTS[root], selection, root) for root, selection in query.items()}
+    max_cost = get_options()['MAX_COST']
+    cost = sum(query_cost(ROOTS[root], selection) for root, selection in selections.items())
+    if cost > max_cost:
+        raise ValidationError({'query': f'Query may read up to {cost} rows; the limit is {max_cost}.'})
+
+    result = {}
+    for root, selection in selections.items():
+        rows = fetch_rows(ROOTS[root], selection)
+        resolve_level(ROOTS[root], rows, selection)
+        result[root] = shape(rows, selection)
+    return result
@@ -0,0 +1,202 @@
+"""
+Query plan snapshots, to catch query shape regressions in tests.
+
+`capture(func)` runs `func` (typically one API request through the test
+client) and returns its queries: their count, and for every SELECT, UPDATE
+and DELETE its SQL and how the database reads each table, from EXPLAIN:
+
+    "tasks_task: index search task_open_by_priority"
+    "tasks_person: primary key"
+    "tasks_task: full scan"
+    "sort"
+
+`compare(snapshot, captured)` lists the regressions against a recorded
+snapshot: more queries than before (a lost join or prefetch turning into
+one query per row), or a statement that reads a table with a full scan
+where its recorded plan did not (an index no longer used, an unbounded
+scan). Statements are matched to the snapshot by their normalized SQL, and
+those whose SQL changed by their order.
+
+Snapshots are kept per database vendor in tasks/query_plan_snapshots/
+(`sqlite.json`, `postgresql.json`) and rewritten by `save_snapshots()`;
+see QueryPlanTests in tasks/tests.py.
+
+On PostgreSQL sequential scans are disabled while explaining
+(`enable_seqscan = off`). Test tables are tiny and the planner would scan
+them whatever indexes exist; with the setting off it only plans a
+sequential scan when no index can serve the query, which is what the
+snapshot is about.
+"""
+import json
+import re
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+SNAPSHOT_DIR = Path(__file__).resolve().parent / 'query_plan_snapshots'
+
+# Statements counted, and those explained
+COUNTED = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+
+FULL_SCAN = 'full scan'
+
+# SQLite EXPLAIN QUERY PLAN details
+SQLITE_SEARCH = re.compile(r'^SEARCH (\S+) USING (?:(?:COVERING )?INDEX (\S+)|(?:INTEGER )?PRIMARY KEY)')
+SQLITE_SCAN = re.compile(r'^SCAN (\S+)(?: USING (?:COVERING )?INDEX (\S+))?')
+
+# `"tasks_task" T3` or `"tasks_task" AS T3`: Django's table aliases
+ALIAS = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)\b')
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PARAM_LISTS = re.compile(r'\((?:\?, )+\?\)')
+
+
+def statement_kind(sql):
+    return sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+
+
+def normalize_sql(sql):
+    """
+    Return `sql` with its literals replaced by ? and lists of them by (...),
+    so the snapshot does not change with the data.
+    """
+    return PARAM_LISTS.sub('(...)', LITERALS.sub('?', sql))
+
+
+def sqlite_plan(sql, tables):
+    aliases = dict((alias, table) for table, alias in ALIAS.findall(sql))
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        details = [row[-1] for row in cursor.fetchall()]
+    accesses = []
+    for detail in details:
+        match = SQLITE_SEARCH.match(detail) or SQLITE_SCAN.match(detail)
+        if match:
+            table = aliases.get(match.group(1), match.group(1))
+            if table not in tables:
+                # A derived table, such as the `subquery` of a count
+                continue
+            if detail.startswith('SEARCH'):
+                accesses.append(f'{table}: index search {match.group(2)}' if match.group(2) else f'{table}: primary key')
+            else:
+                accesses.append(f'{table}: index scan {match.group(2)}' if match.group(2) else f'{table}: {FULL_SCAN}')
+        elif detail.startswith('USE TEMP B-TREE'):
+            accesses.append('sort')
+    return accesses
+
+
+def postgresql_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from postgresql_nodes(child)
+
+
+def postgresql_plan(sql):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    accesses = []
+    for node in postgresql_nodes(plan[0]['Plan']):
+        node_type = node['Node Type']
+        if node_type == 'Seq Scan':
+            accesses.append(f'{node["Relation Name"]}: {FULL_SCAN}')
+        elif node_type in ('Index Scan', 'Index Only Scan'):
+            accesses.append(f'{node["Relation Name"]}: index search {node["Index Name"]}')
+        elif node_type == 'Bitmap Heap Scan':
+            indexes = ' '.join(child['Index Name'] for child in postgresql_nodes(node) if 'Index Name' in child)
+            accesses.append(f'{node["Relation Name"]}: index search {indexes}')
+        elif node_type in ('Sort', 'Incremental Sort'):
+            accesses.append('sort')
+    return accesses
+
+
+def explain(sql, tables):
+    """
+    Return how `sql` reads each of `tables`, in plan order.
+    """
+    if connection.vendor == 'sqlite':
+        return sqlite_plan(sql, tables)
+    if connection.vendor == 'postgresql':
+        return postgresql_plan(sql)
+    raise NotImplementedError(f'No query plans for {connection.vendor}')
+
+
+def capture(func):
+    """
+    Run `func` and return `{'queries': count, 'statements': [{'sql',
+    'plan'}]}` for the queries it made on the default database.
+    """
+    with CaptureQueriesContext(connection) as context:
+        func()
+    sqls = [query['sql'] for query in context.captured_queries if statement_kind(query['sql']) in COUNTED]
+    tables = set(connection.introspection.table_names())
+    return {
+        'queries': len(sqls),
+        'statements': [
+            {'sql': normalize_sql(sql), 'plan': explain(sql, tables)}
+            for sql in sqls if statement_kind(sql) in EXPLAINED
+        ],
+    }
+
+
+def full_scans(statement):
+    return {access.split(': ')[0] for access in statement['plan'] if access.endswith(f': {FULL_SCAN}')}
+
+
+def pair_statements(snapshot, captured):
+    """
+    Return `(recorded, statement)` for every captured statement: the
+    recorded statement with the same SQL, else the next recorded one left
+    unmatched, else None.
+    """
+    remaining = list(snapshot['statements'])
+    pairs = []
+    for statement in captured['statements']:
+        recorded = next((each for each in remaining if each['sql'] == statement['sql']), None)
+        if recorded is not None:
+            remaining.remove(recorded)
+        pairs.append([recorded, statement])
+    for pair in pairs:
+        if pair[0] is None and remaining:
+            pair[0] = remaining.pop(0)
+    return pairs
+
+
+def compare(snapshot, captured):
+    """
+    Return the regressions of `captured` against `snapshot`, as messages.
+    """
+    problems = []
+    if captured['queries'] > snapshot['queries']:
+        problems.append(f'{captured["queries"]} queries instead of {snapshot["queries"]}')
+    for recorded, statement in pair_statements(snapshot, captured):
+        before = full_scans(recorded) if recorded is not None else set()
+        for table in sorted(full_scans(statement) - before):
+            problems.append(f'full scan of {table} in: {statement["sql"]}')
+    return problems
+
+
+def snapshot_path(vendor=None):
+    return SNAPSHOT_DIR / f'{vendor or connection.vendor}.json'
+
+
+def load_snapshots(vendor=None):
+    """
+    Return the recorded snapshots of `vendor` (by default, the database's),
+    or None if there are none.
+    """
+    path = snapshot_path(vendor)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def save_snapshots(snapshots, vendor=None):
+    path = snapshot_path(vendor)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(dict(sorted(snapshots.items())), indent=2) + '\n')
@@ -0,0 +1,55 @@
+"""
+Renderers for the tasks API.
+"""
+from django.utils.http import parse_header_parameters
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import stage
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def strip_nulls(data):
+    """
+    Return `data` with every null-valued key removed from its objects, at
+    any depth. Nulls inside lists are kept, so positions do not shift.
+    """
+    if isinstance(data, dict):
+        return {key: strip_nulls(value) for key, value in data.items() if value is not None}
+    if isinstance(data, (list, tuple)):
+        return [strip_nulls(item) for item in data]
+    return data
+
+
+class CompactJSONRenderer(JSONRenderer):
+    """
+    JSON renderer with an opt-in compact mode for bandwidth-sensitive
+    clients.
+
+    Compact mode is asked for with `?compact=1` or with a media type
+    parameter (`Accept: application/json; compact=true`). It drops the
+    indentation (even when `indent` is asked for too) and leaves out the
+    keys whose value is null; clients must then treat a missing key like a
+    null one. Without it the output is that of `JSONRenderer`.
+    """
+    def is_compact(self, accepted_media_type, renderer_context):
+        if accepted_media_type:
+            _, params = parse_header_parameters(accepted_media_type)
+            if params.get('compact', '').lower() in TRUE_VALUES:
+                return True
+        request = renderer_context.get('request')
+        if request is not None:
+            return request.query_params.get('compact', '').lower() in TRUE_VALUES
+        return False
+
+    def get_indent(self, accepted_media_type, renderer_context):
+        if self.is_compact(accepted_media_type, renderer_context):
+            return None
+        return super().get_indent(accepted_media_type, renderer_context)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        with stage('render'):
+            if data is not None and self.is_compact(accepted_media_type, renderer_context):
+                data = strip_nulls(data)
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,188 @@
+"""
+Database routers for the tasks app.
+
+`ReplicaRouter` sends the reads of safe (GET/HEAD/OPTIONS) requests on
+`TaskViewSet` and `PersonViewSet` to read replicas; everything else,
+including every write, goes to the `default` (primary) database.
+
+Reads only go to a replica inside `replica_reads()`, which the viewsets
+enter through `ReplicaReadsMixin`. A client that just wrote something (for
+example through `assign` or `profile_update`) is pinned to the primary for
+`STICKY_SECONDS`, so it reads its own writes even if the replicas lag behind.
+
+Replicas are checked with `SELECT 1` at most every `HEALTH_CHECK_INTERVAL`
+seconds; an unhealthy replica is skipped, and with none left reads fall back
+to the primary.
+
+Settings (see taskmanager/settings_replica.py for a local two-SQLite setup):
+
+    DATABASE_ROUTERS = ['tasks.routers.ReplicaRouter']
+
+    READ_REPLICAS = {
+        'ALIASES': ['replica'],       # keys of DATABASES
+        'STICKY_SECONDS': 5,
+        'HEALTH_CHECK_INTERVAL': 30,  # seconds
+        'CACHE_ALIAS': 'default',     # where write pins are kept
+    }
+
+The pins only work if every server process reads the same cache, so with
+more than one worker `CACHE_ALIAS` must name a shared backend (Redis,
+memcached, database or file based), not the per-process LocMemCache.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+# True while the current request may read from a replica
+_replica_reads = ContextVar('tasks_replica_reads', default=False)
+
+
+def get_options():
+    options = {
+        'ALIASES': [],
+        'STICKY_SECONDS': 5,
+        'HEALTH_CHECK_INTERVAL': 30,
+        'CACHE_ALIAS': 'default',
+    }
+    options.update(getattr(settings, 'READ_REPLICAS', {}))
+    return options
+
+
+class ReplicaHealth:
+    """
+    Remembers, per replica alias, whether the last health check passed.
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        # alias -> (healthy, checked_at)
+        self._status = {}
+
+    def is_healthy(self, alias, interval):
+        with self._lock:
+            status = self._status.get(alias)
+        if status is not None and self.clock() - status[1] < interval:
+            return status[0]
+        healthy = self.check(alias)
+        with self._lock:
+            self._status[alias] = (healthy, self.clock())
+        return healthy
+
+    def check(self, alias):
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except DatabaseError:
+            return False
+
+    def reset(self):
+        with self._lock:
+            self._status.clear()
+
+
+# The health status shared by everything in this process
+replica_health = ReplicaHealth()
+
+
+def choose_replica():
+    """
+    Return the alias of a healthy replica, or the primary if there is none.
+    """
+    options = get_options()
+    healthy = [
+        alias for alias in options['ALIASES']
+        if replica_health.is_healthy(alias, options['HEALTH_CHECK_INTERVAL'])
+    ]
+    return random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """
+    Let reads in this block (and this thread or task) go to a replica.
+    """
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def client_pin_key(request):
+    if request.user and request.user.is_authenticated:
+        ident = f'user-{request.user.pk}'
+    else:
+        ident = f'ip-{BaseThrottle().get_ident(request)}'
+    return f'replica-pin:{ident}'
+
+
+def pin_to_primary(request):
+    """
+    Send this client's reads to the primary for the next STICKY_SECONDS.
+    """
+    options = get_options()
+    if options['ALIASES'] and options['STICKY_SECONDS'] > 0:
+        caches[options['CACHE_ALIAS']].set(client_pin_key(request), 1, timeout=options['STICKY_SECONDS'])
+
+
+def is_pinned_to_primary(request):
+    options = get_options()
+    if not options['ALIASES']:
+        return False
+    return caches[options['CACHE_ALIAS']].get(client_pin_key(request)) is not None
+
+
+class ReplicaRouter:
+    """
+    Route reads to replicas inside `replica_reads()`, everything else to
+    the primary.
+    """
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get():
+            return DEFAULT_DB_ALIAS
+        return choose_replica()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        databases = {DEFAULT_DB_ALIAS, *get_options()['ALIASES']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema (and data) from the primary
+        if db in get_options()['ALIASES']:
+            return False
+        return None
+
+
+class ReplicaReadsMixin:
+    """
+    ViewSet mixin: serve safe requests from a replica (unless the client
+    wrote recently) and pin clients to the primary after a successful write.
+    """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        use_replica = request.method in SAFE_METHODS and not is_pinned_to_primary(request)
+        self._replica_reads_token = _replica_reads.set(use_replica)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_reads_token', None)
+        if token is not None:
+            _replica_reads.reset(token)
+            self._replica_reads_token = None
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(request)
+        return super().finalize_response(request, response, *args, **kwargs)
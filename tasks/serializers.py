@@ -1,15 +1,38 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Task, Person
+from rest_framework.validators import UniqueValidator
+from .batch import get_options as get_batch_options
+from .cache import person_cache
+from .jobs import JOB_KINDS
+from .metrics import stage
+from .models import Job, Task, Person
+from .operations import TRANSITIONS, InvalidTransition
 
-class PersonSerializer(serializers.ModelSerializer):
+class TimedSerializerMixin:
+    """
+    Count the time spent turning objects into data towards the request's
+    serializer time (see tasks/metrics.py).
+    """
+    def to_representation(self, instance):
+        with stage('serialize'):
+            return super().to_representation(instance)
+
+
+class PersonSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Person model.
     This is used to convert Person instances to JSON and vice versa.
     """
     class Meta:
         model = Person
-        fields = '__all__'
+        exclude = ('deleted_at',)
         read_only_fields = ('created_at', 'updated_at')
+        # Emails are unique among persons that are not deleted (a partial
+        # unique constraint, which REST framework does not pick up itself)
+        extra_kwargs = {
+            'email': {'validators': [UniqueValidator(Person.objects.all(), message='person with this email already exists.')]},
+        }
 
 
 class ProfileUpdateSerializer(serializers.ModelSerializer):
@@ -22,6 +45,9 @@ class ProfileUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Person
         fields = ('name', 'email', 'confirm_email', 'phone', 'department')
+        # Uniqueness is checked in validate_email() through the person cache
+        # instead of the default UniqueValidator query
+        extra_kwargs = {'email': {'validators': []}}
         
     def validate_name(self, value):
         """
@@ -34,6 +60,9 @@ class ProfileUpdateSerializer(serializers.ModelSerializer):
     def validate_email(self, value):
         """
         Validate that the email is unique.
+
+        The lookup goes through the person cache; the unique constraint on
+        Person.email still has the final say when the row is saved.
         """
         # Get current instance (if any)
         instance = getattr(self, 'instance', None)
@@ -43,7 +72,8 @@ class ProfileUpdateSerializer(serializers.ModelSerializer):
             return value
             
         # Check if there's another person with this email
-        if Person.objects.filter(email=value).exists():
+        owner = person_cache.get_by_email(value)
+        if owner is not None and (instance is None or owner.id != instance.pk):
             raise serializers.ValidationError("This email is already in use.")
         return value
     
@@ -62,7 +92,7 @@ class ProfileUpdateSerializer(serializers.ModelSerializer):
         return data
 
 
-class PersonWithTasksSerializer(serializers.ModelSerializer):
+class PersonWithTasksSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Person model that includes their assigned tasks.
     """
@@ -70,7 +100,7 @@ class PersonWithTasksSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Person
-        fields = '__all__'
+        exclude = ('deleted_at',)
         read_only_fields = ('created_at', 'updated_at')
     
     def get_assigned_tasks(self, obj):
@@ -79,20 +109,71 @@ class PersonWithTasksSerializer(serializers.ModelSerializer):
         return TaskListSerializer(tasks, many=True).data
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class AssigneeField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key of a person who is not deleted, or of the task's current
+    assignee even if soft-deleted: a task sent back unchanged stays valid
+    until the purge unassigns it.
+    """
+    def to_internal_value(self, data):
+        task = self.parent.instance
+        current_id = getattr(task, 'assigned_to_id', None)
+        if current_id is not None:
+            try:
+                unchanged = Person._meta.pk.to_python(data) == current_id
+            except DjangoValidationError:
+                unchanged = False
+            # Purged meanwhile: the usual "Invalid pk" below
+            person = Person.all_objects.filter(pk=current_id).first() if unchanged else None
+            if person is not None:
+                return person
+        return super().to_internal_value(data)
+
+
+class TaskSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Task model.
     This is used to convert Task instances to JSON and vice versa.
     """
+    assigned_to = AssigneeField(queryset=Person.objects.all(), allow_null=True, required=False)
     assigned_to_name = serializers.ReadOnlyField(source='assigned_to.name')
     
     class Meta:
         model = Task
-        fields = '__all__'
+        exclude = ('deleted_at',)
         read_only_fields = ('created_at', 'updated_at')
 
+    def validate(self, data):
+        """
+        Keep `completed` and `status` consistent: `completed` is true exactly
+        when the status is "completed". Setting one sets the other; clearing
+        `completed` reopens the task.
+
+        On update, the status may only change as `TRANSITIONS` allows, the
+        same as through the transition endpoint.
+        """
+        if 'status' in data:
+            completed = data['status'] == 'completed'
+            if data.get('completed', completed) != completed:
+                raise serializers.ValidationError(
+                    {'completed': f'Must be {str(completed).lower()} for a {data["status"]} task.'}
+                )
+            data['completed'] = completed
+        elif 'completed' in data:
+            current = self.instance.status if self.instance else 'pending'
+            if data['completed']:
+                data['status'] = 'completed'
+            elif current == 'completed':
+                data['status'] = 'in_progress'
+        if self.instance is not None and data.get('status', self.instance.status) != self.instance.status:
+            if data['status'] not in TRANSITIONS[self.instance.status]:
+                raise serializers.ValidationError(
+                    {'status': f'{InvalidTransition(self.instance.status, data["status"])}.'}
+                )
+        return data
+
 
-class TaskListSerializer(serializers.ModelSerializer):
+class TaskListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Simplified serializer for listing tasks.
     Shows fewer fields than the complete serializer.
@@ -101,4 +182,83 @@ class TaskListSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Task
-        fields = ('id', 'title', 'status', 'priority', 'due_date', 'completed', 'assigned_to_name') 
\ No newline at end of file
+        fields = ('id', 'title', 'status', 'priority', 'due_date', 'completed', 'assigned_to_name')
+
+
+class JobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for background jobs.
+    On submission only `kind` and `payload` are accepted; the payload is
+    validated by the serializer registered for the kind.
+    """
+    kind = serializers.ChoiceField(choices=sorted(JOB_KINDS))
+
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'kind', 'payload', 'status', 'result', 'error', 'attempts', 'max_attempts',
+            'run_after', 'created_at', 'updated_at', 'finished_at',
+        )
+        read_only_fields = (
+            'status', 'result', 'error', 'attempts', 'max_attempts',
+            'run_after', 'created_at', 'updated_at', 'finished_at',
+        )
+
+    def validate(self, data):
+        payload_serializer = JOB_KINDS[data['kind']].payload_serializer
+        if payload_serializer is not None:
+            serializer = payload_serializer(data=data.get('payload') or {})
+            if not serializer.is_valid():
+                raise serializers.ValidationError({'payload': serializer.errors})
+            data['payload'] = serializer.validated_data
+        return data
+
+
+class BatchSubRequestSerializer(serializers.Serializer):
+    """
+    One call inside a batch: an API URL (with its query string), a method
+    and, for writes, a JSON body.
+    """
+    method = serializers.ChoiceField(choices=['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE'])
+    url = serializers.CharField(max_length=2000)
+    body = serializers.JSONField(required=False, allow_null=True)
+
+    def validate_url(self, value):
+        path = value.partition('?')[0]
+        if not path.startswith('/api/'):
+            raise serializers.ValidationError('Only /api/ URLs can be batched.')
+        if path == reverse('batch'):
+            raise serializers.ValidationError('Batches cannot be nested.')
+        return value
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    """
+    Serializer for batch requests (see tasks/batch.py).
+    """
+    requests = BatchSubRequestSerializer(many=True, allow_empty=False)
+    concurrent = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        max_requests = get_batch_options()['MAX_REQUESTS']
+        if len(value) > max_requests:
+            raise serializers.ValidationError(f'At most {max_requests} requests per batch.')
+        return value
+
+
+class TransitionSerializer(serializers.Serializer):
+    """
+    Serializer for moving one task to another status.
+    """
+    status = serializers.ChoiceField(choices=Task.STATUS_CHOICES)
+    # The status the client last saw; the transition fails with 409 if the
+    # task is no longer in it
+    expected_status = serializers.ChoiceField(choices=Task.STATUS_CHOICES, required=False)
+
+
+class BulkTransitionSerializer(serializers.Serializer):
+    """
+    Serializer for moving many tasks to a status at once.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    status = serializers.ChoiceField(choices=Task.STATUS_CHOICES)
@@ -0,0 +1,398 @@
+"""
+Optional horizontal sharding of the Task table.
+
+With `TASK_SHARDS['ALIASES']` set, every Task row lives on exactly one shard
+database, chosen from its assignee:
+
+- `'KEY': 'assigned_to'`: shard = ALIASES[assigned_to_id % len(ALIASES)]
+- `'KEY': 'department'`: shard = ALIASES[crc32(assignee's department) % len(ALIASES)]
+
+New unassigned tasks are created on the first shard; a task that loses its
+assignee stays where it is. Person stays on the
+`default` database and is copied to every shard (a "reference table"), so
+the foreign key from Task to Person keeps working inside each shard.
+
+How queries are served:
+
+- Single-shard: a person's tasks (`/api/persons/{id}/tasks/`), `?assigned_to=`
+  filters, and saves (the router picks the shard from the instance).
+- By id: a task is looked up on each shard in turn (`get_task()`).
+- Scatter-gather: lists across all shards (`/api/tasks/`) run the same query
+  on every shard, each limited to the rows the requested page needs, and
+  merge the sorted results (`ShardedTaskList`). The merge follows
+  `Task.Meta.ordering` or `?ordering=`, with NULLs last and the id as tie
+  breaker, so pages are stable.
+
+Task ids must be unique across shards, so new tasks get an id from
+`next_task_id()` (time based, like a "snowflake" id) instead of the shard's
+own autoincrement. Reassigning a task to a person on another shard moves
+the row (see `tasks/signals.py`). The move is an insert on the new shard
+followed by a delete on the old one, not a distributed transaction: a crash
+in between leaves the task on both shards until it is saved again.
+
+`Task.objects.bulk_create()` (used by `manage.py import_data`) bypasses the
+router's per-instance routing and writes to `default`; import into each
+shard explicitly with `.using(alias)` when sharding is enabled.
+
+Settings (see taskmanager/settings_sharded.py for a local SQLite setup):
+
+    DATABASE_ROUTERS = ['tasks.sharding.TaskShardRouter']
+
+    TASK_SHARDS = {
+        'ALIASES': ['shard0', 'shard1'],  # keys of DATABASES
+        'KEY': 'assigned_to',             # or 'department'
+    }
+"""
+import copy
+import heapq
+import os
+import random
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.db.models.expressions import OrderBy
+from rest_framework.exceptions import NotFound
+
+from .models import ArchivedTask, Person, Task
+
+
+def get_options():
+    options = {'ALIASES': [], 'KEY': 'assigned_to'}
+    options.update(getattr(settings, 'TASK_SHARDS', {}))
+    return options
+
+
+def sharding_enabled():
+    return bool(get_options()['ALIASES'])
+
+
+def shard_for_assignee(person_id, department=None):
+    """
+    Return the shard alias for tasks assigned to `person_id`.
+
+    With `'KEY': 'department'` the person's department is read from the
+    default database unless it is passed in.
+    """
+    options = get_options()
+    aliases = options['ALIASES']
+    if person_id is None:
+        return aliases[0]
+    if options['KEY'] == 'department':
+        if department is None:
+            department = (
+                Person.all_objects.using(DEFAULT_DB_ALIAS)
+                .filter(pk=person_id).values_list('department', flat=True).first()
+            ) or ''
+        return aliases[zlib.crc32(department.encode()) % len(aliases)]
+    return aliases[int(person_id) % len(aliases)]
+
+
+def shard_for_person(person):
+    return shard_for_assignee(person.pk, person.department)
+
+
+class TaskIdGenerator:
+    """
+    Generate task ids that are unique across shards and processes.
+
+    An id is (milliseconds since 2024-01-01) << 12 | worker << 7 | sequence,
+    where `worker` is 5 random bits per process and `sequence` counts ids
+    within the same millisecond. Ids stay below 2**53, so JavaScript clients
+    read them exactly. The primary key constraint on each shard still
+    rejects the (unlikely) clash of two processes that drew the same worker
+    bits in the same millisecond.
+    """
+    epoch_ms = 1704067200000
+    sequence_bits = 7
+    worker_bits = 5
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+        self._pid = None
+
+    def __call__(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # New process (e.g. after a fork): draw new worker bits
+                self._pid = os.getpid()
+                self._worker = random.getrandbits(self.worker_bits)
+            now_ms = int(self.clock() * 1000) - self.epoch_ms
+            if now_ms <= self._last_ms:
+                now_ms = self._last_ms
+                self._sequence += 1
+                if self._sequence >= 1 << self.sequence_bits:
+                    # Sequence exhausted for this millisecond: borrow the next one
+                    now_ms += 1
+                    self._sequence = 0
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+            return (
+                (now_ms << (self.worker_bits + self.sequence_bits))
+                | (self._worker << self.sequence_bits)
+                | self._sequence
+            )
+
+
+next_task_id = TaskIdGenerator()
+
+
+def get_task(pk):
+    """
+    Return the task with primary key `pk`, looking on every shard when
+    sharding is enabled. Raises Task.DoesNotExist if there is none.
+    """
+    if not sharding_enabled():
+        return Task.objects.get(pk=pk)
+    for alias in get_options()['ALIASES']:
+        task = Task.objects.using(alias).filter(pk=pk).first()
+        if task is not None:
+            return task
+    raise Task.DoesNotExist(f'Task matching query does not exist: pk={pk}')
+
+
+def order_by_for(queryset):
+    """
+    Return the ORDER BY of `queryset` as expressions with NULLs last and the
+    primary key as final tie breaker, so every shard sorts the same way as
+    the merge in `ShardedTaskList`.
+    """
+    ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+    expressions = []
+    for field in ordering:
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        if name == 'pk':
+            name = 'id'
+        expressions.append(OrderBy(F(name), descending=descending, nulls_last=True))
+    if not any(expression.expression.name == 'id' for expression in expressions):
+        expressions.append(OrderBy(F('id')))
+    return expressions
+
+
+class _SortKey:
+    """
+    Sort key matching `order_by_for()`: NULLs last, per-field direction.
+    """
+    __slots__ = ('values', 'directions')
+
+    def __init__(self, values, directions):
+        self.values = values
+        self.directions = directions
+
+    def __lt__(self, other):
+        for mine, theirs, descending in zip(self.values, other.values, self.directions):
+            if mine == theirs:
+                continue
+            if mine is None:
+                return False
+            if theirs is None:
+                return True
+            return mine > theirs if descending else mine < theirs
+        return False
+
+
+class ShardedTaskList:
+    """
+    A lazily evaluated, ordered list of tasks spread over several shards.
+
+    It supports `count()`, `len()`, slicing and iteration, which is what
+    Django's Paginator and REST framework's pagination need, so a viewset can
+    paginate it like a queryset. `querysets` holds the same filtered query
+    bound to each shard.
+    """
+    def __init__(self, querysets):
+        self.querysets = querysets
+        self.ordered = True
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = sum(queryset.count() for queryset in self.querysets)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self._merge(0, None))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                raise ValueError('ShardedTaskList does not support slice steps')
+            start = index.start or 0
+            stop = index.stop
+            return self._merge(start, None if stop is None else max(0, stop - start))
+        items = self._merge(index, 1)
+        if not items:
+            raise IndexError(index)
+        return items[0]
+
+    def _merge(self, offset, limit):
+        """
+        Fetch rows [offset, offset + limit) of the merged order. Each shard
+        only returns its first offset + limit rows, which is all the merge
+        can possibly need from it.
+        """
+        if not self.querysets:
+            return []
+        expressions = order_by_for(self.querysets[0])
+        names = [expression.expression.name for expression in expressions]
+        directions = [expression.descending for expression in expressions]
+
+        streams = []
+        for queryset in self.querysets:
+            queryset = queryset.order_by(*expressions)
+            if limit is not None:
+                queryset = queryset[:offset + limit]
+            streams.append(list(queryset))
+
+        def key(task):
+            return _SortKey([getattr(task, name) for name in names], directions)
+
+        merged = heapq.merge(*streams, key=key)
+        stop = None if limit is None else offset + limit
+        result = []
+        for position, task in enumerate(merged):
+            if stop is not None and position >= stop:
+                break
+            if position >= offset:
+                result.append(task)
+        return result
+
+
+def per_shard(queryset):
+    """
+    Return the Task `queryset` bound to each shard, or just `[queryset]`
+    when sharding is disabled.
+    """
+    if not sharding_enabled():
+        return [queryset]
+    return [queryset.using(alias) for alias in get_options()['ALIASES']]
+
+
+def sharded(queryset):
+    """
+    Return the Task `queryset` run on every shard and merged, or the
+    queryset itself when sharding is disabled.
+    """
+    if not sharding_enabled():
+        return queryset
+    return ShardedTaskList(per_shard(queryset))
+
+
+def copy_person_to_shards(person):
+    """
+    Insert or update the copy of `person` on every shard.
+    """
+    for alias in get_options()['ALIASES']:
+        # raw=True stores the values as they are (no auto_now updates)
+        copy.copy(person).save_base(using=alias, raw=True)
+
+
+def delete_person_from_shards(person_id):
+    """
+    Delete the copies of a person; their tasks on each shard lose their
+    assignee, as on a single database.
+    """
+    for alias in get_options()['ALIASES']:
+        Person.all_objects.using(alias).filter(pk=person_id).delete()
+
+
+def rehome_person_tasks(person):
+    """
+    Move a person's tasks to the shard the person now maps to. Only needed
+    with `'KEY': 'department'`, after the person changed department.
+    """
+    target = shard_for_person(person)
+    for alias in get_options()['ALIASES']:
+        if alias == target:
+            continue
+        for task in Task.all_objects.using(alias).filter(assigned_to_id=person.pk):
+            task.save(using=target)
+
+
+class TaskShardRouter:
+    """
+    Route Task rows to their shard; everything else uses the default router
+    behaviour (i.e. the `default` database).
+    """
+    def db_for_read(self, model, **hints):
+        if model is not Task or not sharding_enabled():
+            return None
+        instance = hints.get('instance')
+        if isinstance(instance, Person):
+            # Related lookups such as person.assigned_tasks.all()
+            return shard_for_person(instance)
+        if isinstance(instance, Task) and instance._state.db:
+            return instance._state.db
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model is not Task or not sharding_enabled():
+            return None
+        instance = hints.get('instance')
+        if isinstance(instance, Task):
+            if instance.assigned_to_id is None and instance._state.db in get_options()['ALIASES']:
+                # No assignee, no reason to move
+                return instance._state.db
+            return shard_for_assignee(instance.assigned_to_id)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every shard holds a copy of the persons
+        if {type(obj1), type(obj2)} <= {Task, Person}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Shards get the whole schema; Person rows are copied to them
+        return None
+
+
+class ShardedTasksMixin:
+    """
+    TaskViewSet mixin: look tasks up on every shard and serve lists with a
+    scatter-gather merge. Does nothing unless sharding is enabled.
+    """
+    def get_object(self):
+        if not sharding_enabled():
+            return super().get_object()
+        try:
+            task = get_task(Task._meta.pk.to_python(self.kwargs[self.lookup_url_kwarg or self.lookup_field]))
+        except (Task.DoesNotExist, ValidationError):
+            raise NotFound
+        self.check_object_permissions(self.request, task)
+        return task
+
+    def filter_queryset(self, queryset):
+        if not sharding_enabled() or queryset.model not in (Task, ArchivedTask) or queryset._db is not None:
+            return super().filter_queryset(queryset)
+        assigned_to = self.request.query_params.get('assigned_to')
+        if assigned_to:
+            # All of one person's tasks live on one shard
+            try:
+                alias = shard_for_assignee(Person._meta.pk.to_python(assigned_to))
+            except ValidationError:
+                alias = get_options()['ALIASES'][0]
+            return super().filter_queryset(queryset.using(alias))
+        base = super()
+        return ShardedTaskList([
+            base.filter_queryset(queryset.using(alias)) for alias in get_options()['ALIASES']
+        ])
+
+    def sharded(self, queryset):
+        """
+        Return `queryset` spread over every shard, without the request's
+        filters (for the fixed lists such as `completed_tasks`).
+        """
+        return sharded(queryset)
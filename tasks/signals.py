@@ -0,0 +1,108 @@
+"""
+Signal handlers for the tasks app.
+
+They are connected in `TasksConfig.ready()`.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import revoke_cached_token, revoke_cached_user
+from .cache import person_cache
+from .models import Person, Task
+from . import sharding, workload
+
+
+@receiver(post_save, sender=Person)
+@receiver(post_delete, sender=Person)
+def evict_cached_person(sender, instance, **kwargs):
+    """
+    Drop a saved or deleted person from the identity cache.
+    """
+    person_cache.evict(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def evict_revoked_token(sender, instance, **kwargs):
+    """
+    Stop accepting a deleted (revoked) token in this process.
+    """
+    revoke_cached_token(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def evict_user_tokens(sender, instance, **kwargs):
+    """
+    Re-verify a user's tokens after the user changes (e.g. is deactivated).
+    """
+    revoke_cached_user(instance.pk)
+
+
+@receiver(pre_save, sender=Task)
+def prepare_sharded_task(sender, instance, using, raw, **kwargs):
+    """
+    With sharding enabled, give new tasks a cluster-wide id and note when a
+    save moves a task to another shard.
+    """
+    if raw or not sharding.sharding_enabled():
+        return
+    if instance.pk is None:
+        instance.pk = sharding.next_task_id()
+    elif instance._state.db in sharding.get_options()['ALIASES'] and instance._state.db != using:
+        instance._moved_from_shard = (instance._state.db, instance.created_at)
+
+
+@receiver(post_save, sender=Task)
+def finish_task_move(sender, instance, using, **kwargs):
+    """
+    Remove a moved task from its old shard, keeping its creation time.
+    """
+    moved = instance.__dict__.pop('_moved_from_shard', None)
+    if moved is None:
+        return
+    old_alias, created_at = moved
+    Task.all_objects.using(using).filter(pk=instance.pk).update(created_at=created_at)
+    instance.created_at = created_at
+    Task.all_objects.using(old_alias).filter(pk=instance.pk).delete()
+
+
+@receiver(post_save, sender=Person)
+def copy_person_to_shards(sender, instance, using, raw, **kwargs):
+    """
+    Keep the copies of a person on every shard up to date.
+    """
+    if raw or using != DEFAULT_DB_ALIAS or not sharding.sharding_enabled():
+        return
+    sharding.copy_person_to_shards(instance)
+    if sharding.get_options()['KEY'] == 'department':
+        sharding.rehome_person_tasks(instance)
+
+
+@receiver(post_delete, sender=Person)
+def delete_person_from_shards(sender, instance, using, **kwargs):
+    """
+    Delete the copies of a deleted person from every shard.
+    """
+    if using != DEFAULT_DB_ALIAS or not sharding.sharding_enabled():
+        return
+    sharding.delete_person_from_shards(instance.pk)
+
+
+@receiver(post_init, sender=Task)
+def remember_task_assignee(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred field is not loaded here
+    instance._loaded_assigned_to_id = instance.__dict__.get('assigned_to_id')
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def mark_workload_changed(sender, instance, **kwargs):
+    """
+    Flag the workload of the task's previous and current assignee for
+    recomputation (see tasks/workload.py).
+    """
+    workload.mark_changed(getattr(instance, '_loaded_assigned_to_id', None), instance.assigned_to_id)
+    instance._loaded_assigned_to_id = instance.assigned_to_id
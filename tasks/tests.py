@@ -1,9 +1,52 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from django.contrib.auth.models import User
+from django.utils import timezone
+from django.contrib.auth.models import AnonymousUser, User
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase, APIClient
-from .models import Task, Person
+from taskmanager.schema import compute_fingerprint, generate_schema, schema_cache
+from .authentication import CachedTokenAuthentication, token_cache
+from .bulk_io import parse_range, split_byte_ranges
+from .cache import PersonCache, person_cache
+from . import bulk_io, operations, profiling, query_plans, workload
+from .archive import archive_tasks
+from .compression import choose_encoder, parse_accept_encoding
+from .jobs import JOB_KINDS, JobKind, Worker, claim_job, enqueue, requeue_expired
+from .metrics import Registry as MetricsRegistry, exposition as metrics_exposition, registry as metrics_registry, write_snapshot
+from .middleware import CompressionMiddleware, db_latency
+from .models import ArchivedTask, Job, PersonWorkload, Task, Person
+from .pagination import EstimatedCountPaginator, table_row_estimate
+from .purge import purge_deleted
+from .routers import (
+    ReplicaHealth, ReplicaRouter, client_pin_key, get_options as get_replica_options, replica_health, replica_reads,
+)
+from .sharding import (
+    ShardedTaskList, TaskIdGenerator, get_task, order_by_for, shard_for_assignee, shard_for_person,
+)
+from .throttling import CacheBucketStore, LocalBucketStore, get_bucket_store
+from .views import PersonViewSet, TaskViewSet
 
 # Create your tests here.
 
@@ -148,6 +191,9 @@ class PersonProfileUpdateTests(APITestCase):
         
         # Setup client with authentication
         self.client = APIClient()
+        
+        # Start from an empty person cache; ids are reused between tests
+        person_cache.clear()
     
     def test_profile_update_requires_authentication(self):
         """
@@ -260,3 +306,2465 @@ class PersonProfileUpdateTests(APITestCase):
         response = self.client.patch(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('name', response.data['errors'])
+
+
+class BulkImportExportTests(TestCase):
+    """
+    Test cases for the import_data/export_data commands and their helpers.
+    """
+    def setUp(self):
+        """
+        Set up a temporary directory and some data to export.
+        """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.person = Person.objects.create(name="John Doe", email="john.doe@example.com")
+        for i in range(5):
+            Task.objects.create(title=f"Task {i}", priority=i, assigned_to=self.person)
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_byte_ranges_cover_every_line_once(self):
+        """
+        Test that splitting a file into byte ranges never loses or duplicates a line.
+        """
+        path = self.path('tasks.jsonl')
+        with open(path, 'w') as f:
+            for i in range(50):
+                f.write(json.dumps({'title': 'x' * (i % 7 + 1), 'priority': i}) + '\n')
+
+        for parts in (1, 3, 7, 50, 500):
+            priorities = []
+            for start, end in split_byte_ranges(path, parts):
+                records, errors = parse_range(path, start, end, 'task')
+                self.assertEqual(errors, [])
+                priorities.extend(record['priority'] for record in records)
+            self.assertEqual(priorities, list(range(50)))
+
+    def test_export_import_round_trip(self):
+        """
+        Test that exported tasks can be imported again with their assignments.
+        """
+        persons_path = self.path('persons.jsonl')
+        tasks_path = self.path('tasks.jsonl')
+        call_command('export_data', persons_path, model='person', stdout=StringIO())
+        call_command('export_data', tasks_path, model='task', stdout=StringIO())
+
+        Task.objects.all().delete()
+        Person.objects.all().delete()
+
+        call_command('import_data', persons_path, model='person', stdout=StringIO())
+        call_command('import_data', tasks_path, model='task', batch_size=2, stdout=StringIO())
+
+        self.assertEqual(Task.objects.count(), 5)
+        self.assertEqual(Task.objects.filter(assigned_to=self.person.id).count(), 5)
+
+    def test_invalid_record_aborts_import(self):
+        """
+        Test that one invalid line stops the whole import.
+        """
+        path = self.path('tasks.jsonl')
+        with open(path, 'w') as f:
+            f.write(json.dumps({'title': 'Fine'}) + '\n')
+            f.write(json.dumps({'title': 'Bad', 'status': 'unknown'}) + '\n')
+
+        with self.assertRaises(CommandError):
+            call_command('import_data', path, model='task', stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(Task.objects.filter(title='Fine').exists())
+
+    def test_import_writes_while_parsing(self):
+        """
+        Test that batches are written as the file is parsed, not after all
+        of it, and that the id sequence is reset after explicit ids.
+        """
+        path = self.path('tasks.jsonl')
+        with open(path, 'w') as f:
+            for i in range(20):
+                f.write(json.dumps({'id': 1000 + i, 'title': f'Imported {i}'}) + '\n')
+
+        calls = []
+        real_parse_range = bulk_io.parse_range
+        real_bulk_create = Task.objects.bulk_create
+
+        def parse(*args):
+            calls.append('parse')
+            return real_parse_range(*args)
+
+        def write(objs, *args, **kwargs):
+            calls.append('write')
+            return real_bulk_create(objs, *args, **kwargs)
+
+        with mock.patch.object(bulk_io, 'RANGE_BYTES', 200), \
+                mock.patch.object(bulk_io, 'parse_range', side_effect=parse), \
+                mock.patch.object(Task.objects, 'bulk_create', side_effect=write), \
+                mock.patch.object(connection.ops, 'sequence_reset_sql', return_value=[]) as reset:
+            created, errors = bulk_io.import_file(path, 'task', batch_size=5)
+        self.assertEqual((created, errors), (20, []))
+        self.assertGreater(calls.count('parse'), 2)
+        self.assertLess(calls.index('write'), len(calls) - 1 - calls[::-1].index('parse'))
+        reset.assert_called_once()
+        self.assertEqual(Task.objects.filter(id__gte=1000).count(), 20)
+
+
+class PersonCacheTests(APITestCase):
+    """
+    Test cases for the person identity cache and the endpoints that use it.
+    """
+    def setUp(self):
+        """
+        Set up persons, a task and an empty cache.
+        """
+        person_cache.clear()
+        self.person = Person.objects.create(name="John Doe", email="john.doe@example.com")
+        self.other = Person.objects.create(name="Jane Smith", email="jane.smith@example.com")
+        self.task = Task.objects.create(title="Test Task")
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+
+    def test_lookups_are_cached(self):
+        """
+        Test that a second lookup by id or email does not hit the database.
+        """
+        person_cache.get(self.person.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(person_cache.get(self.person.id).name, "John Doe")
+            self.assertEqual(person_cache.get_by_email("john.doe@example.com").id, self.person.id)
+        self.assertEqual(person_cache.stats()['hits'], 2)
+
+    def test_size_bound_evicts_least_recently_used(self):
+        """
+        Test that the cache never grows past max_size.
+        """
+        cache = PersonCache(max_size=1)
+        cache.get(self.person.id)
+        cache.get(self.other.id)
+        self.assertEqual(cache.stats()['size'], 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        with self.assertNumQueries(1):
+            cache.get(self.person.id)
+
+    def test_entries_expire(self):
+        """
+        Test that an entry older than the TTL is read again from the database.
+        """
+        now = [0.0]
+        cache = PersonCache(ttl=10, clock=lambda: now[0])
+        cache.get(self.person.id)
+        now[0] = 11.0
+        with self.assertNumQueries(1):
+            cache.get(self.person.id)
+
+    def test_save_evicts_entry(self):
+        """
+        Test that saving a person drops the stale cache entry.
+        """
+        person_cache.get(self.person.id)
+        self.person.name = "John Renamed"
+        self.person.save()
+        self.assertEqual(person_cache.get(self.person.id).name, "John Renamed")
+
+    def test_assign_with_cached_person(self):
+        """
+        Test that assigning a task only reads the task once the person is cached.
+        """
+        person_cache.get(self.person.id)
+        url = reverse('task-assign', args=[self.task.id])
+        # SELECT the current assignee, then SAVEPOINT, conditional UPDATE,
+        # RELEASE, and UPDATE workload flag (tasks/workload.py); no person query
+        with self.assertNumQueries(5):
+            response = self.client.post(url, {'person_id': self.person.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.assigned_to, self.person)
+
+    def test_assign_task_to_unknown_person(self):
+        """
+        Test that assign_task returns 404 for a person that does not exist.
+        """
+        url = reverse('person-assign-task', args=[9999])
+        response = self.client.post(url, {'task_id': self.task.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cache_stats_requires_staff(self):
+        """
+        Test that only staff users can read the cache counters.
+        """
+        url = reverse('person-cache-stats')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('hit_ratio', response.data)
+
+
+class OpenAPISchemaCacheTests(APITestCase):
+    """
+    Test cases for the cached OpenAPI schema views.
+    """
+    def setUp(self):
+        """
+        Start every test from an empty schema cache.
+        """
+        schema_cache.invalidate()
+        self.addCleanup(schema_cache.invalidate)
+        self.url = reverse('schema-json', kwargs={'format': '.json'})
+
+    def test_schema_is_generated_once(self):
+        """
+        Test that repeated schema requests reuse the generated document.
+        """
+        with mock.patch('taskmanager.schema.generate_schema', wraps=generate_schema) as generate:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+            self.client.get(reverse('schema-json', kwargs={'format': '.yaml'}))
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(generate.call_count, 1)
+        self.assertIn('/tasks/', json.loads(first.content)['paths'])
+
+    def test_etag_revalidation(self):
+        """
+        Test that a client holding the current ETag gets a 304.
+        """
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_prebuilt_artifact_is_served(self):
+        """
+        Test that a matching artifact from build_openapi_schema is used
+        instead of generating the schema.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with self.settings(OPENAPI_SCHEMA={'ARTIFACT_DIR': tmp_dir}):
+                call_command('build_openapi_schema', stdout=StringIO())
+                with mock.patch('taskmanager.schema.generate_schema') as generate:
+                    response = self.client.get(self.url)
+                generate.assert_not_called()
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_stale_artifact_is_ignored(self):
+        """
+        Test that an artifact built from different code is not served.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with self.settings(OPENAPI_SCHEMA={'ARTIFACT_DIR': tmp_dir}):
+                call_command('build_openapi_schema', stdout=StringIO())
+                with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+                    json.dump({'fingerprint': 'old'}, f)
+                with mock.patch('taskmanager.schema.generate_schema', wraps=generate_schema) as generate:
+                    self.client.get(self.url)
+                self.assertEqual(generate.call_count, 1)
+
+    def test_fingerprint_covers_settings_and_every_module(self):
+        """
+        Test that the fingerprint changes with the REST framework settings,
+        and is taken over every module of tasks/ and taskmanager/.
+        """
+        fingerprint = compute_fingerprint()
+        with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'PAGE_SIZE': 7}):
+            self.assertNotEqual(compute_fingerprint(), fingerprint)
+        self.assertEqual(compute_fingerprint(), fingerprint)
+
+        read = []
+        real_read_bytes = Path.read_bytes
+
+        def read_bytes(path):
+            read.append(path.relative_to(settings.BASE_DIR).as_posix())
+            return real_read_bytes(path)
+
+        with mock.patch.object(Path, 'read_bytes', read_bytes):
+            compute_fingerprint()
+        self.assertIn('tasks/pagination.py', read)
+        self.assertIn('tasks/batch.py', read)
+        self.assertIn('taskmanager/settings.py', read)
+
+
+@override_settings(ROOT_URLCONF='taskmanager.urls_api')
+class APIOnlyURLConfTests(APITestCase):
+    """
+    Test cases for the URLconf used by the API-only settings profile.
+    """
+    def test_api_is_routed(self):
+        """
+        Test that the API endpoints are available.
+        """
+        response = self.client.get(reverse('task-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_admin_and_docs_are_not_routed(self):
+        """
+        Test that the admin and docs are left out.
+        """
+        self.assertEqual(self.client.get('/admin/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/swagger/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    """
+    Test cases for token authentication and the verified-token cache.
+    """
+    def setUp(self):
+        """
+        Set up a user, a person to update and an empty token cache.
+        """
+        token_cache.clear()
+        self.user = User.objects.create_user(username='service', password='testpassword123')
+        self.person = Person.objects.create(name="John Doe", email="john.doe@example.com")
+        response = self.client.post(
+            reverse('auth-token'),
+            {'username': 'service', 'password': 'testpassword123'},
+            format='json'
+        )
+        self.key = response.data['token']
+        self.url = reverse('person-profile-update', args=[self.person.id])
+
+    def test_token_grants_access(self):
+        """
+        Test that a token works with the existing IsAuthenticated permission.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+        response = self.client.patch(self.url, {'department': 'Research'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_verified_token_is_cached(self):
+        """
+        Test that a verified token is not looked up in the database again.
+        """
+        authenticator = CachedTokenAuthentication()
+        authenticator.authenticate_credentials(self.key)
+        with self.assertNumQueries(0):
+            user, _ = authenticator.authenticate_credentials(self.key)
+        self.assertEqual(user, self.user)
+
+    def test_revoked_token_is_rejected(self):
+        """
+        Test that DELETE revokes the token, including its cached copy.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+        self.assertEqual(self.client.patch(self.url, {}, format='json').status_code, status.HTTP_200_OK)
+        response = self.client.delete(reverse('auth-token'))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.patch(self.url, {}, format='json')
+        # 403 rather than 401 because SessionAuthentication is listed first
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_deactivated_user_is_rejected(self):
+        """
+        Test that deactivating a user evicts their cached tokens.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+        self.client.patch(self.url, {}, format='json')
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.patch(self.url, {}, format='json')
+        # 403 rather than 401 because SessionAuthentication is listed first
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RateLimitingTests(APITestCase):
+    """
+    Test cases for the token bucket throttle and load shedding middleware.
+    """
+    def setUp(self):
+        """
+        Set up a task and reset the buckets and latency monitor.
+        """
+        get_bucket_store().clear()
+        db_latency.reset()
+        self.addCleanup(get_bucket_store().clear)
+        self.addCleanup(db_latency.reset)
+        self.task = Task.objects.create(title="Test Task")
+
+    def test_bucket_refills_over_time(self):
+        """
+        Test that an empty bucket allows requests again after refilling.
+        """
+        now = [0.0]
+        store = LocalBucketStore(clock=lambda: now[0])
+        self.assertEqual(store.consume('key', rate=1, burst=1), 0)
+        self.assertEqual(store.consume('key', rate=1, burst=1), 1)
+        now[0] = 1.0
+        self.assertEqual(store.consume('key', rate=1, burst=1), 0)
+
+    def test_shared_bucket_limits_burst(self):
+        """
+        Test that the cache-backed store allows BURST requests per window.
+        """
+        store = CacheBucketStore(clock=lambda: 100.0)
+        results = [store.consume('shared', rate=1, burst=3) for _ in range(4)]
+        self.assertEqual(results[:3], [0, 0, 0])
+        self.assertGreater(results[3], 0)
+
+    @override_settings(RATE_LIMITS={'BUCKETS': {'low': {'RATE': 0.1, 'BURST': 2}}})
+    def test_list_calls_are_throttled_before_detail_reads(self):
+        """
+        Test that a client over its list budget gets 429 while single-object
+        reads, which have their own bucket, still work.
+        """
+        url = reverse('task-list')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+        response = self.client.get(reverse('task-detail', args=[self.task.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(LOAD_SHEDDING={'DB_LATENCY_THRESHOLD_MS': 100, 'RETRY_AFTER': 7})
+    def test_slow_database_sheds_low_priority_first(self):
+        """
+        Test that lists are shed before detail reads, and writes never are.
+        """
+        db_latency.record(150)
+        response = self.client.get(reverse('task-list'))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(
+            self.client.get(reverse('task-detail', args=[self.task.id])).status_code,
+            status.HTTP_200_OK
+        )
+
+        db_latency.reset()
+        db_latency.record(500)
+        self.assertEqual(
+            self.client.get(reverse('task-detail', args=[self.task.id])).status_code,
+            status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=user)
+        response = self.client.post(reverse('task-list'), {'title': 'Urgent'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(LOAD_SHEDDING={'DB_LATENCY_THRESHOLD_MS': 100})
+    def test_batched_reads_are_shed_like_separate_calls(self):
+        """
+        Test that a batch, itself a POST, does not get its reads past load
+        shedding.
+        """
+        db_latency.record(150)
+        response = self.client.post(reverse('batch'), {'requests': [
+            {'method': 'GET', 'url': reverse('task-list')},
+            {'method': 'GET', 'url': reverse('task-detail', args=[self.task.id])},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        listed, detail = response.data['responses']
+        self.assertEqual(listed['status'], status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', listed['headers'])
+        self.assertEqual(detail['status'], status.HTTP_200_OK)
+
+    @override_settings(LOAD_SHEDDING={'DB_LATENCY_THRESHOLD_MS': 100})
+    def test_nested_queries_are_shed_like_lists(self):
+        """
+        Test that the query endpoint, a POST that only reads, is low priority.
+        """
+        db_latency.record(150)
+        response = self.client.post(reverse('query'), {'tasks': {}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.json()['priority'], 'low')
+
+
+class ReplicaRoutingTests(APITestCase):
+    """
+    Test cases for read-replica routing and read-your-writes pinning.
+    """
+    def setUp(self):
+        """
+        Set up a task and a user, and forget earlier health checks and pins.
+        """
+        replica_health.reset()
+        self.addCleanup(replica_health.reset)
+        cache.clear()
+        self.task = Task.objects.create(title="Test Task")
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+
+    def test_reads_outside_requests_use_primary(self):
+        """
+        Test that the router only picks a replica inside replica_reads().
+        """
+        router = ReplicaRouter()
+        with override_settings(READ_REPLICAS={'ALIASES': ['replica']}):
+            with mock.patch.object(replica_health, 'is_healthy', return_value=True):
+                self.assertEqual(router.db_for_read(Task), 'default')
+                with replica_reads():
+                    self.assertEqual(router.db_for_read(Task), 'replica')
+                self.assertEqual(router.db_for_write(Task), 'default')
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        """
+        Test that reads go to the primary when no replica is healthy.
+        """
+        with override_settings(READ_REPLICAS={'ALIASES': ['replica']}):
+            with mock.patch.object(replica_health, 'is_healthy', return_value=False):
+                with replica_reads():
+                    self.assertEqual(ReplicaRouter().db_for_read(Task), 'default')
+
+    def test_health_checks_are_rate_limited(self):
+        """
+        Test that a replica is checked at most once per interval.
+        """
+        now = [0.0]
+        health = ReplicaHealth(clock=lambda: now[0])
+        with mock.patch.object(health, 'check', return_value=True) as check:
+            health.is_healthy('replica', interval=30)
+            health.is_healthy('replica', interval=30)
+            self.assertEqual(check.call_count, 1)
+            now[0] = 31.0
+            health.is_healthy('replica', interval=30)
+            self.assertEqual(check.call_count, 2)
+
+    @override_settings(
+        DATABASE_ROUTERS=['tasks.routers.ReplicaRouter'],
+        READ_REPLICAS={'ALIASES': ['replica'], 'STICKY_SECONDS': 60},
+    )
+    def test_client_reads_its_own_writes(self):
+        """
+        Test that GETs use a replica until the client writes, and then the
+        primary for the sticky window.
+        """
+        self.client.force_authenticate(user=self.user)
+        detail_url = reverse('task-detail', args=[self.task.id])
+        with mock.patch('tasks.routers.choose_replica', return_value='default') as choose:
+            self.client.get(detail_url)
+            self.assertTrue(choose.called)
+
+            person = Person.objects.create(name="John Doe", email="john.doe@example.com")
+            response = self.client.post(
+                reverse('task-assign', args=[self.task.id]), {'person_id': person.id}, format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            choose.reset_mock()
+            response = self.client.get(detail_url)
+            self.assertEqual(response.data['assigned_to'], person.id)
+            self.assertFalse(choose.called)
+
+
+@skipUnless('replica' in settings.DATABASES, 'needs DJANGO_SETTINGS_MODULE=taskmanager.settings_replica')
+class ReplicaDatabaseTests(TransactionTestCase):
+    """
+    Test cases for replica routing against two real SQLite databases.
+
+    Run them with:
+        DJANGO_SETTINGS_MODULE=taskmanager.settings_replica python manage.py test tasks.tests.ReplicaDatabaseTests
+    """
+    # Every configured database, so the class can be collected (and skipped)
+    # under the single-database settings too
+    databases = set(settings.DATABASES)
+
+    def setUp(self):
+        """
+        Create a task, then "replicate" the primary into the replica.
+        """
+        replica_health.reset()
+        cache.clear()
+        caches[get_replica_options()['CACHE_ALIAS']].clear()
+        self.task = Task.objects.create(title="Replicated Task")
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.replicate()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def replicate(self):
+        # SQLite has no replication; copy the whole primary file instead
+        connections['default'].ensure_connection()
+        connections['replica'].ensure_connection()
+        connections['default'].connection.backup(connections['replica'].connection)
+
+    def test_get_reads_from_replica_until_client_writes(self):
+        """
+        Test that a lagging replica serves GETs, and the client sees its own
+        write right after making it.
+        """
+        Task.objects.filter(pk=self.task.pk).update(title="Changed On Primary")
+        detail_url = reverse('task-detail', args=[self.task.id])
+
+        response = self.client.get(detail_url)
+        self.assertEqual(response.data['title'], "Replicated Task")
+
+        self.client.patch(detail_url, {'title': "Written By Client"}, format='json')
+        response = self.client.get(detail_url)
+        self.assertEqual(response.data['title'], "Written By Client")
+
+    def test_pins_are_seen_by_other_processes(self):
+        """
+        Test that a write pin is visible to another server process, so the
+        client's next read is pinned whichever worker serves it.
+        """
+        self.client.patch(reverse('task-detail', args=[self.task.id]), {'title': "Pinned"}, format='json')
+        request = RequestFactory().get('/')
+        request.user = self.user
+        script = (
+            'import django, sys; django.setup()\n'
+            'from django.core.cache import caches\n'
+            'from tasks.routers import get_options\n'
+            'print(caches[get_options()["CACHE_ALIAS"]].get(sys.argv[1]))\n'
+        )
+        worker = subprocess.run(
+            [sys.executable, '-c', script, client_pin_key(request)],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        )
+        self.assertEqual(worker.stdout.strip(), '1')
+
+
+@override_settings(TASK_SHARDS={})
+class ShardingUnitTests(TestCase):
+    """
+    Test cases for shard selection, task ids and the scatter-gather merge.
+    """
+    def test_shard_for_assignee(self):
+        """
+        Test that tasks are spread by assignee id, or by department.
+        """
+        with override_settings(TASK_SHARDS={'ALIASES': ['shard0', 'shard1']}):
+            self.assertEqual(shard_for_assignee(None), 'shard0')
+            self.assertEqual(shard_for_assignee(4), 'shard0')
+            self.assertEqual(shard_for_assignee(7), 'shard1')
+        person = Person.objects.create(name="Jane", email="jane@example.com", department="Sales")
+        with override_settings(TASK_SHARDS={'ALIASES': ['shard0', 'shard1'], 'KEY': 'department'}):
+            self.assertEqual(shard_for_assignee(person.pk), shard_for_assignee(12345, 'Sales'))
+
+    def test_task_ids_are_unique_and_increasing(self):
+        """
+        Test that ids from one generator increase, even within a millisecond.
+        """
+        generator = TaskIdGenerator(clock=lambda: 1800000000.0)
+        ids = [generator() for _ in range(300)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertLess(ids[-1], 2 ** 53)
+
+    def test_merge_matches_single_query_ordering(self):
+        """
+        Test that merging partial querysets gives the order and pages of one
+        query over all rows, NULL due dates last.
+        """
+        for i in range(12):
+            Task.objects.create(
+                title=f"Task {i}",
+                priority=i % 3,
+                due_date=None if i % 4 == 0 else timezone.now().date() + timedelta(days=i % 5),
+            )
+        parts = [Task.objects.filter(priority=1), Task.objects.exclude(priority=1)]
+        expected = list(Task.objects.order_by(*order_by_for(Task.objects.all())))
+
+        merged = ShardedTaskList(parts)
+        self.assertEqual(merged.count(), 12)
+        self.assertEqual(list(merged), expected)
+        self.assertEqual(merged[5:9], expected[5:9])
+        self.assertEqual(merged[3], expected[3])
+
+        descending = ShardedTaskList([part.order_by('-priority', 'title') for part in parts])
+        self.assertEqual(
+            list(descending),
+            list(Task.objects.order_by('-priority', 'title', 'id')),
+        )
+
+
+@skipUnless('shard0' in settings.DATABASES, 'needs DJANGO_SETTINGS_MODULE=taskmanager.settings_sharded')
+class ShardingTests(APITestCase):
+    """
+    Test cases for the sharded Task table against several SQLite databases.
+
+    Run them with:
+        DJANGO_SETTINGS_MODULE=taskmanager.settings_sharded python manage.py test tasks.tests.ShardingTests
+    """
+    # Every configured database, so the class can be collected (and skipped)
+    # under the single-database settings too
+    databases = set(settings.DATABASES)
+
+    def setUp(self):
+        """
+        Set up persons on each shard and an authenticated client.
+        """
+        person_cache.clear()
+        self.alice = Person.objects.create(name="Alice", email="alice@example.com")
+        self.bob = Person.objects.create(name="Bob", email="bob@example.com")
+        self.assertNotEqual(shard_for_person(self.alice), shard_for_person(self.bob))
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+
+    def shard_of(self, task_id):
+        return [
+            alias for alias in settings.TASK_SHARDS['ALIASES']
+            if Task.objects.using(alias).filter(pk=task_id).exists()
+        ]
+
+    def test_tasks_are_stored_on_the_assignee_shard(self):
+        """
+        Test that persons are copied to every shard and tasks go to one.
+        """
+        for alias in settings.TASK_SHARDS['ALIASES']:
+            self.assertTrue(Person.objects.using(alias).filter(pk=self.bob.pk).exists())
+        response = self.client.post(
+            reverse('task-list'), {'title': "Bob's Task", 'assigned_to': self.bob.pk}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.shard_of(response.data['id']), [shard_for_person(self.bob)])
+        self.assertFalse(Task.objects.using('default').exists())
+
+    def test_list_merges_shards_in_model_order(self):
+        """
+        Test that the task list is ordered and paginated across shards.
+        """
+        for i in range(15):
+            Task.objects.create(
+                title=f"Task {i}",
+                priority=i % 4,
+                assigned_to=self.alice if i % 2 else self.bob,
+            )
+        expected = sorted(
+            (task for alias in settings.TASK_SHARDS['ALIASES'] for task in Task.objects.using(alias).all()),
+            key=lambda task: (task.priority, task.created_at, task.id),
+        )
+
+        first = self.client.get(reverse('task-list'))
+        second = self.client.get(reverse('task-list'), {'page': 2})
+        self.assertEqual(first.data['count'], 15)
+        self.assertEqual(
+            [task['id'] for task in first.data['results'] + second.data['results']],
+            [task.id for task in expected],
+        )
+
+        response = self.client.get(reverse('task-list'), {'ordering': '-priority'})
+        priorities = [task['priority'] for task in response.data['results']]
+        self.assertEqual(priorities, sorted(priorities, reverse=True))
+
+    def test_single_shard_queries(self):
+        """
+        Test the assignee filter and a person's task list.
+        """
+        Task.objects.create(title="Alice's Task", assigned_to=self.alice)
+        Task.objects.create(title="Bob's Task", assigned_to=self.bob)
+
+        response = self.client.get(reverse('task-list'), {'assigned_to': self.alice.pk})
+        self.assertEqual([task['title'] for task in response.data['results']], ["Alice's Task"])
+
+        response = self.client.get(reverse('person-tasks', args=[self.bob.pk]))
+        self.assertEqual([task['title'] for task in response.data['assigned_tasks']], ["Bob's Task"])
+
+    def test_assign_moves_task_between_shards(self):
+        """
+        Test that reassigning a task moves it and keeps its creation time.
+        """
+        task = Task.objects.create(title="Moving Task", assigned_to=self.alice)
+        created_at = Task.objects.using(shard_for_person(self.alice)).get(pk=task.pk).created_at
+
+        response = self.client.post(
+            reverse('task-assign', args=[task.pk]), {'person_id': self.bob.pk}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.shard_of(task.pk), [shard_for_person(self.bob)])
+
+        response = self.client.get(reverse('task-detail', args=[task.pk]))
+        self.assertEqual(response.data['assigned_to'], self.bob.pk)
+        self.assertEqual(Task.objects.using(shard_for_person(self.bob)).get(pk=task.pk).created_at, created_at)
+
+        response = self.client.post(reverse('task-unassign', args=[task.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.client.get(reverse('task-unassigned-tasks')).data), 1)
+
+    def test_deleting_person_unassigns_tasks_on_shards(self):
+        """
+        Test that deleting a person clears the assignee of their tasks.
+        """
+        task = Task.objects.create(title="Orphaned Task", assigned_to=self.bob)
+        self.bob.delete()
+        self.assertIsNone(get_task(task.pk).assigned_to_id)
+
+    def test_tasks_are_archived_on_their_shard(self):
+        """
+        Test that archiving keeps each task on its shard and that
+        ?include_archived=1 merges the archives of every shard.
+        """
+        for person in (self.alice, self.bob):
+            Task.objects.create(title=f"{person.name}'s Done", status='completed', completed=True, assigned_to=person)
+            Task.objects.create(title=f"{person.name}'s Open", assigned_to=person)
+        for alias in settings.TASK_SHARDS['ALIASES']:
+            Task.objects.using(alias).update(updated_at=timezone.now() - timedelta(days=200))
+
+        self.assertEqual(archive_tasks(), 2)
+        for person in (self.alice, self.bob):
+            self.assertTrue(
+                ArchivedTask.objects.using(shard_for_person(person)).filter(assigned_to=person).exists()
+            )
+        response = self.client.get(reverse('task-list'), {'include_archived': '1'})
+        self.assertEqual(response.data['count'], 4)
+        response = self.client.get(reverse('task-completed-tasks'), {'include_archived': '1'})
+        self.assertEqual(sorted(task['title'] for task in response.data), ["Alice's Done", "Bob's Done"])
+
+    def test_purge_deleted_person_on_shards(self):
+        """
+        Test that purging a soft-deleted person unassigns their tasks and
+        removes their copies from every shard.
+        """
+        task = Task.objects.create(title="Bob's Task", assigned_to=self.bob)
+        self.bob.soft_delete()
+        for alias in settings.TASK_SHARDS['ALIASES']:
+            self.assertIsNotNone(Person.all_objects.using(alias).get(pk=self.bob.pk).deleted_at)
+
+        self.assertEqual(purge_deleted(after_hours=0), {'tasks': 0, 'persons': 1, 'unassigned': 1})
+        self.assertIsNone(get_task(task.pk).assigned_to_id)
+        for alias in settings.DATABASES:
+            self.assertFalse(Person.all_objects.using(alias).filter(pk=self.bob.pk).exists())
+
+
+class JobQueueTests(APITestCase):
+    """
+    Test cases for the background job queue and its API.
+    """
+    def setUp(self):
+        """
+        Set up a person, some tasks and an authenticated client.
+        """
+        self.person = Person.objects.create(name="Jane Smith", email="jane@example.com")
+        self.tasks = [Task.objects.create(title=f"Task {i}") for i in range(3)]
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('job-list')
+
+    def test_submit_returns_202_and_worker_runs_job(self):
+        """
+        Test that a submitted job is queued, then run by a worker.
+        """
+        payload = {'task_ids': [task.id for task in self.tasks] + [9999], 'person_id': self.person.id}
+        response = self.client.post(self.url, {'kind': 'bulk_reassign', 'payload': payload}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], Job.QUEUED)
+        self.assertTrue(response['Location'].endswith(reverse('job-detail', args=[response.data['id']])))
+        self.assertFalse(Task.objects.filter(assigned_to=self.person).exists())
+
+        self.assertEqual(Worker(worker_id='test').run(burst=True), 1)
+
+        response = self.client.get(response['Location'])
+        self.assertEqual(response.data['status'], Job.SUCCEEDED)
+        self.assertEqual(response.data['result'], {'updated': 3, 'missing': [9999]})
+        self.assertEqual(Task.objects.filter(assigned_to=self.person).count(), 3)
+
+    def test_payload_is_validated_on_submit(self):
+        """
+        Test that unknown kinds and bad payloads are rejected with 400.
+        """
+        response = self.client.post(self.url, {'kind': 'no_such_job'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            self.url, {'kind': 'bulk_reassign', 'payload': {'task_ids': [1], 'person_id': 9999}}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('person_id', response.data['payload'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_users_only_see_their_own_jobs(self):
+        """
+        Test that jobs of other users are hidden, and anonymous users refused.
+        """
+        other = User.objects.create_user(username='other', password='testpassword123')
+        job = enqueue('rebuild_stats', user=other)
+        self.assertEqual(self.client.get(reverse('job-detail', args=[job.id])).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(JOBS={'MAX_ATTEMPTS': 2, 'RETRY_DELAY': 10})
+    def test_failed_job_is_retried_then_fails(self):
+        """
+        Test that a failing job backs off, is retried, and finally fails.
+        """
+        handler = mock.Mock(side_effect=RuntimeError("boom"))
+        with mock.patch.dict(JOB_KINDS, {'flaky': JobKind(handler, None)}):
+            job = enqueue('flaky')
+            self.assertEqual(Worker(worker_id='test').run(burst=True), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+            self.assertIn('boom', job.error)
+            self.assertGreater(job.run_after, timezone.now())
+
+            # Not runnable until the backoff has passed
+            self.assertEqual(Worker(worker_id='test').run(burst=True), 0)
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.assertEqual(Worker(worker_id='test').run(burst=True), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+            self.assertEqual(handler.call_count, 2)
+
+    @override_settings(JOBS={'CONCURRENCY': {'export': 1}})
+    def test_concurrency_limit_per_kind(self):
+        """
+        Test that a kind at its limit is skipped in favour of other kinds.
+        """
+        running = enqueue('export', {'model': 'task'})
+        Job.objects.filter(pk=running.pk).update(status=Job.RUNNING, locked_at=timezone.now())
+        enqueue('export', {'model': 'person'})
+        stats = enqueue('rebuild_stats')
+        self.assertEqual(claim_job('test').pk, stats.pk)
+        self.assertIsNone(claim_job('test'))
+
+    @override_settings(JOBS={'LEASE_SECONDS': 60})
+    def test_job_of_lost_worker_is_requeued(self):
+        """
+        Test that a running job whose lease expired goes back in the queue.
+        """
+        job = enqueue('rebuild_stats')
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING, attempts=1, locked_at=timezone.now() - timedelta(minutes=5)
+        )
+        self.assertEqual(requeue_expired(), 1)
+        self.assertEqual(claim_job('test').pk, job.pk)
+
+    def test_run_worker_command(self):
+        """
+        Test that run_worker --burst runs the queued jobs and exits.
+        """
+        enqueue('sample_data', {'count': 5})
+        out = StringIO()
+        call_command('run_worker', '--burst', stdout=out)
+        self.assertIn('Ran 1 job(s)', out.getvalue())
+        self.assertEqual(Task.objects.count(), 8)
+
+
+class NextUpAndOverdueTests(APITestCase):
+    """
+    Test cases for the next_up and overdue actions, checked against the
+    naive query over all tasks.
+    """
+    def setUp(self):
+        """
+        Set up two persons and a mix of open, completed, dated and undated tasks.
+        """
+        self.alice = Person.objects.create(name="Alice", email="alice@example.com")
+        self.bob = Person.objects.create(name="Bob", email="bob@example.com")
+        self.today = timezone.localdate()
+        for i in range(40):
+            Task.objects.create(
+                title=f"Task {i}",
+                priority=i % 4,
+                due_date=None if i % 7 == 0 else self.today + timedelta(days=i % 9 - 4),
+                completed=i % 5 == 0,
+                assigned_to=[self.alice, self.bob, None][i % 3],
+            )
+
+    def naive(self, predicate, key, limit):
+        tasks = [task for task in Task.objects.all() if predicate(task)]
+        return [task.id for task in sorted(tasks, key=key)][:limit]
+
+    def next_up_key(self, task):
+        # SQLite sorts NULL first, as in the API's default ordering
+        return (task.priority, task.due_date is not None, task.due_date or self.today, task.created_at, task.id)
+
+    def test_next_up_matches_naive_query(self):
+        """
+        Test the global and per-person next_up lists.
+        """
+        response = self.client.get(reverse('task-next-up'), {'limit': 7})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [task['id'] for task in response.data],
+            self.naive(lambda task: not task.completed, self.next_up_key, 7),
+        )
+
+        response = self.client.get(reverse('task-next-up'), {'assigned_to': self.bob.id})
+        self.assertEqual(
+            [task['id'] for task in response.data],
+            self.naive(lambda task: not task.completed and task.assigned_to_id == self.bob.id, self.next_up_key, 10),
+        )
+
+    def test_overdue_matches_naive_query(self):
+        """
+        Test overdue tasks, with and without due-soon ones.
+        """
+        def key(task):
+            return (task.due_date, task.priority, task.id)
+
+        response = self.client.get(reverse('task-overdue'), {'limit': 100})
+        expected = self.naive(
+            lambda task: not task.completed and task.due_date is not None and task.due_date < self.today, key, 100
+        )
+        self.assertTrue(expected)
+        self.assertEqual([task['id'] for task in response.data], expected)
+
+        response = self.client.get(
+            reverse('task-overdue'), {'within_days': 2, 'assigned_to': self.alice.id, 'limit': 100}
+        )
+        soon = self.today + timedelta(days=2)
+        self.assertEqual(
+            [task['id'] for task in response.data],
+            self.naive(
+                lambda task: (not task.completed and task.assigned_to_id == self.alice.id
+                              and task.due_date is not None and task.due_date <= soon),
+                key, 100,
+            ),
+        )
+
+    def test_invalid_parameters(self):
+        """
+        Test that bad limits and ids are rejected with 400.
+        """
+        for params in ({'limit': 0}, {'limit': 'ten'}, {'limit': 1000}, {'assigned_to': 'x'}):
+            response = self.client.get(reverse('task-next-up'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+        response = self.client.get(reverse('task-overdue'), {'within_days': -1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @skipUnless(connection.vendor == 'sqlite', 'checks SQLite query plans')
+    def test_queries_use_partial_indexes(self):
+        """
+        Test that the database reads the top K from an index, not a sort.
+        """
+        queries = {
+            'task_open_by_priority': Task.objects.filter(completed=False)
+            .order_by('priority', 'due_date', 'created_at', 'id')[:10],
+            'task_open_by_assignee': Task.objects.filter(completed=False, assigned_to=self.alice.id)
+            .order_by('priority', 'due_date', 'created_at', 'id')[:10],
+            'task_open_by_due_date': Task.objects.filter(completed=False, due_date__lt=self.today)
+            .order_by('due_date', 'priority', 'id')[:10],
+        }
+        for index_name, queryset in queries.items():
+            plan = queryset.explain()
+            self.assertIn(index_name, plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+
+class WorkloadTests(APITestCase):
+    """
+    Test cases for the materialized workload summary.
+    """
+    def setUp(self):
+        """
+        Set up persons in two departments with a mix of tasks.
+        """
+        self.url = reverse('person-workload')
+        self.alice = Person.objects.create(name="Alice", email="alice@example.com", department="Engineering")
+        self.bob = Person.objects.create(name="Bob", email="bob@example.com", department="Engineering")
+        self.carol = Person.objects.create(name="Carol", email="carol@example.com", department="Sales")
+        yesterday = timezone.localdate() - timedelta(days=1)
+        for i in range(12):
+            Task.objects.create(
+                title=f"Task {i}",
+                priority=i % 3,
+                due_date=yesterday if i % 4 == 0 else None,
+                completed=i % 5 == 0,
+                assigned_to=[self.alice, self.bob, self.carol, None][i % 4],
+            )
+
+    def naive(self):
+        """
+        The on-the-fly aggregate the summary replaces, per person id.
+        """
+        today = timezone.localdate()
+        result = {}
+        for person in Person.objects.all():
+            tasks = [task for task in Task.objects.filter(assigned_to=person) if not task.completed]
+            priorities = {}
+            for task in tasks:
+                priorities[str(task.priority)] = priorities.get(str(task.priority), 0) + 1
+            result[person.id] = {
+                'open_tasks': len(tasks),
+                'overdue_tasks': sum(1 for task in tasks if task.due_date and task.due_date < today),
+                'priority_counts': priorities,
+            }
+        return result
+
+    def summary_by_person(self, data):
+        return {
+            person['id']: {key: person[key] for key in ('open_tasks', 'overdue_tasks', 'priority_counts')}
+            for department in data['departments'] for person in department['persons']
+        }
+
+    def test_summary_matches_naive_aggregate(self):
+        """
+        Test the per-person numbers and the department grouping.
+        """
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['refreshed_rows'], 3)
+        self.assertEqual(self.summary_by_person(response.data), self.naive())
+        self.assertEqual([d['department'] for d in response.data['departments']], ["Engineering", "Sales"])
+        engineering = response.data['departments'][0]
+        self.assertEqual(engineering['open_tasks'], sum(p['open_tasks'] for p in engineering['persons']))
+
+        response = self.client.get(self.url, {'department': "Sales"})
+        self.assertEqual([p['name'] for d in response.data['departments'] for p in d['persons']], ["Carol"])
+
+    def test_task_changes_refresh_only_affected_rows(self):
+        """
+        Test that reassigning and completing tasks recomputes just the
+        rows of the persons involved.
+        """
+        self.client.get(self.url)
+        task = Task.objects.filter(assigned_to=self.alice, completed=False).first()
+        task.assigned_to = self.bob
+        task.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['refreshed_rows'], 2)
+        self.assertEqual(self.summary_by_person(response.data), self.naive())
+
+        Task.objects.get(pk=task.pk).delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['refreshed_rows'], 1)
+        self.assertEqual(self.summary_by_person(response.data), self.naive())
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['refreshed_rows'], 0)
+
+    def test_rows_from_before_today_are_recomputed(self):
+        """
+        Test that overdue counts are recomputed once the date changes.
+        """
+        self.client.get(self.url)
+        PersonWorkload.objects.filter(person=self.carol).update(
+            refreshed_at=timezone.now() - timedelta(days=1), overdue_tasks=0
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['refreshed_rows'], 1)
+        self.assertEqual(self.summary_by_person(response.data), self.naive())
+
+    def test_refresh_on_read_uses_the_primary(self):
+        """
+        Test that a GET refreshing rows does not read or write them through
+        a replica, although the viewset serves GETs from replicas.
+        """
+        router = ReplicaRouter()
+        databases = []
+        real_refresh_stale = workload.refresh_stale
+
+        def refresh_stale():
+            databases.append(router.db_for_read(Task))
+            return real_refresh_stale()
+
+        with override_settings(READ_REPLICAS={'ALIASES': ['replica']}), \
+                mock.patch.object(replica_health, 'is_healthy', return_value=True), \
+                mock.patch.object(workload, 'refresh_stale', side_effect=refresh_stale):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(databases, ['default'])
+        self.assertEqual(self.summary_by_person(response.data), self.naive())
+
+    @override_settings(WORKLOAD={'REFRESH_ON_READ': False})
+    def test_periodic_refresh_only(self):
+        """
+        Test that without refresh on read rows are flagged stale until
+        refresh_workload runs.
+        """
+        call_command('refresh_workload', stdout=StringIO())
+        Task.objects.create(title="New Task", assigned_to=self.carol)
+
+        response = self.client.get(self.url)
+        carol = self.summary_by_person(response.data)[self.carol.id]
+        self.assertEqual(carol['open_tasks'], self.naive()[self.carol.id]['open_tasks'] - 1)
+        stale = {p['id']: p['stale'] for d in response.data['departments'] for p in d['persons']}
+        self.assertEqual(stale, {self.alice.id: False, self.bob.id: False, self.carol.id: True})
+
+        out = StringIO()
+        call_command('refresh_workload', '--stale-only', stdout=out)
+        self.assertIn('Refreshed 1 workload row(s)', out.getvalue())
+        response = self.client.get(self.url)
+        self.assertEqual(self.summary_by_person(response.data), self.naive())
+
+
+class AdminChangelistTests(TestCase):
+    """
+    Test cases for the Task and Person admin changelists at scale.
+    """
+    def setUp(self):
+        """
+        Log in as a superuser.
+        """
+        self.admin = User.objects.create_superuser(username='admin', password='adminpassword123')
+        self.client.force_login(self.admin)
+
+    def create_tasks(self, count):
+        start = Person.objects.count()
+        for i in range(start, start + count):
+            person = Person.objects.create(name=f"Person {i}", email=f"person{i}@example.com")
+            Task.objects.create(title=f"Task {i}", assigned_to=person)
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    def test_task_changelist_queries_do_not_grow_with_rows(self):
+        """
+        Test that assignees are joined rather than fetched row by row, and
+        that the filter sidebar does not list every person.
+        """
+        url = reverse('admin:tasks_task_changelist')
+        self.create_tasks(3)
+        _, few = self.changelist_queries(url)
+        self.create_tasks(20)
+        response, many = self.changelist_queries(url)
+        self.assertEqual(few, many)
+        self.assertNotContains(response, '?assigned_to__id__exact=')
+        self.assertContains(response, 'assigned_to__isempty')
+
+    def test_task_form_uses_autocomplete(self):
+        """
+        Test that the assignee widget does not render every person.
+        """
+        self.create_tasks(2)
+        response = self.client.get(reverse('admin:tasks_task_add'))
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, 'Person 1</option>')
+
+    @skipUnless(connection.vendor == 'sqlite', 'reads SQLite statistics')
+    def test_large_unfiltered_changelist_uses_estimated_count(self):
+        """
+        Test that the table statistics replace COUNT(*) above the limit,
+        while filtered lists are still counted exactly.
+        """
+        self.create_tasks(12)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        url = reverse('admin:tasks_task_changelist')
+        with mock.patch.object(EstimatedCountPaginator, 'exact_count_limit', 5):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.context['cl'].result_count, 12)
+            self.assertFalse([q for q in queries if 'COUNT(' in q['sql'] and 'tasks_task' in q['sql']])
+
+            response = self.client.get(url, {'status__exact': 'pending'})
+            self.assertEqual(response.context['cl'].result_count, 12)
+
+        self.assertIsNone(table_row_estimate(Job))
+
+
+@override_settings(PAGINATION_COUNTS={'EXACT_COUNT_LIMIT': 5, 'CACHE_TTL': 60})
+class ApproximateCountPaginationTests(APITestCase):
+    """
+    Test cases for approximate counts in paginated list responses.
+    """
+    def setUp(self):
+        """
+        Set up more tasks than the exact count limit.
+        """
+        cache.clear()
+        for i in range(25):
+            Task.objects.create(title=f"Task {i}", status='pending' if i % 5 else 'completed')
+        self.url = reverse('task-list')
+
+    def count_queries(self, queries):
+        return [q['sql'] for q in queries if 'COUNT(' in q['sql']]
+
+    def test_small_results_are_counted_exactly(self):
+        """
+        Test that results under the limit get an exact count.
+        """
+        response = self.client.get(self.url, {'status': 'completed'})
+        self.assertEqual(response.data['count'], 5)
+        self.assertTrue(response.data['count_is_exact'])
+
+    @skipUnless(connection.vendor == 'sqlite', 'reads SQLite statistics')
+    def test_unfiltered_count_comes_from_statistics(self):
+        """
+        Test that a large unfiltered list is counted from sqlite_stat1,
+        reading at most limit + 1 rows itself.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        Task.objects.create(title="Not In The Statistics Yet")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['count'], 25)
+        self.assertFalse(response.data['count_is_exact'])
+        self.assertEqual(len(self.count_queries(queries)), 1)
+        self.assertIn('LIMIT 6', self.count_queries(queries)[0])
+
+    def test_filtered_count_is_cached_per_filter_set(self):
+        """
+        Test that without statistics a filtered count is cached per query.
+        """
+        self.client.get(self.url, {'status': 'pending'})
+        Task.objects.create(title="New Task", status='pending')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'status': 'pending'})
+        self.assertEqual(response.data['count'], 20)
+        self.assertFalse(response.data['count_is_exact'])
+        self.assertEqual(len(self.count_queries(queries)), 1)
+
+        response = self.client.get(self.url, {'status': 'pending', 'priority': 0})
+        self.assertEqual(response.data['count'], 21)
+
+    def test_short_last_page_gives_exact_count(self):
+        """
+        Test that the last page corrects an estimate and has no next link.
+        """
+        with mock.patch('tasks.pagination.cached_count', return_value=40):
+            response = self.client.get(self.url, {'page': 3})
+        self.assertEqual(response.data['count'], 25)
+        self.assertTrue(response.data['count_is_exact'])
+        self.assertIsNone(response.data['next'])
+
+    def test_pages_past_a_low_estimate_are_served(self):
+        """
+        Test that an estimate below the real count neither cuts pages short
+        nor turns the pages after it into 404s.
+        """
+        with mock.patch('tasks.pagination.cached_count', return_value=12):
+            second = self.client.get(self.url, {'page': 2})
+            third = self.client.get(self.url, {'page': 3})
+            past_the_end = self.client.get(self.url, {'page': 9})
+        self.assertEqual(len(second.data['results']), 10)
+        self.assertEqual(second.data['count'], 20)
+        self.assertFalse(second.data['count_is_exact'])
+        self.assertIn('page=3', second.data['next'])
+        self.assertEqual(third.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(third.data['results']), 5)
+        self.assertEqual(third.data['count'], 25)
+        self.assertTrue(third.data['count_is_exact'])
+        self.assertEqual(past_the_end.status_code, status.HTTP_200_OK)
+        self.assertEqual(past_the_end.data['results'], [])
+
+        paginator = EstimatedCountPaginator(Task.objects.order_by('id'), 10)
+        with mock.patch('tasks.pagination.table_row_estimate', return_value=12_000), \
+                mock.patch.object(EstimatedCountPaginator, 'exact_count_limit', 5):
+            self.assertEqual(len(paginator.page(2).object_list), 10)
+            self.assertEqual(len(paginator.page(1300).object_list), 0)
+
+
+class ResponseCompressionTests(APITestCase):
+    """
+    Test cases for response compression and the compact JSON mode.
+    """
+    def setUp(self):
+        """
+        Set up enough tasks for a list response above the size threshold.
+        """
+        for i in range(10):
+            Task.objects.create(title=f"Task {i} with a rather long title to describe it")
+        self.url = reverse('task-list')
+
+    def test_accept_encoding_negotiation(self):
+        """
+        Test q-values, refusals and the wildcard in Accept-Encoding.
+        """
+        self.assertEqual(parse_accept_encoding('gzip;q=0.5, br'), {'gzip': 0.5, 'br': 1.0})
+        self.assertEqual(choose_encoder('gzip, deflate').name, 'gzip')
+        self.assertEqual(choose_encoder('*').name, choose_encoder('*;q=0.1').name)
+        self.assertIsNone(choose_encoder('gzip;q=0'))
+        self.assertIsNone(choose_encoder('identity'))
+        self.assertIsNone(choose_encoder(''))
+
+    def test_list_is_gzipped(self):
+        """
+        Test that a large JSON response is gzipped for clients that accept it.
+        """
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+    def test_small_response_is_not_compressed(self):
+        """
+        Test that bodies under MIN_SIZE are sent as they are.
+        """
+        task = Task.objects.first()
+        response = self.client.get(reverse('task-detail', args=[task.id]), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_encoded_and_streamed_responses(self):
+        """
+        Test that encoded bodies are left alone and streams are compressed
+        chunk by chunk.
+        """
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        body = b'x' * 2048
+
+        encoded = HttpResponse(body, content_type='application/json')
+        encoded['Content-Encoding'] = 'br'
+        middleware = CompressionMiddleware(lambda request: encoded)
+        self.assertEqual(middleware(request).content, body)
+
+        chunks = [b'{"a": "' + b'y' * 100, b'z' * 100 + b'"}']
+        streamed = StreamingHttpResponse(iter(chunks), content_type='application/json')
+        response = CompressionMiddleware(lambda request: streamed)(request)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b''.join(chunks))
+
+    def test_strong_etag_body_is_compressed_once(self):
+        """
+        Test that the compressed body of a strong-ETag response is reused,
+        sent with a weak ETag that still revalidates the schema.
+        """
+        url = reverse('schema-json', kwargs={'format': '.json'})
+        with mock.patch('tasks.compression.GzipEncoder.compress', autospec=True,
+                        side_effect=lambda encoder, data: gzip.compress(data)) as compress:
+            first = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            second = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(compress.call_count, 1)
+        self.assertTrue(first['ETag'].startswith('W/"'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_compact_mode(self):
+        """
+        Test that ?compact=1 and the compact media type parameter drop nulls
+        and indentation.
+        """
+        response = self.client.get(self.url, {'compact': '1'})
+        task = json.loads(response.content)['results'][0]
+        self.assertNotIn('due_date', task)
+        self.assertNotIn(b'\n', response.content)
+
+        response = self.client.get(self.url, HTTP_ACCEPT='application/json; compact=true; indent=4')
+        self.assertNotIn(b'\n', response.content)
+        self.assertNotIn('due_date', json.loads(response.content)['results'][0])
+
+        task = json.loads(self.client.get(self.url).content)['results'][0]
+        self.assertIsNone(task['due_date'])
+
+
+class BatchRequestTests(APITestCase):
+    """
+    Test cases for the batch endpoint.
+    """
+    def setUp(self):
+        """
+        Set up a person with a task and a user.
+        """
+        self.person = Person.objects.create(name="Batch Person", email="batch@example.com")
+        self.task = Task.objects.create(title="Batched Task", assigned_to=self.person)
+        self.user = User.objects.create_user(username='batchuser', password='testpassword123')
+        self.url = reverse('batch')
+
+    def batch(self, requests, **kwargs):
+        return self.client.post(self.url, {'requests': requests, **kwargs}, format='json')
+
+    def test_reads_match_separate_calls(self):
+        """
+        Test that each read in a batch answers like the same call made alone.
+        """
+        person_url = reverse('person-detail', args=[self.person.id])
+        tasks_url = f"{reverse('task-list')}?assigned_to={self.person.id}"
+        response = self.batch([
+            {'method': 'GET', 'url': person_url},
+            {'method': 'GET', 'url': tasks_url},
+            {'method': 'GET', 'url': '/api/no-such-endpoint/'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['committed'])
+        person, tasks, missing = response.data['responses']
+        self.assertEqual(person['status'], 200)
+        self.assertEqual(person['body'], json.loads(self.client.get(person_url).content))
+        self.assertEqual(tasks['body'], json.loads(self.client.get(tasks_url).content))
+        self.assertEqual(missing['status'], 404)
+
+    def test_writes_share_authentication_and_commit(self):
+        """
+        Test that writes run as the batch's user, in order, and are saved.
+        """
+        self.client.force_authenticate(user=self.user)
+        response = self.batch([
+            {'method': 'POST', 'url': reverse('task-list'), 'body': {'title': "Created In Batch"}},
+            {'method': 'PATCH', 'url': reverse('task-detail', args=[self.task.id]), 'body': {'priority': 3}},
+            {'method': 'GET', 'url': reverse('task-detail', args=[self.task.id])},
+        ])
+        statuses = [sub['status'] for sub in response.data['responses']]
+        self.assertEqual(statuses, [201, 200, 200])
+        self.assertTrue(response.data['committed'])
+        self.assertEqual(response.data['responses'][2]['body']['priority'], 3)
+        self.assertTrue(Task.objects.filter(title="Created In Batch").exists())
+
+    def test_failed_write_rolls_back_the_batch(self):
+        """
+        Test that a failing request undoes the earlier writes and skips the
+        later ones.
+        """
+        self.client.force_authenticate(user=self.user)
+        response = self.batch([
+            {'method': 'POST', 'url': reverse('task-list'), 'body': {'title': "Rolled Back"}},
+            {'method': 'PATCH', 'url': reverse('task-detail', args=[999999]), 'body': {'priority': 3}},
+            {'method': 'DELETE', 'url': reverse('task-detail', args=[self.task.id])},
+        ])
+        statuses = [sub['status'] for sub in response.data['responses']]
+        self.assertEqual(statuses, [201, 404, 424])
+        self.assertFalse(response.data['committed'])
+        self.assertFalse(Task.objects.filter(title="Rolled Back").exists())
+        self.assertTrue(Task.objects.filter(pk=self.task.pk).exists())
+
+    def test_anonymous_writes_are_refused_per_request(self):
+        """
+        Test that sub-requests are checked by their own view's permissions.
+        """
+        response = self.batch([
+            {'method': 'POST', 'url': reverse('task-list'), 'body': {'title': "Anonymous"}},
+        ])
+        self.assertEqual(response.data['responses'][0]['status'], 403)
+        self.assertFalse(Task.objects.filter(title="Anonymous").exists())
+
+    @override_settings(BATCH={'MAX_REQUESTS': 2})
+    def test_invalid_batches_are_rejected(self):
+        """
+        Test that non-API URLs, nested batches and oversized batches get 400.
+        """
+        for requests in (
+            [{'method': 'GET', 'url': '/admin/'}],
+            [{'method': 'POST', 'url': self.url, 'body': {'requests': []}}],
+            [{'method': 'GET', 'url': reverse('task-list')}] * 3,
+        ):
+            response = self.batch(requests)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ConcurrentBatchTests(TransactionTestCase):
+    """
+    Test cases for batches of reads run in a thread pool.
+
+    A TransactionTestCase: the threads use their own connections, which only
+    see committed rows.
+    """
+    def test_concurrent_reads(self):
+        """
+        Test that concurrent reads return the same responses, in order.
+        """
+        tasks = [Task.objects.create(title=f"Task {i}") for i in range(5)]
+        requests = [{'method': 'GET', 'url': reverse('task-detail', args=[task.id])} for task in tasks]
+        client = APIClient()
+        sequential = client.post(reverse('batch'), {'requests': requests}, format='json')
+        concurrent = client.post(reverse('batch'), {'requests': requests, 'concurrent': True}, format='json')
+        self.assertEqual(concurrent.data, sequential.data)
+        self.assertEqual(
+            [sub['body']['title'] for sub in concurrent.data['responses']],
+            [task.title for task in tasks],
+        )
+
+
+class NestedQueryTests(APITestCase):
+    """
+    Test cases for the nested selection endpoint.
+    """
+    def setUp(self):
+        """
+        Set up two departments of persons with a few tasks each.
+        """
+        self.persons = [
+            Person.objects.create(name=f"Person {i}", email=f"query{i}@example.com",
+                                  department='Engineering' if i < 4 else 'Sales')
+            for i in range(6)
+        ]
+        for person in self.persons:
+            for j in range(3):
+                Task.objects.create(title=f"{person.name} task {j}", assigned_to=person, completed=j == 2)
+        Task.objects.create(title="Unassigned")
+        self.url = reverse('query')
+
+    def query(self, query):
+        return self.client.post(self.url, query, format='json')
+
+    def test_selection_is_resolved_with_one_query_per_level(self):
+        """
+        Test that persons, their tasks and the tasks' assignees take one
+        query each, and only the selected fields are returned.
+        """
+        query = {'persons': {
+            'where': {'department': 'Engineering'},
+            'fields': ['id', 'name'],
+            'include': {'assigned_tasks': {
+                'where': {'completed': False},
+                'fields': ['title'],
+                'include': {'assigned_to': {'fields': ['email']}},
+            }},
+        }}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.query(query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('SELECT')]), 3)
+
+        persons = response.data['persons']
+        self.assertEqual([person['id'] for person in persons], [person.id for person in self.persons[:4]])
+        first = persons[0]
+        self.assertEqual(set(first), {'id', 'name', 'assigned_tasks'})
+        self.assertEqual(
+            first['assigned_tasks'],
+            [{'title': f"Person 0 task {j}", 'assigned_to': {'email': 'query0@example.com'}} for j in range(2)],
+        )
+
+    def test_limits_apply_per_parent(self):
+        """
+        Test that a nested limit caps the rows of each parent, and roots
+        with no related rows get an empty list or null.
+        """
+        response = self.query({
+            'persons': {'limit': 2, 'include': {'assigned_tasks': {'limit': 1, 'fields': ['id']}}},
+            'tasks': {'where': {'assigned_to': None}, 'include': {'assigned_to': {'fields': ['name']}}},
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['persons']), 2)
+        self.assertEqual([len(p['assigned_tasks']) for p in response.data['persons']], [1, 1])
+        self.assertEqual(response.data['tasks'], [{'id': Task.objects.get(title="Unassigned").id, 'assigned_to': None}])
+
+    @override_settings(QUERY={'MAX_DEPTH': 2, 'MAX_COST': 500})
+    def test_depth_cost_and_field_limits(self):
+        """
+        Test that deep, costly or invalid selections are refused.
+        """
+        deep = {'persons': {'include': {'assigned_tasks': {'include': {'assigned_to': {
+            'include': {'assigned_tasks': {}}}}}}}}
+        costly = {'persons': {'limit': 100, 'include': {'assigned_tasks': {'limit': 10}}}}
+        for query in (
+            deep,
+            costly,
+            {'persons': {'fields': ['password']}},
+            {'persons': {'where': {'email': 'query0@example.com'}}},
+            {'tasks': {'where': {'completed': 'maybe'}}},
+            {'persons': {'where': ['department']}},
+            {'persons': {'include': ['assigned_tasks']}},
+            {'groups': {}},
+        ):
+            with self.assertNumQueries(0):
+                response = self.query(query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+
+
+class ConditionalAssignmentTests(APITestCase):
+    """
+    Test cases for assign/unassign as conditional single-statement updates.
+    """
+    def setUp(self):
+        """
+        Set up two persons, a task and an authenticated client.
+        """
+        person_cache.clear()
+        self.alice = Person.objects.create(name="Alice", email="alice.cas@example.com")
+        self.bob = Person.objects.create(name="Bob", email="bob.cas@example.com")
+        self.task = Task.objects.create(title="Contested Task")
+        self.user = User.objects.create_user(username='casuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.assign_url = reverse('task-assign', args=[self.task.id])
+
+    def test_expected_assignee_makes_one_update(self):
+        """
+        Test that with expected_assigned_to no row is read before the update.
+        """
+        person_cache.get(self.alice.id)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                self.assign_url, {'person_id': self.alice.id, 'expected_assigned_to': None}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        task_queries = [q['sql'] for q in queries if 'tasks_task' in q['sql']]
+        self.assertEqual(len(task_queries), 1)
+        self.assertTrue(task_queries[0].startswith('UPDATE'))
+        self.assertIn('"assigned_to_id" IS NULL', task_queries[0])
+
+    def test_stale_expectation_is_a_conflict(self):
+        """
+        Test that a client acting on an outdated assignee gets 409 and the
+        task keeps the other client's write.
+        """
+        self.client.post(self.assign_url, {'person_id': self.alice.id, 'expected_assigned_to': None}, format='json')
+        response = self.client.post(
+            self.assign_url, {'person_id': self.bob.id, 'expected_assigned_to': None}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['assigned_to'], self.alice.id)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.assigned_to, self.alice)
+
+        response = self.client.post(
+            reverse('task-unassign', args=[self.task.id]), {'expected_assigned_to': self.bob.id}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_write_between_read_and_update_is_a_conflict(self):
+        """
+        Test that without an expectation, a write landing between the read
+        of the assignee and the update is detected.
+        """
+        real_update = operations.update_task
+
+        def racing_update(*args, **kwargs):
+            Task.objects.filter(pk=self.task.pk).update(assigned_to=self.bob)
+            return real_update(*args, **kwargs)
+
+        with mock.patch('tasks.operations.update_task', side_effect=racing_update):
+            response = self.client.post(self.assign_url, {'person_id': self.alice.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.assigned_to, self.bob)
+
+    def test_unassign_and_missing_task(self):
+        """
+        Test unassigning, unassigning twice, and a task that does not exist.
+        """
+        self.client.post(self.assign_url, {'person_id': self.alice.id}, format='json')
+        unassign_url = reverse('task-unassign', args=[self.task.id])
+        response = self.client.post(unassign_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Alice', response.data['success'])
+        self.assertEqual(self.client.post(unassign_url).status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('task-assign', args=[999999]), {'person_id': self.alice.id})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(
+            reverse('person-unassign-task', args=[self.alice.id]), {'task_id': self.task.id}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_person_actions_name_the_task(self):
+        """
+        Test that the person assign/unassign messages still carry the title.
+        """
+        response = self.client.post(
+            reverse('person-assign-task', args=[self.alice.id]), {'task_id': self.task.id}, format='json'
+        )
+        self.assertEqual(response.data['success'], 'Task "Contested Task" assigned to Alice')
+        response = self.client.post(
+            reverse('person-unassign-task', args=[self.alice.id]), {'task_id': self.task.id}, format='json'
+        )
+        self.assertEqual(response.data['success'], 'Task "Contested Task" unassigned from Alice')
+
+
+class ConcurrentAssignmentStressTests(TransactionTestCase):
+    """
+    Many threads assigning the same tasks at once.
+
+    A TransactionTestCase, so that each thread's connection sees the rows.
+    """
+    threads = 8
+    rounds = 20
+
+    def try_assign(self, task, person):
+        # The in-memory test database (SQLite shared cache) refuses a
+        # statement while another connection holds the table instead of
+        # waiting for it, so the call is retried. When the refused statement
+        # was the workload flag, the assignment itself had gone through and
+        # the retry conflicts with it: the task is then ours.
+        while True:
+            try:
+                operations.assign(task.pk, person.pk, expected_assigned_to=None)
+                return True
+            except operations.Conflict as e:
+                return e.current['assigned_to'] == person.pk
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                time.sleep(0.001)
+
+    def test_exactly_one_assignment_wins_per_round(self):
+        """
+        Test that of concurrent assigns expecting the same assignee, exactly
+        one succeeds and the others get a conflict.
+        """
+        persons = [
+            Person.objects.create(name=f"Worker {i}", email=f"worker{i}@example.com") for i in range(self.threads)
+        ]
+        tasks = [Task.objects.create(title=f"Hot Task {i}") for i in range(self.rounds)]
+        barrier = threading.Barrier(self.threads)
+
+        def hammer(person):
+            outcomes = []
+            try:
+                for task in tasks:
+                    barrier.wait(timeout=30)
+                    outcomes.append(self.try_assign(task, person))
+            finally:
+                connections.close_all()
+            return outcomes
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            results = list(executor.map(hammer, persons))
+
+        for round_index, task in enumerate(tasks):
+            winners = [persons[i].pk for i, outcomes in enumerate(results) if outcomes[round_index]]
+            self.assertEqual(len(winners), 1)
+            task.refresh_from_db()
+            self.assertEqual(task.assigned_to_id, winners[0])
+
+
+class TaskTransitionTests(APITestCase):
+    """
+    Test cases for status transitions and the completed/status repair.
+    """
+    def setUp(self):
+        """
+        Set up an assigned task and an authenticated client.
+        """
+        self.person = Person.objects.create(name="Transition Person", email="transition@example.com")
+        self.task = Task.objects.create(title="Moving Along", assigned_to=self.person)
+        self.user = User.objects.create_user(username='transitionuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('task-transition', args=[self.task.id])
+
+    def test_transition_writes_status_and_completed_together(self):
+        """
+        Test that completing a task is one UPDATE of both fields and shows
+        up in completed_tasks.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        task_updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "tasks_task"')]
+        self.assertEqual(len(task_updates), 1)
+        self.assertIn('"completed" = ', task_updates[0])
+        self.assertIn('"status" IN', task_updates[0])
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.status, self.task.completed), ('completed', True))
+        completed = self.client.get(reverse('task-completed-tasks')).data
+        self.assertEqual([task['id'] for task in completed], [self.task.id])
+
+        response = self.client.post(self.url, {'status': 'in_progress'}, format='json')
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.status, self.task.completed), ('in_progress', False))
+
+    def test_disallowed_and_stale_transitions(self):
+        """
+        Test that a move TRANSITIONS does not allow, or from a status the
+        task has left, gets 409 with the current status.
+        """
+        self.client.post(self.url, {'status': 'cancelled'}, format='json')
+        response = self.client.post(self.url, {'status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['status'], 'cancelled')
+        self.assertEqual(list(response.data['allowed']), ['pending'])
+
+        response = self.client.post(self.url, {'status': 'pending', 'expected_status': 'in_progress'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.client.post(self.url, {'status': 'pending', 'expected_status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse('task-transition', args=[999999]), {'status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bulk_transition(self):
+        """
+        Test that the bulk form moves what it can and reports the rest.
+        """
+        cancelled = Task.objects.create(title="Cancelled", status='cancelled')
+        done = Task.objects.create(title="Done", status='completed', completed=True)
+        response = self.client.post(
+            reverse('task-bulk-transition'),
+            {'ids': [self.task.id, cancelled.id, done.id, 999999], 'status': 'completed'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(response.data['conflicts'], [{'id': cancelled.id, 'status': 'cancelled'}])
+        self.assertEqual(response.data['missing'], [999999])
+        self.assertTrue(Task.objects.get(pk=self.task.id).completed)
+
+    def test_serializer_keeps_fields_consistent(self):
+        """
+        Test that PATCHing one of status/completed sets the other, and a
+        contradiction is refused.
+        """
+        detail_url = reverse('task-detail', args=[self.task.id])
+        self.client.patch(detail_url, {'completed': True}, format='json')
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, 'completed')
+        self.client.patch(detail_url, {'status': 'in_progress'}, format='json')
+        self.task.refresh_from_db()
+        self.assertFalse(self.task.completed)
+        response = self.client.patch(detail_url, {'status': 'pending', 'completed': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_updates_follow_transitions(self):
+        """
+        Test that PATCHing status or completed is refused for a move
+        TRANSITIONS does not allow, as on the transition endpoint.
+        """
+        detail_url = reverse('task-detail', args=[self.task.id])
+        self.client.post(self.url, {'status': 'completed'}, format='json')
+        response = self.client.patch(detail_url, {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['status'], ['A completed task cannot become cancelled.'])
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, 'completed')
+
+        # Clearing the flag reopens the task
+        response = self.client.patch(detail_url, {'completed': False}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.status, self.task.completed), ('in_progress', False))
+
+        self.client.post(self.url, {'status': 'cancelled'}, format='json')
+        response = self.client.patch(detail_url, {'completed': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(detail_url, {'status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.status, self.task.completed), ('cancelled', False))
+        # Unchanged status is not a move
+        response = self.client.patch(detail_url, {'status': 'cancelled', 'title': "Still Cancelled"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_repair_command(self):
+        """
+        Test that repair_task_status fixes drifted rows in bulk.
+        """
+        Task.objects.create(title="Flag Only", completed=True)
+        Task.objects.create(title="Status Only", status='completed')
+        out = StringIO()
+        call_command('repair_task_status', '--dry-run', stdout=out)
+        self.assertIn('2 task(s)', out.getvalue())
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('repair_task_status', stdout=StringIO())
+        task_updates = [q for q in queries if q['sql'].startswith('UPDATE "tasks_task"')]
+        self.assertEqual(len(task_updates), 2)
+        self.assertFalse(Task.objects.get(title="Flag Only").completed)
+        self.assertTrue(Task.objects.get(title="Status Only").completed)
+
+        Task.objects.filter(title="Flag Only").update(completed=True)
+        call_command('repair_task_status', '--source', 'completed', stdout=StringIO())
+        self.assertEqual(Task.objects.get(title="Flag Only").status, 'completed')
+
+
+class ArchiveTests(APITestCase):
+    """
+    Test cases for archiving closed tasks and listing them again.
+    """
+    def setUp(self):
+        """
+        Set up old and recent tasks in every status.
+        """
+        self.person = Person.objects.create(name="Archive Person", email="archive@example.com")
+        self.old_done = [
+            Task.objects.create(title=f"Old Done {i}", status='completed', completed=True, assigned_to=self.person)
+            for i in range(3)
+        ]
+        self.old_cancelled = [Task.objects.create(title=f"Old Cancelled {i}", status='cancelled') for i in range(2)]
+        self.old_pending = Task.objects.create(title="Old Pending")
+        self.recent_done = Task.objects.create(title="Recent Done", status='completed', completed=True)
+        Task.objects.exclude(pk=self.recent_done.pk).update(updated_at=timezone.now() - timedelta(days=200))
+
+    def test_command_archives_in_batches(self):
+        """
+        Test that only old closed tasks move, keeping their ids and values.
+        """
+        out = StringIO()
+        call_command('archive_tasks', '--dry-run', stdout=out)
+        self.assertIn('5 task(s) would be archived', out.getvalue())
+        self.assertEqual(Task.objects.count(), 7)
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('archive_tasks', '--batch-size', '2', stdout=out)
+        self.assertIn('Archived 5 task(s)', out.getvalue())
+        deletes = [q for q in queries if q['sql'].startswith('DELETE FROM "tasks_task"')]
+        self.assertEqual(len(deletes), 3)
+        self.assertEqual(
+            set(Task.objects.values_list('id', flat=True)),
+            {self.old_pending.id, self.recent_done.id},
+        )
+        archived = ArchivedTask.objects.get(pk=self.old_done[0].pk)
+        self.assertEqual((archived.title, archived.status, archived.assigned_to), ("Old Done 0", 'completed', self.person))
+        # Nothing left to archive
+        call_command('archive_tasks', stdout=StringIO())
+        self.assertEqual(ArchivedTask.objects.count(), 5)
+
+    def test_include_archived(self):
+        """
+        Test that lists leave archived tasks out unless ?include_archived=1,
+        which applies the same filters to them.
+        """
+        archive_tasks()
+        url = reverse('task-list')
+        self.assertEqual(self.client.get(url).data['count'], 2)
+        response = self.client.get(url, {'include_archived': '1', 'status': 'cancelled'})
+        self.assertEqual(
+            [task['id'] for task in response.data['results']],
+            sorted(task.id for task in self.old_cancelled),
+        )
+        response = self.client.get(url, {'include_archived': '1', 'ordering': '-created_at'})
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(
+            [task['title'] for task in response.data['results']][:4],
+            ["Recent Done", "Old Pending", "Old Cancelled 1", "Old Cancelled 0"],
+        )
+
+        completed_url = reverse('task-completed-tasks')
+        self.assertEqual(len(self.client.get(completed_url).data), 1)
+        completed = self.client.get(completed_url, {'include_archived': 'true'}).data
+        self.assertEqual(len(completed), 4)
+        self.assertIn(self.person.id, [task['assigned_to'] for task in completed])
+
+    def test_job_queues_next_run(self):
+        """
+        Test that the archive_tasks job archives and, with repeat_hours,
+        queues its next run.
+        """
+        job = enqueue('archive_tasks', {'older_than_days': 30, 'repeat_hours': 24})
+        Worker(worker_id='archiver').run(burst=True, max_jobs=1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result['archived'], 5)
+        next_job = Job.objects.get(pk=job.result['next_job'])
+        self.assertEqual((next_job.kind, next_job.status), ('archive_tasks', Job.QUEUED))
+        self.assertGreater(next_job.run_after, timezone.now() + timedelta(hours=23))
+
+
+class SoftDeleteTests(APITestCase):
+    """
+    Test cases for soft delete and the batched purge.
+    """
+    def setUp(self):
+        """
+        Set up a person with tasks and an authenticated client.
+        """
+        person_cache.clear()
+        self.person = Person.objects.create(name="Leaving Person", email="leaving@example.com")
+        self.tasks = [Task.objects.create(title=f"Task {i}", assigned_to=self.person) for i in range(5)]
+        self.user = User.objects.create_user(username='softdeleteuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+
+    def test_deleted_task_is_hidden(self):
+        """
+        Test that DELETE only marks the task, which then disappears from
+        the API.
+        """
+        url = reverse('task-detail', args=[self.tasks[0].id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(any(q['sql'].startswith('DELETE') for q in queries))
+        self.assertIsNotNone(Task.all_objects.get(pk=self.tasks[0].id).deleted_at)
+        self.assertEqual(Task.objects.count(), 4)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('task-list')).data['count'], 4)
+        response = self.client.post(reverse('task-transition', args=[self.tasks[0].id]), {'status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deleted_person_is_hidden_without_touching_tasks(self):
+        """
+        Test that deleting a person does not update their tasks, and that
+        the email can be used again.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(reverse('person-detail', args=[self.person.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse([q for q in queries if 'tasks_task' in q['sql'] and q['sql'].startswith('UPDATE')])
+        self.assertEqual(Task.objects.filter(assigned_to=self.person).count(), 5)
+        self.assertFalse(Person.objects.filter(pk=self.person.id).exists())
+        self.assertEqual(
+            self.client.get(reverse('person-detail', args=[self.person.id])).status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
+
+        response = self.client.post(
+            reverse('person-list'), {'name': "New Person", 'email': "leaving@example.com"}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(
+            reverse('person-list'), {'name': "Third Person", 'email': "leaving@example.com"}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_task_of_deleted_person_can_be_saved_unchanged(self):
+        """
+        Test that a PUT sending back the soft-deleted assignee is accepted,
+        while assigning a soft-deleted person anew is not.
+        """
+        url = reverse('task-detail', args=[self.tasks[0].id])
+        task = self.client.get(url).data
+        self.person.soft_delete()
+        response = self.client.put(url, dict(task, title="Renamed"), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(response.data['assigned_to'], self.person.id)
+
+        other = Task.objects.create(title="Unassigned Task")
+        response = self.client.patch(
+            reverse('task-detail', args=[other.id]), {'assigned_to': self.person.id}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_purge_deletes_in_batches(self):
+        """
+        Test that the purge unassigns and deletes in bounded batches, and
+        only rows deleted long enough ago.
+        """
+        self.tasks[0].soft_delete()
+        ArchivedTask.objects.create(
+            id=999, title="Archived", status='completed', completed=True,
+            created_at=timezone.now(), updated_at=timezone.now(), assigned_to=self.person,
+        )
+        self.person.soft_delete()
+
+        out = StringIO()
+        call_command('purge_deleted', '--dry-run', stdout=out)
+        self.assertIn('0 task(s) and 0 person(s)', out.getvalue())
+        call_command('purge_deleted', '--dry-run', '--after-hours', '0', stdout=out)
+        self.assertIn('1 task(s) and 1 person(s)', out.getvalue())
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('purge_deleted', '--after-hours', '0', '--batch-size', '2', stdout=out)
+        self.assertIn('Purged 1 task(s) and 1 person(s); unassigned 5 task(s)', out.getvalue())
+        updates = [q for q in queries if q['sql'].startswith('UPDATE "tasks_task" SET "assigned_to_id" = NULL')]
+        self.assertEqual(len(updates), 3)
+        self.assertFalse(Task.all_objects.filter(pk=self.tasks[0].id).exists())
+        self.assertFalse(Person.all_objects.filter(pk=self.person.id).exists())
+        self.assertEqual(Task.objects.filter(assigned_to__isnull=True).count(), 4)
+        self.assertIsNone(ArchivedTask.objects.get(pk=999).assigned_to_id)
+
+
+class MetricsTests(APITestCase):
+    """
+    Test cases for the request metrics and the /metrics endpoint.
+    """
+    def setUp(self):
+        """
+        Start from empty metrics, with a task and an authenticated client.
+        """
+        metrics_registry.reset()
+        person_cache.clear()
+        self.person = Person.objects.create(name="Metered Person", email="metered@example.com")
+        self.task = Task.objects.create(title="Metered Task")
+        self.user = User.objects.create_user(username='metricsuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_requests_are_labelled_by_viewset_action(self):
+        """
+        Test that requests are counted and timed per viewset action, with
+        their queries, serializer and render time and page number.
+        """
+        self.client.get(reverse('task-list'), {'page': 1})
+        self.client.get(reverse('task-list'))
+        self.client.post(reverse('person-assign-task', args=[self.person.id]), {'task_id': self.task.id}, format='json')
+        self.client.get(reverse('task-detail', args=[999999]))
+
+        samples = self.scrape()
+        self.assertEqual(samples['api_requests_total{view="TaskViewSet.list",method="GET",status="200"}'], 2)
+        self.assertEqual(samples['api_requests_total{view="PersonViewSet.assign_task",method="POST",status="200"}'], 1)
+        self.assertEqual(samples['api_requests_total{view="TaskViewSet.retrieve",method="GET",status="404"}'], 1)
+        self.assertEqual(samples['api_request_duration_seconds_count{view="TaskViewSet.list"}'], 2)
+        self.assertGreater(samples['api_db_queries_sum{view="TaskViewSet.list"}'], 0)
+        self.assertEqual(samples['api_serializer_duration_seconds_count{view="TaskViewSet.list"}'], 2)
+        self.assertEqual(samples['api_render_duration_seconds_count{view="TaskViewSet.list"}'], 2)
+        self.assertEqual(samples['api_page_number_bucket{view="TaskViewSet.list",le="1"}'], 2)
+        self.assertEqual(samples['api_cache_misses_total{cache="person"}'], 1)
+
+    def test_snapshots_of_other_processes_are_added(self):
+        """
+        Test that /metrics adds up the snapshot files of every process.
+        """
+        labels = (('view', 'TaskViewSet.list'), ('method', 'GET'), ('status', '200'))
+        other = MetricsRegistry()
+        other.observe([('api_requests_total', labels, 3), ('api_request_duration_seconds', labels[:1], 0.2)])
+        with tempfile.TemporaryDirectory() as directory:
+            write_snapshot(directory, other.snapshot(), pid=999999)
+            with self.settings(METRICS={'DIR': directory, 'FLUSH_INTERVAL': 0}):
+                self.client.get(reverse('task-list'))
+                self.assertTrue((Path(directory) / f'metrics-{os.getpid()}.json').exists())
+                samples = self.scrape()
+        self.assertEqual(samples['api_requests_total{view="TaskViewSet.list",method="GET",status="200"}'], 4)
+        self.assertEqual(samples['api_request_duration_seconds_count{view="TaskViewSet.list"}'], 2)
+        self.assertEqual(samples['api_request_duration_seconds_bucket{view="TaskViewSet.list",le="0.25"}'], 2)
+
+    def test_exposition_format(self):
+        """
+        Test cumulative histogram buckets and label escaping.
+        """
+        registry = MetricsRegistry()
+        registry.observe([
+            ('api_db_queries', (('view', 'a"b'),), 2),
+            ('api_db_queries', (('view', 'a"b'),), 200),
+        ])
+        text = metrics_exposition(registry.snapshot())
+        self.assertIn('# TYPE api_db_queries histogram', text)
+        self.assertIn('api_db_queries_bucket{view="a\\"b",le="1"} 0', text)
+        self.assertIn('api_db_queries_bucket{view="a\\"b",le="2"} 1', text)
+        self.assertIn('api_db_queries_bucket{view="a\\"b",le="100"} 1', text)
+        self.assertIn('api_db_queries_bucket{view="a\\"b",le="+Inf"} 2', text)
+        self.assertIn('api_db_queries_sum{view="a\\"b"} 202', text)
+
+
+class ProfilingTests(APITestCase):
+    """
+    Test cases for request profiling and the profiles command.
+    """
+    def setUp(self):
+        """
+        Profile into a temporary directory, as a logged-in staff user.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        profiling = override_settings(PROFILING={'DIR': directory.name, 'MIN_DURATION_MS': 0})
+        profiling.enable()
+        self.addCleanup(profiling.disable)
+        self.person = Person.objects.create(name="Profiled Person", email="profiled@example.com")
+        Task.objects.create(title="Profiled Task", assigned_to=self.person)
+        self.user = User.objects.create_user(username='profiler', password='testpassword123', is_staff=True)
+        self.client.login(username='profiler', password='testpassword123')
+
+    def test_staff_request_is_profiled_on_demand(self):
+        """
+        Test that X-Profile stores a profile with its metadata and returns
+        its id, and that the summary shows the project's functions.
+        """
+        response = self.client.get(reverse('person-detail', args=[self.person.id]), HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        profile_id = response['X-Profile-Id']
+        self.assertTrue((self.directory / f'{profile_id}.prof').exists())
+
+        metadata = json.loads((self.directory / f'{profile_id}.json').read_text())
+        self.assertEqual(metadata['view'], 'PersonViewSet.retrieve')
+        self.assertEqual(metadata['user'], 'profiler')
+        self.assertEqual(metadata['status'], 200)
+        self.assertGreater(metadata['db_queries'], 0)
+        self.assertFalse(metadata['sampled'])
+
+        out = StringIO()
+        call_command('profiles', profile_id, stdout=out)
+        self.assertIn('serializers.py', out.getvalue())
+        self.assertNotIn('django', out.getvalue())
+
+    def test_other_requests_are_not_kept(self):
+        """
+        Test that requests without the flag, or by non-staff users, leave
+        no profile behind.
+        """
+        self.client.get(reverse('person-detail', args=[self.person.id]))
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.get(reverse('person-detail', args=[self.person.id]), {'profile': '1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    def test_only_staff_requests_run_under_the_profiler(self):
+        """
+        Test that the user is checked before profiling: session and token
+        staff users are profiled, other users and bad tokens are not.
+        """
+        staff_token = Token.objects.create(user=self.user)
+        other = User.objects.create_user(username='notstaff', password='testpassword123')
+        other_token = Token.objects.create(user=other)
+        factory = RequestFactory()
+        options = profiling.get_options()
+
+        def profiler(user=None, token=None):
+            request = factory.get('/api/tasks/', {'profile': '1'},
+                                  **({'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}))
+            if user is not None:
+                request.user = user
+            return profiling.profiler_for(request, options)
+
+        self.assertEqual(profiler(user=self.user).user, self.user)
+        self.assertEqual(profiler(token=staff_token.key).user, self.user)
+        self.assertIsNone(profiler(user=other))
+        self.assertIsNone(profiler(token=other_token.key))
+        self.assertIsNone(profiler(token='not-a-token'))
+        self.assertIsNone(profiler(user=AnonymousUser()))
+
+    def test_sampling_and_listing(self):
+        """
+        Test that sampled requests are kept when slow enough, and that the
+        command lists the stored profiles, slowest first.
+        """
+        with self.settings(PROFILING={'DIR': str(self.directory), 'SAMPLE_RATE': 1.0, 'MIN_DURATION_MS': 10 ** 6}):
+            self.client.get(reverse('task-list'))
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+        with self.settings(PROFILING={'DIR': str(self.directory), 'SAMPLE_RATE': 1.0, 'MIN_DURATION_MS': 0, 'MAX_FILES': 2}):
+            for _ in range(3):
+                response = self.client.get(reverse('task-list'))
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(len(list(self.directory.glob('*.prof'))), 2)
+
+        out = StringIO()
+        call_command('profiles', '--path', '/api/tasks/', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('TaskViewSet.list', lines[0])
+        with self.assertRaises(CommandError):
+            call_command('profiles', 'missing')
+
+
+class QueryPlanTests(APITestCase):
+    """
+    Test that no TaskViewSet or PersonViewSet action makes more queries, or
+    scans a table it used to read through an index, than its snapshot in
+    tasks/query_plan_snapshots/ (see tasks/query_plans.py).
+
+    After an intended change, record the snapshots again with:
+
+        QUERY_PLANS_UPDATE=1 python manage.py test tasks.tests.QueryPlanTests
+
+    and review the diff. Against PostgreSQL (taskmanager/settings_postgres.py)
+    the test is skipped until postgresql.json has been recorded that way.
+    """
+    def setUp(self):
+        """
+        A small, fixed data set and a staff user.
+        """
+        today = timezone.localdate()
+        self.alice = Person.objects.create(name="Alice", email="alice@example.com", department="Ops")
+        self.bob = Person.objects.create(name="Bob", email="bob@example.com", department="Dev")
+        self.tasks = [
+            Task.objects.create(
+                title=f"Report {i}" if i % 2 else f"Task {i}",
+                status=('pending', 'in_progress', 'completed', 'cancelled')[i % 4],
+                completed=i % 4 == 2,
+                priority=i % 5,
+                due_date=today + timedelta(days=i - 3),
+                assigned_to=(self.alice, self.bob, None)[i % 3],
+            )
+            for i in range(12)
+        ]
+        ArchivedTask.objects.create(
+            id=10 ** 6, title="Archived", status='completed', completed=True, assigned_to=self.alice,
+            created_at=timezone.now(), updated_at=timezone.now(), archived_at=timezone.now(),
+        )
+        self.user = User.objects.create_user(username='planner', password='testpassword123', is_staff=True)
+        self.client.force_authenticate(user=self.user)
+
+    def cases(self):
+        """
+        Name -> (method, URL, query parameters or body) of every request
+        checked; names start with "<ViewSet>.<action>".
+        """
+        task = self.tasks[0]
+        assigned = self.tasks[1]  # to Bob
+        alice, bob = self.alice.id, self.bob.id
+        return {
+            'TaskViewSet.list': ('get', reverse('task-list'), {}),
+            'TaskViewSet.list page 2': ('get', reverse('task-list'), {'page': 2}),
+            'TaskViewSet.list by status': ('get', reverse('task-list'), {'status': 'pending'}),
+            'TaskViewSet.list by assignee': ('get', reverse('task-list'), {'assigned_to': alice}),
+            'TaskViewSet.list by completed and priority': ('get', reverse('task-list'), {'completed': 'false', 'priority': 3}),
+            'TaskViewSet.list search': ('get', reverse('task-list'), {'search': 'report'}),
+            'TaskViewSet.list by priority desc': ('get', reverse('task-list'), {'ordering': '-priority'}),
+            'TaskViewSet.list by due date': ('get', reverse('task-list'), {'ordering': 'due_date'}),
+            'TaskViewSet.list with archived': ('get', reverse('task-list'), {'include_archived': 1}),
+            'TaskViewSet.retrieve': ('get', reverse('task-detail', args=[task.id]), {}),
+            'TaskViewSet.create': ('post', reverse('task-list'), {'title': 'New', 'assigned_to': alice}),
+            'TaskViewSet.update': ('put', reverse('task-detail', args=[task.id]), {'title': 'Renamed', 'priority': 2}),
+            'TaskViewSet.partial_update': ('patch', reverse('task-detail', args=[task.id]), {'status': 'in_progress'}),
+            'TaskViewSet.destroy': ('delete', reverse('task-detail', args=[task.id]), {}),
+            'TaskViewSet.completed_tasks': ('get', reverse('task-completed-tasks'), {}),
+            'TaskViewSet.completed_tasks with archived': ('get', reverse('task-completed-tasks'), {'include_archived': 1}),
+            'TaskViewSet.pending_tasks': ('get', reverse('task-pending-tasks'), {}),
+            'TaskViewSet.unassigned_tasks': ('get', reverse('task-unassigned-tasks'), {}),
+            'TaskViewSet.next_up': ('get', reverse('task-next-up'), {}),
+            'TaskViewSet.next_up by assignee': ('get', reverse('task-next-up'), {'assigned_to': alice}),
+            'TaskViewSet.overdue': ('get', reverse('task-overdue'), {}),
+            'TaskViewSet.assign': ('post', reverse('task-assign', args=[task.id]), {'person_id': bob}),
+            'TaskViewSet.assign expected': (
+                'post', reverse('task-assign', args=[task.id]), {'person_id': bob, 'expected_assigned_to': alice},
+            ),
+            'TaskViewSet.unassign': ('post', reverse('task-unassign', args=[assigned.id]), {}),
+            'TaskViewSet.transition': ('post', reverse('task-transition', args=[task.id]), {'status': 'completed'}),
+            'TaskViewSet.bulk_transition': (
+                'post', reverse('task-bulk-transition'), {'ids': [t.id for t in self.tasks[:4]], 'status': 'cancelled'},
+            ),
+            'PersonViewSet.list': ('get', reverse('person-list'), {}),
+            'PersonViewSet.list by department': ('get', reverse('person-list'), {'department': 'Ops'}),
+            'PersonViewSet.list search': ('get', reverse('person-list'), {'search': 'ali'}),
+            'PersonViewSet.list by name': ('get', reverse('person-list'), {'ordering': 'name'}),
+            'PersonViewSet.list newest first': ('get', reverse('person-list'), {'ordering': '-created_at'}),
+            'PersonViewSet.retrieve': ('get', reverse('person-detail', args=[alice]), {}),
+            'PersonViewSet.create': ('post', reverse('person-list'), {'name': 'Carol', 'email': 'carol@example.com'}),
+            'PersonViewSet.update': (
+                'put', reverse('person-detail', args=[alice]), {'name': 'Alice B', 'email': 'alice@example.com'},
+            ),
+            'PersonViewSet.partial_update': ('patch', reverse('person-detail', args=[alice]), {'department': 'Dev'}),
+            'PersonViewSet.destroy': ('delete', reverse('person-detail', args=[bob]), {}),
+            'PersonViewSet.cache_stats': ('get', reverse('person-cache-stats'), {}),
+            'PersonViewSet.workload': ('get', reverse('person-workload'), {}),
+            'PersonViewSet.profile_update': (
+                'patch', reverse('person-profile-update', args=[alice]), {'email': 'alice@example.org'},
+            ),
+            'PersonViewSet.tasks': ('get', reverse('person-tasks', args=[alice]), {}),
+            'PersonViewSet.assign_task': ('post', reverse('person-assign-task', args=[alice]), {'task_id': task.id}),
+            'PersonViewSet.unassign_task': ('post', reverse('person-unassign-task', args=[bob]), {'task_id': assigned.id}),
+        }
+
+    def capture_case(self, method, url, data):
+        """
+        Make one request and capture its queries, then undo its writes and
+        empty the caches, so every case starts from the same state.
+        """
+        cache.clear()
+        person_cache.clear()
+        savepoint = transaction.savepoint()
+        responses = []
+        captured = query_plans.capture(
+            lambda: responses.append(getattr(self.client, method)(url, data, format='json' if method != 'get' else None))
+        )
+        transaction.savepoint_rollback(savepoint)
+        return responses[0], captured
+
+    def test_every_action_is_covered(self):
+        """
+        Test that a new viewset action cannot go without a snapshot.
+        """
+        names = {name.split(' ')[0] for name in self.cases()}
+        for viewset in (TaskViewSet, PersonViewSet):
+            actions = {'list', 'retrieve', 'create', 'update', 'partial_update', 'destroy'}
+            actions.update(extra_action.__name__ for extra_action in viewset.get_extra_actions())
+            for name in sorted(actions):
+                self.assertIn(f'{viewset.__name__}.{name}', names)
+
+    def test_query_plans_match_snapshots(self):
+        """
+        Test every case against its recorded query count and plan.
+        """
+        update = os.environ.get('QUERY_PLANS_UPDATE', '').lower() in ('1', 'true', 'yes')
+        snapshots = query_plans.load_snapshots()
+        if snapshots is None and not update:
+            if connection.vendor != 'sqlite':
+                self.skipTest(f'No {connection.vendor} query plan snapshots; record them with QUERY_PLANS_UPDATE=1')
+            self.fail(f'{query_plans.snapshot_path()} is missing; record it with QUERY_PLANS_UPDATE=1')
+
+        recorded = {}
+        for name, (method, url, data) in self.cases().items():
+            response, captured = self.capture_case(method, url, data)
+            with self.subTest(name):
+                self.assertLess(response.status_code, 400, response.content)
+                if update:
+                    recorded[name] = captured
+                elif name not in snapshots:
+                    self.fail(f'No snapshot for {name}; record it with QUERY_PLANS_UPDATE=1')
+                else:
+                    self.assertEqual(query_plans.compare(snapshots[name], captured), [])
+        if update:
+            query_plans.save_snapshots(recorded)
+
+    def test_regressions_are_detected(self):
+        """
+        Test that an extra query and a new full scan are reported, per
+        statement.
+        """
+        snapshot = {'queries': 1, 'statements': [{'sql': 'SELECT ...', 'plan': ['tasks_task: index search task_open_by_priority']}]}
+        captured = {'queries': 2, 'statements': [
+            {'sql': 'SELECT a', 'plan': ['tasks_task: full scan', 'sort']},
+            {'sql': 'SELECT b', 'plan': ['tasks_person: primary key']},
+        ]}
+        self.assertEqual(query_plans.compare(snapshot, captured), [
+            '2 queries instead of 1',
+            'full scan of tasks_task in: SELECT a',
+        ])
+        self.assertEqual(query_plans.compare(captured, snapshot), [])
+
+        # The count already scans the table; the page query newly does too
+        count = {'sql': 'SELECT COUNT(*) ...', 'plan': ['tasks_task: full scan']}
+        snapshot = {'queries': 2, 'statements': [
+            count, {'sql': 'SELECT page', 'plan': ['tasks_task: index search task_open_by_priority']},
+        ]}
+        captured = {'queries': 2, 'statements': [count, {'sql': 'SELECT page', 'plan': ['tasks_task: full scan', 'sort']}]}
+        self.assertEqual(query_plans.compare(snapshot, captured), ['full scan of tasks_task in: SELECT page'])
+        # Matched by SQL, not by position; a changed statement by position
+        captured['statements'] = [snapshot['statements'][1], count]
+        self.assertEqual(query_plans.compare(snapshot, captured), [])
+        captured['statements'] = [{'sql': 'SELECT COUNT(id) ...', 'plan': ['tasks_task: full scan']}, snapshot['statements'][1]]
+        self.assertEqual(query_plans.compare(snapshot, captured), [])
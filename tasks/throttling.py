@@ -0,0 +1,203 @@
+"""
+Per-client rate limiting with token buckets.
+
+Every request is put in one of three priority classes:
+
+- `high`: writes (POST, PUT, PATCH, DELETE), except to views marked
+  `read_only` that only use POST to carry a query (/api/query/)
+- `normal`: reads of a single object, e.g. GET /api/tasks/1/
+- `low`: list and search calls, e.g. GET /api/tasks/?search=...
+
+Each client (user id, or IP address for anonymous requests) gets one token
+bucket per endpoint, sized by the class of that endpoint. Cheap writes and
+detail reads get large buckets, while expensive lists and searches get small
+ones. `LoadSheddingMiddleware` (tasks/middleware.py) uses the same classes to
+decide what to turn away first when the database is slow.
+
+Buckets live either in this process (`'BACKEND': 'local'`, exact and
+lock-protected) or in a Django cache shared by all workers
+(`'BACKEND': 'cache'`). The shared backend only uses the cache's atomic
+`add`/`incr`, so each bucket refills once per window of BURST / RATE
+seconds instead of continuously.
+
+Settings:
+
+    RATE_LIMITS = {
+        'BACKEND': 'local',        # or 'cache'
+        'CACHE_ALIAS': 'default',  # cache used by the 'cache' backend
+        'BUCKETS': {
+            # RATE is tokens per second, BURST the bucket size
+            'high': {'RATE': 10, 'BURST': 50},
+            'normal': {'RATE': 20, 'BURST': 100},
+            'low': {'RATE': 5, 'BURST': 50},
+        },
+    }
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+PRIORITY_HIGH = 'high'
+PRIORITY_NORMAL = 'normal'
+PRIORITY_LOW = 'low'
+
+DEFAULT_BUCKETS = {
+    PRIORITY_HIGH: {'RATE': 10, 'BURST': 50},
+    PRIORITY_NORMAL: {'RATE': 20, 'BURST': 100},
+    PRIORITY_LOW: {'RATE': 5, 'BURST': 50},
+}
+
+
+def get_options():
+    options = {
+        'BACKEND': 'local',
+        'CACHE_ALIAS': 'default',
+    }
+    options.update(getattr(settings, 'RATE_LIMITS', {}))
+    options['BUCKETS'] = {**DEFAULT_BUCKETS, **options.get('BUCKETS', {})}
+    return options
+
+
+def request_priority(request, view_kwargs, view=None):
+    """
+    Return the priority class of a request.
+
+    `view_kwargs` are the URL keyword arguments; a lookup argument such as
+    `pk` means the request targets a single object. `view` (class or
+    instance) with `read_only = True` only reads, whatever the method.
+    """
+    if request.method not in SAFE_METHODS and not getattr(view, 'read_only', False):
+        return PRIORITY_HIGH
+    if 'search' in request.GET or not view_kwargs:
+        return PRIORITY_LOW
+    return PRIORITY_NORMAL
+
+
+class LocalBucketStore:
+    """
+    Token buckets held in this process.
+    """
+    # Past this many buckets, full (idle) ones are dropped
+    max_buckets = 100000
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        # key -> [tokens, last_refill]
+        self._buckets = {}
+
+    def consume(self, key, rate, burst):
+        """
+        Take one token from bucket `key`. Returns 0 when allowed, otherwise
+        the number of seconds until a token is available.
+        """
+        now = self.clock()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1:
+                self._buckets[key] = [tokens - 1, now]
+                return 0
+            self._buckets[key] = [tokens, now]
+            if len(self._buckets) > self.max_buckets:
+                self._prune(now, rate, burst)
+            return (1 - tokens) / rate
+
+    def _prune(self, now, rate, burst):
+        # Caller must hold the lock. A bucket idle for burst / rate seconds
+        # is full again, which is the same as not having one.
+        idle = burst / rate
+        for key in [key for key, (_, last) in self._buckets.items() if now - last >= idle]:
+            del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Token buckets shared through a Django cache, using only atomic counters.
+
+    A bucket holds BURST tokens and is refilled in full at the start of
+    every window of BURST / RATE seconds, which gives the same long-run rate
+    as a continuously refilled bucket.
+    """
+    def __init__(self, alias='default', clock=time.time):
+        self.alias = alias
+        self.clock = clock
+
+    def consume(self, key, rate, burst):
+        cache = caches[self.alias]
+        window = burst / rate
+        now = self.clock()
+        window_index = int(now // window)
+        cache_key = f'ratelimit:{key}:{window_index}'
+        # add() only succeeds for the first request of the window
+        if cache.add(cache_key, 1, timeout=math.ceil(window) + 1):
+            used = 1
+        else:
+            try:
+                used = cache.incr(cache_key)
+            except ValueError:
+                # Expired between add() and incr()
+                cache.add(cache_key, 1, timeout=math.ceil(window) + 1)
+                used = 1
+        if used <= burst:
+            return 0
+        return (window_index + 1) * window - now
+
+    def clear(self):
+        # Entries expire on their own after one window
+        pass
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_bucket_store():
+    """
+    Return the bucket store for the configured backend (one per process).
+    """
+    options = get_options()
+    key = (options['BACKEND'], options['CACHE_ALIAS'])
+    with _stores_lock:
+        if key not in _stores:
+            if options['BACKEND'] == 'cache':
+                _stores[key] = CacheBucketStore(options['CACHE_ALIAS'])
+            else:
+                _stores[key] = LocalBucketStore()
+        return _stores[key]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    REST framework throttle with one token bucket per client and endpoint.
+
+    Requests over the limit get a 429 response with a Retry-After header.
+    """
+    def allow_request(self, request, view):
+        priority = request_priority(request, view.kwargs, view)
+        bucket = get_options()['BUCKETS'][priority]
+        key = f'{self.get_client_ident(request)}:{self.get_endpoint(view)}:{request.method}'
+        self.wait_seconds = get_bucket_store().consume(key, bucket['RATE'], bucket['BURST'])
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
+
+    def get_client_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user-{request.user.pk}'
+        return f'ip-{self.get_ident(request)}'
+
+    def get_endpoint(self, view):
+        # Plain APIViews have no `action`; the method in the key tells them apart
+        action = getattr(view, 'action', None) or 'view'
+        return f'{type(view).__name__}.{action}'
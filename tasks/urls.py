@@ -1,13 +1,17 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TaskViewSet, PersonViewSet
+from .views import AuthTokenView, BatchView, JobViewSet, QueryView, TaskViewSet, PersonViewSet
 
 # Create a router and register our viewsets with it
 router = DefaultRouter()
 router.register(r'tasks', TaskViewSet)
 router.register(r'persons', PersonViewSet)
+router.register(r'jobs', JobViewSet)
 
 # The API URLs are now determined automatically by the router
 urlpatterns = [
+    path('auth/token/', AuthTokenView.as_view(), name='auth-token'),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('query/', QueryView.as_view(), name='query'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
@@ -1,21 +1,51 @@
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
-from rest_framework import viewsets, filters, status
+from django.utils import timezone
+from django.views.decorators.http import require_safe
+from rest_framework import mixins, viewsets, filters, status
+from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.decorators import action, permission_classes
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.exceptions import ValidationError as DRFValidationError
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Task, Person
+from .archive import with_archived
+from .batch import run_batch
+from .cache import person_cache
+from .jobs import enqueue
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, collect, exposition, get_options as get_metrics_options
+from .models import ArchivedTask, Job, Task, Person
+from .operations import (
+    TRANSITIONS, UNSET, Conflict, InvalidTransition, assign, read_fields, transition_many,
+    transition as transition_task,
+)
+from .query import run_query
+from .renderers import TRUE_VALUES
+from .routers import ReplicaReadsMixin
+from .sharding import ShardedTasksMixin
+from .workload import workload_summary
 from .serializers import (
+    BatchRequestSerializer,
+    BulkTransitionSerializer,
+    JobSerializer,
     TaskSerializer, 
     TaskListSerializer, 
     PersonSerializer, 
     PersonWithTasksSerializer,
-    ProfileUpdateSerializer
+    ProfileUpdateSerializer,
+    TransitionSerializer,
 )
 
 # Create your views here.
 
-class PersonViewSet(viewsets.ModelViewSet):
+class PersonViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     """
     ViewSet for viewing and editing Person instances.
     
@@ -89,6 +119,61 @@ class PersonViewSet(viewsets.ModelViewSet):
             return ProfileUpdateSerializer
         return PersonSerializer
     
+    def perform_destroy(self, instance):
+        """
+        Soft-delete the person.
+
+        EXPLANATION:
+        ------------
+        Deleting the row would unassign all of the person's tasks within
+        this request. Instead the person is only marked as deleted (and
+        hidden from then on); `manage.py purge_deleted` unassigns the tasks
+        and deletes the row later, in batches (see tasks/purge.py).
+        """
+        instance.soft_delete()
+    
+    def get_cached_person(self):
+        """
+        Return the identity (id, name, email) of the person in the URL.
+
+        Used instead of get_object() by the assignment actions, which only
+        need these three values; they come from the person cache.
+        """
+        try:
+            person_id = Person._meta.pk.to_python(self.kwargs[self.lookup_field])
+        except ValidationError:
+            raise Http404
+        identity = person_cache.get(person_id)
+        if identity is None:
+            raise Http404
+        return identity
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        """
+        Show the hit/miss counters of this process's person cache.
+        
+        URL: /api/persons/cache_stats/
+        """
+        return Response(person_cache.stats())
+    
+    @action(detail=False, methods=['get'])
+    def workload(self, request):
+        """
+        Open and overdue tasks and the priority distribution, per person,
+        grouped by department.
+        
+        URL: /api/persons/workload/?department=Engineering
+        
+        EXPLANATION:
+        ------------
+        The numbers come from a precomputed table (see tasks/workload.py)
+        rather than from counting every task on each request. The response
+        says how fresh they are: `refreshed_at` per person, `oldest_refresh`
+        overall, and `refreshed_rows`, the rows recomputed for this request.
+        """
+        return Response(workload_summary(request.query_params.get('department')))
+    
     @action(detail=True, methods=['put', 'patch'], permission_classes=[IsAuthenticated])
     def profile_update(self, request, pk=None):
         """
@@ -135,8 +220,21 @@ class PersonViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(person, data=request.data, partial=self.request.method == 'PATCH')
         
         if serializer.is_valid():
-            # If data is valid, save the changes to the database
-            serializer.save()
+            # If data is valid, save the changes to the database.
+            # The email check in the serializer uses the person cache, so the
+            # database unique constraint is the final guard against duplicates.
+            try:
+                with transaction.atomic():
+                    serializer.save()
+            except IntegrityError:
+                return Response(
+                    {
+                        "status": "error",
+                        "message": "Profile update failed",
+                        "errors": {"email": ["This email is already in use."]}
+                    },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
             # Return a successful response with helpful details
             return Response(
@@ -176,7 +274,7 @@ class PersonViewSet(viewsets.ModelViewSet):
         
         URL: /api/persons/{id}/assign_task/
         """
-        person = self.get_object()
+        person = self.get_cached_person()
         task_id = request.data.get('task_id')
         
         if not task_id:
@@ -185,19 +283,26 @@ class PersonViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # One conditional UPDATE (see tasks/operations.py), then the title
+        # for the message
         try:
-            task = Task.objects.get(id=task_id)
+            task_id = parse_task_id(task_id)
+            assign(task_id, person.id, get_expected_assignee(request))
+            title = read_fields(task_id, ['title'])[0]['title']
         except Task.DoesNotExist:
             return Response(
                 {'error': f'Task with id {task_id} does not exist'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
-        
-        task.assigned_to = person
-        task.save()
+        except Conflict as e:
+            return conflict_response(e)
+        except IntegrityError:
+            # The cached person was deleted by another process
+            person_cache.evict(person.id)
+            raise Http404
         
         return Response(
-            {'success': f'Task "{task.title}" assigned to {person.name}'},
+            {'success': f'Task "{title}" assigned to {person.name}'},
             status=status.HTTP_200_OK
         )
     
@@ -208,7 +313,7 @@ class PersonViewSet(viewsets.ModelViewSet):
         
         URL: /api/persons/{id}/unassign_task/
         """
-        person = self.get_object()
+        person = self.get_cached_person()
         task_id = request.data.get('task_id')
         
         if not task_id:
@@ -217,29 +322,28 @@ class PersonViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # Only unassigns if the task is (still) assigned to this person
         try:
-            task = Task.objects.get(id=task_id)
+            task_id = parse_task_id(task_id)
+            assign(task_id, None, expected_assigned_to=person.id)
+            title = read_fields(task_id, ['title'])[0]['title']
         except Task.DoesNotExist:
             return Response(
                 {'error': f'Task with id {task_id} does not exist'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
-        
-        if task.assigned_to != person:
+        except Conflict:
             return Response(
                 {'error': f'Task is not assigned to {person.name}'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        task.assigned_to = None
-        task.save()
-        
         return Response(
-            {'success': f'Task "{task.title}" unassigned from {person.name}'},
+            {'success': f'Task "{title}" unassigned from {person.name}'},
             status=status.HTTP_200_OK
         )
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(ShardedTasksMixin, ReplicaReadsMixin, viewsets.ModelViewSet):
     """
     ViewSet for viewing and editing Task instances.
     
@@ -305,6 +409,35 @@ class TaskViewSet(viewsets.ModelViewSet):
         if self.action == 'list':
             return TaskListSerializer
         return TaskSerializer
+
+    def perform_destroy(self, instance):
+        """
+        Soft-delete the task; `manage.py purge_deleted` deletes it for good
+        later (see tasks/purge.py).
+        """
+        instance.soft_delete()
+
+    def include_archived(self):
+        """
+        Whether the request asked for archived tasks too (`?include_archived=1`).
+        """
+        return self.request.query_params.get('include_archived', '').lower() in TRUE_VALUES
+
+    def filter_queryset(self, queryset):
+        """
+        With `?include_archived=1`, merge the archived tasks (filtered,
+        searched and ordered the same way) into the list.
+
+        EXPLANATION:
+        ------------
+        Old completed and cancelled tasks are moved to a separate archive
+        table (see tasks/archive.py) to keep the task table small. The list
+        leaves them out unless asked for them.
+        """
+        tasks = super().filter_queryset(queryset)
+        if self.action != 'list' or queryset.model is not Task or not self.include_archived():
+            return tasks
+        return with_archived(tasks, super().filter_queryset(ArchivedTask.objects.all()))
     
     @action(detail=False, methods=['get'])
     def completed_tasks(self, request):
@@ -324,8 +457,12 @@ class TaskViewSet(viewsets.ModelViewSet):
         1. We filter the tasks to only include completed ones
         2. We serialize the data (convert to JSON)
         3. We return a Response with the serialized data
+
+        Add ?include_archived=1 to list the archived completed tasks too.
         """
-        completed_tasks = Task.objects.filter(completed=True)
+        completed_tasks = self.sharded(Task.objects.filter(completed=True))
+        if self.include_archived():
+            completed_tasks = with_archived(completed_tasks, self.sharded(ArchivedTask.objects.filter(completed=True)))
         serializer = self.get_serializer(completed_tasks, many=True)
         return Response(serializer.data)
     
@@ -340,7 +477,7 @@ class TaskViewSet(viewsets.ModelViewSet):
         ------------
         Similar to completed_tasks, but filters for non-completed tasks.
         """
-        pending_tasks = Task.objects.filter(completed=False)
+        pending_tasks = self.sharded(Task.objects.filter(completed=False))
         serializer = self.get_serializer(pending_tasks, many=True)
         return Response(serializer.data)
     
@@ -356,10 +493,97 @@ class TaskViewSet(viewsets.ModelViewSet):
         Similar to the other custom endpoints, but filters for tasks
         where assigned_to is None (meaning no person is assigned).
         """
-        unassigned_tasks = Task.objects.filter(assigned_to=None)
+        unassigned_tasks = self.sharded(Task.objects.filter(assigned_to=None))
         serializer = self.get_serializer(unassigned_tasks, many=True)
         return Response(serializer.data)
     
+    # Default and maximum number of tasks returned by next_up and overdue
+    top_k_default = 10
+    top_k_max = 100
+    
+    def get_top_k_params(self):
+        """
+        Read `?limit=` and `?assigned_to=` for the next_up and overdue actions.
+        """
+        params = self.request.query_params
+        errors = {}
+        limit = self.top_k_default
+        if 'limit' in params:
+            try:
+                limit = int(params['limit'])
+            except ValueError:
+                limit = 0
+            if not 1 <= limit <= self.top_k_max:
+                errors['limit'] = [f'Must be an integer between 1 and {self.top_k_max}.']
+        assigned_to = params.get('assigned_to')
+        if assigned_to is not None:
+            try:
+                assigned_to = Person._meta.pk.to_python(assigned_to)
+            except ValidationError:
+                errors['assigned_to'] = ['Must be a person id.']
+        if errors:
+            raise DRFValidationError(errors)
+        return limit, assigned_to
+    
+    def top_k_response(self, queryset, limit):
+        # Each query reads the first `limit` entries of one of the partial
+        # indexes on Task (see Task.Meta.indexes)
+        tasks = self.sharded(queryset.select_related('assigned_to'))[:limit]
+        serializer = TaskListSerializer(tasks, many=True)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def next_up(self, request):
+        """
+        The open tasks to work on next: not completed, ordered by priority,
+        then due date.
+        
+        URL: /api/tasks/next_up/?limit=10&assigned_to=1
+        
+        EXPLANATION:
+        ------------
+        `limit` (default 10, at most 100) is how many tasks to return and
+        `assigned_to` restricts them to one person. The ordering matches the
+        default task ordering, with the id as a final tie breaker.
+        """
+        limit, assigned_to = self.get_top_k_params()
+        queryset = Task.objects.filter(completed=False)
+        if assigned_to is not None:
+            queryset = queryset.filter(assigned_to=assigned_to)
+        return self.top_k_response(
+            queryset.order_by('priority', 'due_date', 'created_at', 'id'), limit
+        )
+    
+    @action(detail=False, methods=['get'])
+    def overdue(self, request):
+        """
+        Open tasks past their due date, the most overdue first.
+        
+        URL: /api/tasks/overdue/?limit=10&assigned_to=1&within_days=3
+        
+        EXPLANATION:
+        ------------
+        Takes the same `limit` and `assigned_to` parameters as next_up.
+        With `within_days=N` the list also includes tasks due in the next
+        N days, i.e. overdue and due-soon tasks together.
+        """
+        limit, assigned_to = self.get_top_k_params()
+        try:
+            within_days = int(request.query_params.get('within_days', 0))
+        except ValueError:
+            within_days = -1
+        if not 0 <= within_days <= 365:
+            raise DRFValidationError({'within_days': ['Must be an integer between 0 and 365.']})
+        
+        # Overdue means due before today; due-soon runs through today + N days
+        cutoff = timezone.localdate()
+        if within_days:
+            cutoff += timedelta(days=within_days + 1)
+        queryset = Task.objects.filter(completed=False, due_date__lt=cutoff)
+        if assigned_to is not None:
+            queryset = queryset.filter(assigned_to=assigned_to)
+        return self.top_k_response(queryset.order_by('due_date', 'priority', 'id'), limit)
+    
     @action(detail=True, methods=['post'])
     def assign(self, request, pk=None):
         """
@@ -375,13 +599,14 @@ class TaskViewSet(viewsets.ModelViewSet):
         - methods=['post'] means it only responds to POST requests
         
         The method:
-        1. Gets the task object using self.get_object()
-        2. Gets the person_id from the request data
-        3. Validates the input and finds the person
-        4. Assigns the person to the task
-        5. Returns a success response
+        1. Gets the person_id (and optionally expected_assigned_to) from
+           the request data
+        2. Validates the input and finds the person
+        3. Assigns the person to the task with one conditional UPDATE
+           (see tasks/operations.py)
+        4. Returns a success response, or 409 Conflict if another request
+           changed the assignment first
         """
-        task = self.get_object()
         person_id = request.data.get('person_id')
         
         # Input validation - check if person_id was provided
@@ -391,18 +616,31 @@ class TaskViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Try to find the person in the database
+        # Find the person's id and name through the person cache
         try:
-            person = Person.objects.get(id=person_id)
-        except Person.DoesNotExist:
+            person = person_cache.get(Person._meta.pk.to_python(person_id))
+        except ValidationError:
+            person = None
+        if person is None:
             return Response(
                 {'error': f'Person with id {person_id} does not exist'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Update the task's assigned_to field and save to database
-        task.assigned_to = person
-        task.save()
+        # The foreign key constraint catches a person deleted by another
+        # process while still in this process's cache.
+        try:
+            assign(parse_task_id(pk), person.id, get_expected_assignee(request))
+        except Task.DoesNotExist:
+            raise Http404
+        except Conflict as e:
+            return conflict_response(e)
+        except IntegrityError:
+            person_cache.evict(person.id)
+            return Response(
+                {'error': f'Person with id {person_id} does not exist'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
         
         # Return a success response
         return Response(
@@ -423,29 +661,276 @@ class TaskViewSet(viewsets.ModelViewSet):
         Similar to the assign method, but removes assignment instead.
         
         The method:
-        1. Gets the task object using self.get_object()
+        1. Reads the current assignee, unless the request says which one it
+           expects (expected_assigned_to)
         2. Checks if the task is currently assigned
-        3. Removes the assignment by setting assigned_to to None
-        4. Returns a success response
+        3. Sets assigned_to to None, only if the assignee is still the same
+        4. Returns a success response, or 409 Conflict
         """
-        task = self.get_object()
+        expected = get_expected_assignee(request)
+        try:
+            task_id = parse_task_id(pk)
+            if expected is UNSET:
+                expected = read_fields(task_id, ['assigned_to'])[0]['assigned_to']
+            
+            # Check if the task is already unassigned
+            if expected is None:
+                return Response(
+                    {'error': 'Task is not assigned to anyone'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            previous_id = assign(task_id, None, expected)
+        except Task.DoesNotExist:
+            raise Http404
+        except Conflict as e:
+            return conflict_response(e)
         
-        # Check if the task is already unassigned
-        if not task.assigned_to:
+        # The previous assignee's name, for the response message
+        previous_assignee = person_cache.get(previous_id)
+        name = previous_assignee.name if previous_assignee else f'person {previous_id}'
+        
+        # Return a success response
+        return Response(
+            {'success': f'Task unassigned from {name}'},
+            status=status.HTTP_200_OK
+        )
+    
+    @action(detail=True, methods=['post'])
+    def transition(self, request, pk=None):
+        """
+        Move this task to another status.
+        
+        URL: /api/tasks/{id}/transition/
+        
+        EXPLANATION:
+        ------------
+        POST {"status": "completed"} (optionally with "expected_status", the
+        status the client last saw). The status, the completed flag and
+        updated_at are written together by one conditional UPDATE, so the
+        completed_tasks/pending_tasks lists and status filters always agree.
+        
+        Allowed moves are listed in tasks/operations.py (TRANSITIONS). A
+        task not in a status it may move from gets 409 Conflict with its
+        current status.
+        """
+        serializer = TransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        target = serializer.validated_data['status']
+        try:
+            transition_task(
+                parse_task_id(pk),
+                target,
+                serializer.validated_data.get('expected_status', UNSET),
+            )
+        except Task.DoesNotExist:
+            raise Http404
+        except InvalidTransition as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Conflict as e:
             return Response(
-                {'error': 'Task is not assigned to anyone'}, 
-                status=status.HTTP_400_BAD_REQUEST
+                {
+                    'error': f'A {e.current["status"]} task cannot become {target}.',
+                    'status': e.current['status'],
+                    'allowed': TRANSITIONS[e.current['status']],
+                },
+                status=status.HTTP_409_CONFLICT,
             )
+        return Response({'success': f'Task is now {target}', 'status': target})
+    
+    @action(detail=False, methods=['post'], url_path='transition', url_name='bulk-transition')
+    def bulk_transition(self, request):
+        """
+        Move many tasks to a status at once.
         
-        # Store the previous assignee's name for the response message
-        previous_assignee = task.assigned_to.name
-        
-        # Update the task to be unassigned and save to database
-        task.assigned_to = None
-        task.save()
+        URL: /api/tasks/transition/
         
-        # Return a success response
+        EXPLANATION:
+        ------------
+        POST {"ids": [1, 2, 3], "status": "completed"}. The tasks that may
+        move are updated by one UPDATE; the response counts them and lists
+        the ones that could not move ("conflicts", with their status) and
+        the ids that do not exist ("missing").
+        """
+        serializer = BulkTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = transition_many(serializer.validated_data['ids'], serializer.validated_data['status'])
+        return Response(result)
+
+
+def parse_task_id(value):
+    """
+    Convert a task id from the URL or request body, raising Task.DoesNotExist
+    (answered with 404) for malformed ones.
+    """
+    try:
+        return Task._meta.pk.to_python(value)
+    except ValidationError:
+        raise Task.DoesNotExist(f'Task with id {value} does not exist')
+
+
+def get_expected_assignee(request):
+    """
+    Return the `expected_assigned_to` of the request (null for "unassigned"),
+    or UNSET when the client sent none.
+    """
+    if 'expected_assigned_to' not in request.data:
+        return UNSET
+    value = request.data['expected_assigned_to']
+    if value in (None, ''):
+        return None
+    try:
+        return Person._meta.pk.to_python(value)
+    except ValidationError:
+        raise DRFValidationError({'expected_assigned_to': 'Expected a person id or null.'})
+
+
+def conflict_response(conflict):
+    return Response(
+        {
+            'error': 'The task was changed by another request; reload it and retry.',
+            'assigned_to': conflict.current.get('assigned_to'),
+        },
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+class JobViewSet(mixins.CreateModelMixin,
+                 mixins.ListModelMixin,
+                 mixins.RetrieveModelMixin,
+                 viewsets.GenericViewSet):
+    """
+    Submit background jobs and poll their status.
+
+    - POST /api/jobs/ with `{"kind": "...", "payload": {...}}` queues a job
+      and returns 202 Accepted with its URL in the Location header.
+    - GET /api/jobs/{id}/ shows its status (queued, running, succeeded,
+      failed), attempts and result.
+
+    The jobs are run by `python manage.py run_worker` (see tasks/jobs.py).
+    Users see their own jobs; staff users see every job.
+    """
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['kind', 'status']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if getattr(self, 'swagger_fake_view', False):
+            # Schema generation, without a request
+            return queryset
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(created_by=self.request.user)
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = enqueue(
+            serializer.validated_data['kind'],
+            serializer.validated_data.get('payload'),
+            user=request.user,
+        )
+        location = reverse('job-detail', args=[job.pk], request=request)
         return Response(
-            {'success': f'Task unassigned from {previous_assignee}'},
-            status=status.HTTP_200_OK
+            self.get_serializer(job).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': location},
+        )
+
+
+class AuthTokenView(ObtainAuthToken):
+    """
+    Issue and revoke API tokens.
+
+    URL: /api/auth/token/
+
+    - POST with `username` and `password` returns `{"token": "..."}`. The
+      password is checked once here; afterwards send the token in the
+      `Authorization: Token <key>` header on every request.
+    - DELETE (authenticated) revokes the caller's token.
+    """
+    def get_permissions(self):
+        if self.request.method == 'DELETE':
+            return [IsAuthenticated()]
+        return super().get_permissions()
+
+    def delete(self, request, *args, **kwargs):
+        # Deleting the row also evicts it from the token cache (tasks/signals.py)
+        Token.objects.filter(user=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class BatchView(APIView):
+    """
+    Run several API calls in one round trip.
+
+    URL: /api/batch/
+
+    POST `{"requests": [{"method": "GET", "url": "/api/persons/1/"}, ...]}`
+    returns `{"committed": true, "responses": [{"status", "headers", "body"},
+    ...]}`, one response per request and in the same order.
+
+    - Reads can run concurrently with `"concurrent": true`.
+    - A batch with writes runs in order in one transaction, rolled back if
+      any request fails (see tasks/batch.py).
+
+    The batch itself needs no permission: every request in it is checked by
+    its own view, as the user who sent the batch.
+    """
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        serializer = BatchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        responses, committed = run_batch(
+            request,
+            serializer.validated_data['requests'],
+            concurrent=serializer.validated_data['concurrent'],
         )
+        return Response({'committed': committed, 'responses': responses})
+
+
+class QueryView(APIView):
+    """
+    Fetch persons and tasks with exactly the fields and nested relations
+    the client names.
+
+    URL: /api/query/
+
+    POST `{"persons": {"fields": ["id", "name"], "include": {"assigned_tasks":
+    {"fields": ["id", "title"]}}}}` returns `{"persons": [{"id": 1, "name":
+    "...", "assigned_tasks": [...]}, ...]}`.
+
+    Each relation level is read with one query, however many rows the level
+    above has (see tasks/query.py). Too deep or too costly selections get
+    400 before anything is read. POST is used for the selection body only;
+    nothing is written, so no authentication is needed, and the request is
+    throttled and load-shed like a list (see tasks/throttling.py).
+    """
+    permission_classes = [AllowAny]
+    read_only = True
+
+    def post(self, request):
+        return Response(run_query(request.data))
+
+
+@require_safe
+def metrics_view(request):
+    """
+    Request metrics of every worker process, in the Prometheus text format.
+
+    URL: /metrics
+
+    EXPLANATION:
+    ------------
+    A plain Django view rather than a REST framework one: Prometheus scrapes
+    it every few seconds and needs no authentication, throttling or content
+    negotiation. The numbers come from MetricsMiddleware (see
+    tasks/metrics.py).
+    """
+    if not get_metrics_options()['ENABLED']:
+        raise Http404
+    return HttpResponse(exposition(collect()), content_type=METRICS_CONTENT_TYPE)
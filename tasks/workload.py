@@ -0,0 +1,212 @@
+"""
+Per-person workload, materialized in the `PersonWorkload` table.
+
+For each person the table keeps the number of open (not completed) tasks,
+how many of those are overdue, and the open tasks per priority. The
+`/api/persons/workload/` endpoint groups these rows by department, so a
+dashboard refresh reads one small table instead of aggregating the whole
+Task table.
+
+Rows are kept fresh incrementally: saving or deleting a task marks the rows
+of its old and new assignee as changed (one UPDATE, see tasks/signals.py),
+and the next read recomputes only the changed rows from the assignee's
+tasks. Overdue counts also go stale when the date changes, so a row
+refreshed before today is recomputed too. `manage.py refresh_workload`
+recomputes every row, e.g. from a nightly cron job.
+
+Changes made with `QuerySet.update()` or `bulk_create()` send no signals;
+they show up after the next full refresh.
+
+Settings (all optional):
+
+    WORKLOAD = {
+        # Recompute changed rows when the endpoint is read, on the primary
+        # database even for a GET that would otherwise read from a replica.
+        # With False the endpoint serves the rows as they are (flagged
+        # "stale"), from a replica if there is one, and only
+        # refresh_workload updates them.
+        'REFRESH_ON_READ': True,
+    }
+"""
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import sharding
+from .models import Person, PersonWorkload, Task
+from .routers import replica_reads
+
+UPDATE_FIELDS = ['open_tasks', 'overdue_tasks', 'priority_counts', 'refreshed_at']
+
+
+def get_options():
+    options = {'REFRESH_ON_READ': True}
+    options.update(getattr(settings, 'WORKLOAD', {}))
+    return options
+
+
+def compute_workload(person_ids=None, today=None):
+    """
+    Aggregate the open tasks of `person_ids` (every assignee if None) from
+    the Task table. Returns {person_id: {'open_tasks', 'overdue_tasks',
+    'priority_counts'}}; persons without open tasks are left out.
+    """
+    today = today or timezone.localdate()
+    workload = {}
+    for queryset in sharding.per_shard(Task.objects.order_by()):
+        queryset = queryset.filter(completed=False, assigned_to__isnull=False)
+        if person_ids is not None:
+            queryset = queryset.filter(assigned_to__in=person_ids)
+        rows = queryset.values('assigned_to', 'priority').annotate(
+            count=Count('id'),
+            overdue=Count('id', filter=Q(due_date__lt=today)),
+        )
+        for row in rows:
+            entry = workload.setdefault(
+                row['assigned_to'], {'open_tasks': 0, 'overdue_tasks': 0, 'priority_counts': {}}
+            )
+            entry['open_tasks'] += row['count']
+            entry['overdue_tasks'] += row['overdue']
+            priority = str(row['priority'])
+            entry['priority_counts'][priority] = entry['priority_counts'].get(priority, 0) + row['count']
+    return workload
+
+
+def refresh_workload(person_ids=None):
+    """
+    Recompute the rows of `person_ids` (every person if None) and return
+    how many rows were written.
+    """
+    # Taken before the aggregate: a task changed while it runs leaves the
+    # row stale rather than wrongly fresh
+    now = timezone.now()
+    workload = compute_workload(person_ids, today=timezone.localdate(now))
+    if person_ids is None:
+        person_ids = list(Person.objects.values_list('id', flat=True))
+    empty = {'open_tasks': 0, 'overdue_tasks': 0, 'priority_counts': {}}
+    rows = [
+        PersonWorkload(person_id=person_id, refreshed_at=now, **workload.get(person_id, empty))
+        for person_id in person_ids
+    ]
+    PersonWorkload.objects.bulk_create(
+        rows,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['person'],
+        update_fields=UPDATE_FIELDS,
+    )
+    return len(rows)
+
+
+def start_of_today():
+    return timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+
+
+def is_stale(row):
+    """
+    True if `row` changed since it was computed, or was computed before
+    today (so its overdue count may be off).
+    """
+    return (
+        (row.changed_at is not None and row.changed_at >= row.refreshed_at)
+        or row.refreshed_at < start_of_today()
+    )
+
+
+def stale_person_ids():
+    """
+    Return the ids of persons whose row is missing or stale (see `is_stale`).
+    """
+    stale = PersonWorkload.objects.filter(
+        Q(changed_at__gte=F('refreshed_at')) | Q(refreshed_at__lt=start_of_today())
+    ).values_list('person_id', flat=True)
+    missing = Person.objects.filter(workload__isnull=True).values_list('id', flat=True)
+    return set(stale) | set(missing)
+
+
+def refresh_stale():
+    """
+    Recompute the stale rows only. Returns how many were recomputed.
+    """
+    person_ids = stale_person_ids()
+    return refresh_workload(sorted(person_ids)) if person_ids else 0
+
+
+def mark_changed(*person_ids):
+    """
+    Flag the rows of these persons as changed. None ids are ignored.
+    """
+    person_ids = {person_id for person_id in person_ids if person_id is not None}
+    if person_ids:
+        PersonWorkload.objects.filter(person_id__in=person_ids).update(changed_at=timezone.now())
+
+
+def mark_tasks_changed(task_ids):
+    """
+    Flag the rows of the assignees of these tasks as changed, for updates
+    made without signals. Without sharding this is one UPDATE.
+    """
+    if sharding.sharding_enabled():
+        person_ids = set()
+        for queryset in sharding.per_shard(Task.objects.filter(pk__in=task_ids)):
+            person_ids.update(queryset.values_list('assigned_to', flat=True))
+        mark_changed(*person_ids)
+        return
+    assignees = Task.objects.filter(pk__in=task_ids, assigned_to__isnull=False).values('assigned_to')
+    PersonWorkload.objects.filter(person_id__in=assignees).update(changed_at=timezone.now())
+
+
+def workload_summary(department=None):
+    """
+    Return the workload grouped by department, with freshness metadata.
+    """
+    if not get_options()['REFRESH_ON_READ']:
+        return summarize(department, refreshed=0)
+    # The refresh aggregates tasks and writes rows, which a replica may not
+    # have yet: read them, and the refreshed rows, from the primary
+    with replica_reads(False):
+        return summarize(department, refreshed=refresh_stale())
+
+
+def summarize(department, refreshed):
+    rows = (
+        PersonWorkload.objects.filter(person__deleted_at__isnull=True)
+        .select_related('person').order_by('person__department', 'person__name')
+    )
+    if department is not None:
+        rows = rows.filter(person__department=department)
+
+    departments = {}
+    oldest_refresh = None
+    for row in rows:
+        group = departments.setdefault(row.person.department, {
+            'department': row.person.department,
+            'open_tasks': 0,
+            'overdue_tasks': 0,
+            'priority_counts': {},
+            'persons': [],
+        })
+        group['open_tasks'] += row.open_tasks
+        group['overdue_tasks'] += row.overdue_tasks
+        for priority, count in row.priority_counts.items():
+            group['priority_counts'][priority] = group['priority_counts'].get(priority, 0) + count
+        group['persons'].append({
+            'id': row.person_id,
+            'name': row.person.name,
+            'open_tasks': row.open_tasks,
+            'overdue_tasks': row.overdue_tasks,
+            'priority_counts': row.priority_counts,
+            'refreshed_at': row.refreshed_at,
+            'stale': is_stale(row),
+        })
+        if oldest_refresh is None or row.refreshed_at < oldest_refresh:
+            oldest_refresh = row.refreshed_at
+
+    return {
+        'as_of': timezone.now(),
+        'oldest_refresh': oldest_refresh,
+        'refreshed_rows': refreshed,
+        'departments': list(departments.values()),
+    }